@@ -1,8 +1,24 @@
 import subprocess
 import os
-from datetime import datetime
+import argparse
+import gzip
+import io
+import json
+import queue
+import threading
+import time
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import mysql.connector
 from config import Config
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz', 'none': ''}
+
 def backup_v1_database():
     """Create a backup of V1 database"""
     config = Config()
@@ -44,5 +60,380 @@ def backup_v1_database():
     
     return True
 
+def get_compression(config):
+    """Configured compression, falling back to gzip when zstandard is not installed"""
+    compression = config.BACKUP_COMPRESSION
+    if compression == 'zstd' and zstandard is None:
+        print("⚠ zstandard not installed - using gzip")
+        compression = 'gzip'
+    return compression
+
+def open_compressed(path, mode, compression):
+    """Open a text stream through the given compressor"""
+    if compression == 'zstd':
+        if 'w' in mode:
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8')
+
+def sql_literal(value):
+    """Render a Python value from the connector as a MySQL literal"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return f"X'{bytes(value).hex()}'" if value else "''"
+    if isinstance(value, (datetime, date, timedelta)):
+        return f"'{value}'"
+    if isinstance(value, set):
+        value = ','.join(sorted(value))
+    escaped = (str(value).replace('\\', '\\\\').replace("'", "\\'").replace('\0', '\\0')
+               .replace('\n', '\\n').replace('\r', '\\r').replace('\x1a', '\\Z'))
+    return f"'{escaped}'"
+
+def plan_chunks(conn, database, chunk_rows):
+    """Split every base table into primary-key ranges (mydumper style); tables without a single integer PK are one chunk.
+    
+    Run on a snapshot connection so the ranges match the data being dumped. The
+    last range of a table is open-ended ([start, None]) so no row above the
+    planned maximum can fall outside every chunk. Each chunk lists the table's
+    stored columns: generated columns cannot be inserted and are recomputed on restore.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %s
+          AND EXTRA NOT LIKE '%%VIRTUAL GENERATED%%' AND EXTRA NOT LIKE '%%STORED GENERATED%%'
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """, (database,))
+    columns = {}
+    for table, column in cursor.fetchall():
+        columns.setdefault(table, []).append(column)
+    
+    cursor.execute("""
+        SELECT t.TABLE_NAME, GROUP_CONCAT(c.COLUMN_NAME), MAX(c.DATA_TYPE), COUNT(c.COLUMN_NAME)
+        FROM information_schema.TABLES t
+        LEFT JOIN information_schema.COLUMNS c
+          ON c.TABLE_SCHEMA = t.TABLE_SCHEMA AND c.TABLE_NAME = t.TABLE_NAME AND c.COLUMN_KEY = 'PRI'
+        WHERE t.TABLE_SCHEMA = %s AND t.TABLE_TYPE = 'BASE TABLE'
+        GROUP BY t.TABLE_NAME
+        ORDER BY t.TABLE_NAME
+    """, (database,))
+    tables = cursor.fetchall()
+    
+    chunks = []
+    for table, pk, pk_type, pk_count in tables:
+        if pk_count != 1 or pk_type not in ('tinyint', 'smallint', 'mediumint', 'int', 'bigint'):
+            chunks.append({'table': table, 'columns': columns[table], 'key': None, 'range': None})
+            continue
+        cursor.execute(f"SELECT MIN(`{pk}`), MAX(`{pk}`) FROM `{table}`")
+        low, high = cursor.fetchone()
+        if low is None:
+            chunks.append({'table': table, 'columns': columns[table], 'key': pk, 'range': None})
+            continue
+        for start in range(low, high + 1, chunk_rows):
+            end = start + chunk_rows - 1
+            chunks.append({'table': table, 'columns': columns[table], 'key': pk,
+                           'range': [start, end if end < high else None]})
+    cursor.close()
+    return chunks
+
+def dump_chunk(conn, chunk, path, compression, rows_per_insert):
+    """Write one chunk as multi-row INSERT statements, one statement per line"""
+    table = chunk['table']
+    columns = ', '.join(f"`{col}`" for col in chunk['columns'])
+    query = f"SELECT {columns} FROM `{table}`"
+    params = ()
+    if chunk['range'] and chunk['range'][1] is None:
+        query += f" WHERE `{chunk['key']}` >= %s"
+        params = (chunk['range'][0],)
+    elif chunk['range']:
+        query += f" WHERE `{chunk['key']}` BETWEEN %s AND %s"
+        params = tuple(chunk['range'])
+    
+    cursor = conn.cursor(raw=False)
+    cursor.execute(query, params)
+    rows = 0
+    with open_compressed(path, 'w', compression) as f:
+        while True:
+            batch = cursor.fetchmany(rows_per_insert)
+            if not batch:
+                break
+            values = ','.join(f"({','.join(sql_literal(v) for v in row)})" for row in batch)
+            f.write(f"INSERT INTO `{table}` ({columns}) VALUES {values};\n")
+            rows += len(batch)
+    cursor.close()
+    return rows
+
+def run_mysqldump(config, options, path, compression):
+    """Run mysqldump on the V1 database with the given options, streamed through the compressor"""
+    cmd = [
+        'mysqldump',
+        '-h', config.V1_CONFIG['host'],
+        '-P', str(config.V1_CONFIG['port']),
+        '-u', config.V1_CONFIG['user'],
+        f'-p{config.V1_CONFIG["password"]}',
+        *options,
+        config.V1_CONFIG['database']
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    with open_compressed(path, 'w', compression) as f:
+        for line in process.stdout:
+            f.write(line)
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, f"mysqldump {' '.join(options)}")
+
+def dump_schema(config, path, compression):
+    """Dump table definitions and routines without triggers, which must only exist once the data is loaded"""
+    run_mysqldump(config, ['--no-data', '--routines', '--skip-triggers'], path, compression)
+
+def dump_triggers(config, path, compression):
+    """Dump only the trigger definitions, applied after every chunk has been restored"""
+    run_mysqldump(config, ['--no-data', '--no-create-info', '--no-create-db', '--skip-routines', '--triggers'],
+                  path, compression)
+
+def open_snapshot_connections(config, workers):
+    """Open worker connections that all see the same consistent snapshot.
+    
+    A global read lock is held only while every worker starts its
+    consistent-snapshot transaction; the binlog position is read under the lock.
+    Without the RELOAD privilege the lock is not possible and a single worker is
+    used, which is still consistent.
+    """
+    lock_conn = mysql.connector.connect(**config.V1_CONFIG)
+    lock_cursor = lock_conn.cursor(dictionary=True)
+    binlog = None
+    try:
+        lock_cursor.execute("FLUSH TABLES WITH READ LOCK")
+        locked = True
+    except mysql.connector.Error as e:
+        print(f"⚠ FLUSH TABLES WITH READ LOCK not permitted ({e}) - dumping with one worker")
+        locked = False
+        workers = 1
+    
+    connections = []
+    try:
+        for _ in range(workers):
+            conn = mysql.connector.connect(**{**config.V1_CONFIG, 'raise_on_warnings': False})
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            cursor.close()
+            connections.append(conn)
+        if locked:
+            for statement in ("SHOW BINARY LOG STATUS", "SHOW MASTER STATUS"):
+                try:
+                    lock_cursor.execute(statement)
+                    status = lock_cursor.fetchone()
+                    if status:
+                        binlog = {'file': status['File'], 'position': status['Position']}
+                    break
+                except mysql.connector.Error:
+                    continue
+    finally:
+        if locked:
+            lock_cursor.execute("UNLOCK TABLES")
+        lock_cursor.close()
+        lock_conn.close()
+    return connections, binlog
+
+def run_workers(connections, tasks, handler):
+    """Run handler(conn, task) over a task queue with one thread per connection; return results and errors"""
+    task_queue = queue.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def worker(conn):
+        while True:
+            try:
+                task = task_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = handler(conn, task)
+                with lock:
+                    results.append(result)
+                    print(f"  {len(results)}/{len(tasks)} chunks done", end='\r')
+            except Exception as e:
+                with lock:
+                    errors.append((task, e))
+    
+    threads = [threading.Thread(target=worker, args=(conn,)) for conn in connections]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print()
+    return results, errors
+
+def parallel_backup_v1_database(workers=None):
+    """Dump V1 in parallel PK-range chunks from one consistent snapshot into compressed per-chunk files"""
+    config = Config()
+    workers = workers or config.BACKUP_WORKERS
+    compression = get_compression(config)
+    extension = COMPRESSION_EXTENSIONS[compression]
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_dir = f"backup/v1_parallel_{timestamp}"
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.monotonic()
+    
+    print(f"Creating parallel backup of V1 database ({workers} workers, {compression})...")
+    
+    try:
+        schema_file = f"schema.sql{extension}"
+        triggers_file = f"triggers.sql{extension}"
+        dump_schema(config, os.path.join(backup_dir, schema_file), compression)
+        dump_triggers(config, os.path.join(backup_dir, triggers_file), compression)
+        
+        connections, binlog = open_snapshot_connections(config, workers)
+        # Plan inside the snapshot so MIN/MAX see exactly the rows the workers will dump
+        try:
+            chunks = plan_chunks(connections[0], config.V1_DATABASE, config.BACKUP_CHUNK_ROWS)
+        except mysql.connector.Error:
+            for conn in connections:
+                conn.close()
+            raise
+        for number, chunk in enumerate(chunks):
+            chunk['file'] = f"{chunk['table']}.{number:05d}.sql{extension}"
+
+        def handle(conn, chunk):
+            path = os.path.join(backup_dir, chunk['file'])
+            return {**chunk, 'rows': dump_chunk(conn, chunk, path, compression, config.BATCH_SIZE),
+                    'bytes': os.path.getsize(path)}
+        
+        try:
+            results, errors = run_workers(connections, chunks, handle)
+        finally:
+            for conn in connections:
+                conn.close()
+        
+        if errors:
+            for chunk, e in errors:
+                print(f"✗ {chunk['file']}: {e}")
+            print(f"✗ Backup failed: {len(errors)} chunk(s) could not be dumped")
+            return False
+        
+        manifest = {
+            'database': config.V1_DATABASE,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'compression': compression,
+            'binlog': binlog,
+            'schema_file': schema_file,
+            'triggers_file': triggers_file,
+            'chunks': sorted(results, key=lambda chunk: chunk['file'])
+        }
+        with open(os.path.join(backup_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        
+        size = sum(chunk['bytes'] for chunk in results) / (1024 * 1024)
+        print(f"✓ Backup created successfully!")
+        print(f"  Directory: {backup_dir}")
+        print(f"  Chunks: {len(results)} ({sum(chunk['rows'] for chunk in results)} rows)")
+        print(f"  Size: {size:.2f} MB in {time.monotonic() - started:.1f}s")
+    
+    except (subprocess.CalledProcessError, mysql.connector.Error) as e:
+        print(f"✗ Backup failed: {e}")
+        return False
+    
+    return True
+
+def apply_sql_file(config, database, path, compression, label):
+    """Pipe a (compressed) SQL file through the mysql client"""
+    cmd = [
+        'mysql',
+        '-h', config.V1_CONFIG['host'],
+        '-P', str(config.V1_CONFIG['port']),
+        '-u', config.V1_CONFIG['user'],
+        f'-p{config.V1_CONFIG["password"]}',
+        database
+    ]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, text=True)
+    with open_compressed(path, 'r', compression) as f:
+        for line in f:
+            process.stdin.write(line)
+    process.stdin.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, f"mysql ({label})")
+
+def restore_parallel_backup(backup_dir, database=None, workers=None):
+    """Restore a parallel backup: schema first, then the chunk files concurrently, then the triggers.
+    
+    Triggers are created only after every chunk is loaded so they do not fire
+    on (and rewrite or reject) the restored rows.
+    """
+    config = Config()
+    workers = workers or config.BACKUP_WORKERS
+    with open(os.path.join(backup_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    database = database or manifest['database']
+    compression = manifest['compression']
+    
+    print(f"Restoring {backup_dir} into {database} ({workers} workers)...")
+    
+    try:
+        apply_sql_file(config, database, os.path.join(backup_dir, manifest['schema_file']), compression, 'schema')
+        
+        connections = []
+        for _ in range(workers):
+            conn = mysql.connector.connect(**{**config.V1_CONFIG, 'database': database, 'raise_on_warnings': False})
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+            cursor.close()
+            connections.append(conn)
+
+        def handle(conn, chunk):
+            cursor = conn.cursor()
+            with open_compressed(os.path.join(backup_dir, chunk['file']), 'r', compression) as f:
+                for statement in f:
+                    cursor.execute(statement)
+            conn.commit()
+            cursor.close()
+            return chunk
+        
+        try:
+            results, errors = run_workers(connections, manifest['chunks'], handle)
+        finally:
+            for conn in connections:
+                conn.close()
+        
+        if errors:
+            for chunk, e in errors:
+                print(f"✗ {chunk['file']}: {e}")
+            print(f"✗ Restore incomplete: {len(errors)} chunk(s) failed - triggers not created")
+            return False
+        
+        if manifest.get('triggers_file'):
+            apply_sql_file(config, database, os.path.join(backup_dir, manifest['triggers_file']), compression, 'triggers')
+        
+        print(f"✓ Restored {len(results)} chunks into {database}")
+    
+    except (subprocess.CalledProcessError, mysql.connector.Error) as e:
+        print(f"✗ Restore failed: {e}")
+        return False
+    
+    return True
+
 if __name__ == "__main__":
-    backup_v1_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Back up (or restore) the V1 database")
+    parser.add_argument('--parallel', action='store_true', help="parallel chunked backup with compression and a manifest")
+    parser.add_argument('--restore', metavar='DIR', help="restore a parallel backup directory")
+    parser.add_argument('--database', help="target database for --restore (default: the backed-up database)")
+    parser.add_argument('--workers', type=int, help="worker connections (default: BACKUP_WORKERS)")
+    args = parser.parse_args()
+    
+    if args.restore:
+        restore_parallel_backup(args.restore, args.database, args.workers)
+    elif args.parallel:
+        parallel_backup_v1_database(args.workers)
+    else:
+        backup_v1_database()
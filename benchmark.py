@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Benchmark harness for the V1 fetch -> transform -> write-parameter path.
+
+Each row representation runs in its own subprocess so that peak RSS is measured
+independently. No database connection is needed; rows are synthetic.
+
+    python benchmark.py --rows 200000
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from config import Config
+from migration import MagiyaMigration
+from schema_cache import make_row_type
+
+V1_USER_COLUMNS = [
+    'id', 'firstname', 'lastname', 'username', 'email', 'country_code', 'mobile', 'ref_by',
+    'balance', 'password', 'image', 'address', 'status', 'kyc_data', 'kv', 'ev', 'sv', 'reg_step',
+    'ver_code', 'ver_code_send_at', 'ts', 'tv', 'tsc', 'ban_reason', 'remember_token', 'gender',
+    'city_id', 'rfid_key', 'public', 'created_at', 'updated_at'
+]
+
+def make_v1_values(i):
+    """Synthetic V1 user row in V1_USER_COLUMNS order"""
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    return (
+        i, f"First{i}", f"Last{i}", f"user{i}", f"user{i}@example.com", '94', f"07{i % 100000000:08d}", None,
+        i * 1.25, 'x' * 60, None, json.dumps({'address': f"{i} Main Street", 'city': 'Colombo', 'zip': '00100',
+                                             'state': 'Western', 'country': 'Sri Lanka'}),
+        1, None, 1, i % 2, 1, 0,
+        '123456', now, 0, 1, None, None, None, 'M' if i % 2 else 'F',
+        i % 50, None, 0, now, now
+    )
+
+def run_mode(mode, rows, batch_size):
+    """Run the transform path for one row representation and return its measurements"""
+    os.makedirs('logs', exist_ok=True)
+    migration = MagiyaMigration(Config())
+    migration.compact_rows = mode == 'compact'
+    migration.preserve_ids = True
+    row_type = make_row_type('users_row', V1_USER_COLUMNS)
+    
+    gc_time = [0.0]
+    gc_started = [0.0]
+    
+    def gc_callback(phase, info):
+        if phase == 'start':
+            gc_started[0] = time.perf_counter()
+        else:
+            gc_time[0] += time.perf_counter() - gc_started[0]
+    
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    gc.callbacks.append(gc_callback)
+    start = time.perf_counter()
+    
+    for batch_start in range(0, rows, batch_size):
+        raw_rows = [make_v1_values(i) for i in range(batch_start + 1, min(batch_start + batch_size, rows) + 1)]
+        if migration.compact_rows:
+            records = [row_type._make(values) for values in raw_rows]
+        else:
+            records = [dict(zip(V1_USER_COLUMNS, values)) for values in raw_rows]
+        del raw_rows
+        
+        # The write parameters for the whole batch are alive at the same time, as in migrate_batch
+        params = [migration.transform_user_record(record) for record in records]
+        del records, params
+    
+    elapsed = time.perf_counter() - start
+    gc.callbacks.remove(gc_callback)
+    migration.close_connections()
+    
+    return {
+        'mode': mode,
+        'rows': rows,
+        'batch_size': batch_size,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed),
+        'gc_seconds': round(gc_time[0], 3),
+        'peak_rss_delta_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dict vs compact V1 row representation')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=Config.BATCH_SIZE)
+    parser.add_argument('--mode', choices=['dict', 'compact'], help='run a single mode in this process')
+    args = parser.parse_args()
+    
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.rows, args.batch_size)))
+        return
+    
+    results = []
+    for mode in ['dict', 'compact']:
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--rows', str(args.rows), '--batch-size', str(args.batch_size)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    
+    print(f"{'mode':<10}{'rows/s':>12}{'elapsed s':>12}{'gc s':>10}{'peak RSS +MB':>15}")
+    for result in results:
+        print(f"{result['mode']:<10}{result['rows_per_second']:>12}{result['elapsed_seconds']:>12}"
+              f"{result['gc_seconds']:>10}{result['peak_rss_delta_mb']:>15}")
+
+if __name__ == "__main__":
+    main()
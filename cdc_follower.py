@@ -0,0 +1,227 @@
+import json
+import os
+import time
+from colorama import init, Fore
+from delta_sync import DeltaSync
+
+try:
+    from pymysqlreplication import BinLogStreamReader
+    from pymysqlreplication.event import XidEvent, HeartbeatLogEvent
+    from pymysqlreplication.row_event import WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+except ImportError:
+    BinLogStreamReader = None
+
+init(autoreset=True)
+
+class BinlogFollower(DeltaSync):
+    """Tail the V1 binlog and apply user/address row changes to V2 in micro-batches"""
+    
+    def __init__(self, config):
+        super().__init__(config)
+        self.position_file = config.CDC_STATE_FILE
+        self.position = self.load_position()
+        self.pending_upserts = {'users': {}, 'addresses': {}}
+        self.pending_deletes = {'users': set(), 'addresses': set()}
+        self.last_flush = time.monotonic()
+        self.stats['cdc'] = {
+            'events_received': 0,
+            'rows_upserted': 0,
+            'rows_deleted': 0,
+            'deletes_skipped': 0,
+            'batches_applied': 0,
+            'replication_lag_seconds': 0,
+            'log_file': self.position.get('log_file'),
+            'log_pos': self.position.get('log_pos')
+        }
+    
+    def load_position(self):
+        """Load the last applied binlog position"""
+        if not os.path.exists(self.position_file):
+            return {}
+        with open(self.position_file) as f:
+            return json.load(f)
+    
+    def save_position(self, log_file, log_pos):
+        """Persist the binlog position of the last applied transaction"""
+        self.position = {'log_file': log_file, 'log_pos': log_pos}
+        tmp_file = f"{self.position_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.position, f, indent=2)
+        os.replace(tmp_file, self.position_file)
+        self.stats['cdc']['log_file'], self.stats['cdc']['log_pos'] = log_file, log_pos
+    
+    def get_current_binlog_position(self):
+        """Read the current V1 binlog coordinates (used when no position is saved yet)"""
+        v1_cursor = self.v1_conn.cursor(dictionary=True)
+        try:
+            v1_cursor.execute("SHOW MASTER STATUS")
+            status = v1_cursor.fetchone()
+            if not status:
+                raise RuntimeError("Binary logging is not enabled on V1 (SHOW MASTER STATUS returned nothing)")
+            return status['File'], status['Position']
+        finally:
+            v1_cursor.close()
+    
+    def build_stream(self, table_types):
+        """Create a binlog stream reader resuming at the saved position"""
+        source_tables = [self.get_table_names(table_type)[0] for table_type in table_types]
+        return BinLogStreamReader(
+            connection_settings={
+                'host': self.config.V1_CONFIG['host'],
+                'port': self.config.V1_CONFIG['port'],
+                'user': self.config.V1_CONFIG['user'],
+                'passwd': self.config.V1_CONFIG['password']
+            },
+            server_id=self.config.CDC_SERVER_ID,
+            only_events=[WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent, XidEvent, HeartbeatLogEvent],
+            only_schemas=[self.config.V1_DATABASE],
+            only_tables=source_tables,
+            log_file=self.position['log_file'],
+            log_pos=self.position['log_pos'],
+            resume_stream=True,
+            blocking=True,
+            slave_heartbeat=self.config.CDC_FLUSH_INTERVAL
+        )
+    
+    def queue_row_event(self, event, table_type):
+        """Fold a row event into the pending micro-batch, keeping only the latest image per id"""
+        for row in event.rows:
+            if isinstance(event, DeleteRowsEvent):
+                values = row['values']
+                deleted = True
+            else:
+                values = row['after_values'] if isinstance(event, UpdateRowsEvent) else row['values']
+                # status=0 users are never migrated, so deactivation behaves like a delete
+                deleted = table_type == 'users' and values.get('status') == 0
+            
+            row_id = values['id']
+            if deleted:
+                self.pending_upserts[table_type].pop(row_id, None)
+                self.pending_deletes[table_type].add(row_id)
+            else:
+                self.pending_deletes[table_type].discard(row_id)
+                self.pending_upserts[table_type][row_id] = values
+    
+    def queue_depths(self):
+        """Rows of the current micro-batch, exposed as a queue depth"""
+        return {'cdc_pending': self.pending_count()}
+    
+    def pending_count(self):
+        """Number of rows waiting in the current micro-batch"""
+        return sum(len(rows) for rows in self.pending_upserts.values()) + \
+               sum(len(ids) for ids in self.pending_deletes.values())
+    
+    def flush(self, table_types):
+        """Apply the pending micro-batch to V2 (parents before children)"""
+        for table_type in table_types:
+            deletes = sorted(self.pending_deletes[table_type])
+            if deletes and self.get_v2_key_column(table_type):
+                self.apply_deletes(table_type, deletes)
+                self.stats['cdc']['rows_deleted'] += len(deletes)
+            elif deletes:
+                # No V2 column holds the V1 key, so the V2 rows cannot be found
+                self.stats['cdc']['deletes_skipped'] += len(deletes)
+                self.logger.warning(f"Skipped {len(deletes)} {table_type} deletes without a V1 key in V2 "
+                                    f"(V1 ids: {', '.join(map(str, deletes))})")
+            
+            upserts = list(self.pending_upserts[table_type].values())
+            if upserts:
+                self.migrate_batch(upserts, table_type)
+                self.stats['cdc']['rows_upserted'] += len(upserts)
+            
+            self.pending_upserts[table_type] = {}
+            self.pending_deletes[table_type] = set()
+        
+        self.stats['cdc']['batches_applied'] += 1
+        self.last_flush = time.monotonic()
+    
+    def follow(self, table_types):
+        """Tail the binlog until interrupted"""
+        stream = self.build_stream(table_types)
+        table_lookup = {self.get_table_names(table_type)[0]: table_type for table_type in table_types}
+        committed_position = (self.position['log_file'], self.position['log_pos'])
+        
+        print(f"\n{Fore.CYAN}Following V1 binlog from {committed_position[0]}:{committed_position[1]} "
+              f"(Ctrl+C to stop)...")
+        
+        try:
+            for event in stream:
+                if isinstance(event, (WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent)):
+                    self.stats['cdc']['events_received'] += 1
+                    self.queue_row_event(event, table_lookup[event.table])
+                    continue
+                
+                if isinstance(event, XidEvent):
+                    # Only transaction boundaries are safe resume points
+                    committed_position = (stream.log_file, stream.log_pos)
+                    self.stats['cdc']['replication_lag_seconds'] = max(0, int(time.time()) - event.timestamp)
+                
+                due = time.monotonic() - self.last_flush >= self.config.CDC_FLUSH_INTERVAL
+                if self.pending_count() >= self.config.CDC_BATCH_SIZE or (due and self.pending_count()):
+                    self.flush(table_types)
+                    self.save_position(*committed_position)
+                    self.logger.info(
+                        f"CDC batch applied at {committed_position[0]}:{committed_position[1]} "
+                        f"(lag: {self.stats['cdc']['replication_lag_seconds']}s, "
+                        f"upserted: {self.stats['cdc']['rows_upserted']}, deleted: {self.stats['cdc']['rows_deleted']})"
+                    )
+                elif isinstance(event, HeartbeatLogEvent):
+                    # Idle stream: V1 has nothing newer for us
+                    self.stats['cdc']['replication_lag_seconds'] = 0
+        except KeyboardInterrupt:
+            print(f"\n{Fore.YELLOW}Stopping binlog follower...")
+        finally:
+            stream.close()
+        
+        # Rows queued after the last commit boundary are replayed on the next start
+        if self.pending_count():
+            self.flush(table_types)
+        self.save_position(*committed_position)
+    
+    def run(self):
+        """Start the binlog follower"""
+        if BinLogStreamReader is None:
+            print(f"{Fore.RED}✗ Binlog follower requires the mysql-replication package (pip install mysql-replication)")
+            return
+        
+        try:
+            if not self.connect_databases(): return
+            self.start_metrics_server()
+            if not self.select_tables_to_migrate():
+                print(f"{Fore.YELLOW}Binlog follower cancelled by user")
+                return
+            if not self.select_id_strategy(): return
+            if not self.preserve_ids:
+                # Update events are applied as upserts on the V2 id; with auto-increment IDs
+                # every updated row would be inserted again under a new id
+                print(f"{Fore.RED}✗ Binlog follower needs preserved IDs - run the initial migration with original IDs")
+                return
+            
+            table_types = []
+            if hasattr(self, 'migrate_users') and self.migrate_users:
+                table_types.append('users')
+            if self.migrate_addresses:
+                table_types.append('addresses')
+            
+            if not self.position:
+                log_file, log_pos = self.get_current_binlog_position()
+                print(f"{Fore.YELLOW}No saved binlog position - starting at current V1 position {log_file}:{log_pos}")
+                print(f"{Fore.YELLOW}  Run a full migration or delta sync first so V2 is caught up to this point")
+                self.save_position(log_file, log_pos)
+            
+            self.follow(table_types)
+            self.save_migration_report()
+            
+            print(f"\n{Fore.CYAN}Binlog Follower Summary:")
+            print(f"  Row events received: {self.stats['cdc']['events_received']}")
+            print(f"  Rows upserted: {Fore.GREEN}{self.stats['cdc']['rows_upserted']}")
+            print(f"  Rows deleted: {Fore.YELLOW}{self.stats['cdc']['rows_deleted']}")
+            if self.stats['cdc']['deletes_skipped']:
+                print(f"  Deletes skipped (no V1 key in V2): {Fore.RED}{self.stats['cdc']['deletes_skipped']}")
+            print(f"  Micro-batches applied: {self.stats['cdc']['batches_applied']}")
+            print(f"  Last position: {self.position['log_file']}:{self.position['log_pos']}")
+        except Exception as e:
+            self.logger.error(f"Binlog follower failed: {e}", exc_info=True)
+            print(f"{Fore.RED}✗ Binlog follower failed: {e}")
+        finally:
+            self.close_connections()
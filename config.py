@@ -37,10 +37,77 @@ class Config:
     V2_TABLE = os.getenv('V2_TABLE', 'users')
     V1_ADDRESS_TABLE = V1_ADDRESS_TABLE
     V2_ADDRESS_TABLE = V2_ADDRESS_TABLE
+    # SQL conditions a V1 row must meet to be read at all (empty = every row)
+    V1_USER_FILTER = os.getenv('V1_USER_FILTER', 'status IS NULL OR status != 0')
+    V1_ADDRESS_FILTER = os.getenv('V1_ADDRESS_FILTER', '')
     
     # Migration settings
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', 1000))
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    # Log file format: 'json' (one object per line) or 'text'
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    # Repeated per-row warnings: log the first N of each kind, then one summary line per interval
+    LOG_SAMPLE_LIMIT = int(os.getenv('LOG_SAMPLE_LIMIT', 5))
+    LOG_AGGREGATE_SECONDS = float(os.getenv('LOG_AGGREGATE_SECONDS', 60))
+    # Use tuple-backed rows and positional parameters instead of per-row dicts
+    COMPACT_ROWS = os.getenv('COMPACT_ROWS', 'true').lower() == 'true'
+    # Fail before migrating when a V1 column a table mapping reads is missing (otherwise it is migrated as NULL/default)
+    STRICT_SOURCE_COLUMNS = os.getenv('STRICT_SOURCE_COLUMNS', 'false').lower() == 'true'
+    # Profile the first N batches with cProfile (saved next to the log file, 0 disables it)
+    PROFILE_BATCHES = int(os.getenv('PROFILE_BATCHES', 0))
+    
+    # Tables migrated at the same time (each with its own connections, 1 = one after another)
+    PARALLEL_TABLES = int(os.getenv('PARALLEL_TABLES', 1))
+    # Hold child batches until the parent rows they reference are committed (off: only V2 foreign keys are waited for)
+    HOLD_CHILD_BATCHES = os.getenv('HOLD_CHILD_BATCHES', 'true').lower() == 'true'
+    # Python module with extra table mappings (get_mappings(config), see table_mappings.py)
+    TABLE_MAPPINGS_MODULE = os.getenv('TABLE_MAPPINGS_MODULE', '')
+    
+    # Metrics endpoint (Prometheus text format on /metrics, 0 disables it)
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+    METRICS_HOST = os.getenv('METRICS_HOST', '0.0.0.0')
+    
+    # Delta sync settings
+    DELTA_STATE_FILE = os.getenv('DELTA_STATE_FILE', 'logs/delta_watermarks.json')
+    DELTA_OVERLAP_SECONDS = int(os.getenv('DELTA_OVERLAP_SECONDS', 60))
+    DELTA_DELETE_CHUNK_SIZE = int(os.getenv('DELTA_DELETE_CHUNK_SIZE', 10000))
+    
+    # Binlog follower (CDC) settings
+    CDC_STATE_FILE = os.getenv('CDC_STATE_FILE', 'logs/cdc_position.json')
+    CDC_SERVER_ID = int(os.getenv('CDC_SERVER_ID', 4379))
+    CDC_BATCH_SIZE = int(os.getenv('CDC_BATCH_SIZE', 500))
+    CDC_FLUSH_INTERVAL = float(os.getenv('CDC_FLUSH_INTERVAL', 1.0))
+    
+    # Duplicate handling settings
+    DUPLICATE_POLICY = os.getenv('DUPLICATE_POLICY', 'keep_first')
+    DUPLICATE_SCAN_CHUNK_SIZE = int(os.getenv('DUPLICATE_SCAN_CHUNK_SIZE', 50000))
+    DEDUP_CHUNK_SIZE = int(os.getenv('DEDUP_CHUNK_SIZE', 1000))
+    DEDUP_THROTTLE_SECONDS = float(os.getenv('DEDUP_THROTTLE_SECONDS', 0.5))
+    # Replicas (host[:port], V1 credentials) whose lag pauses the chunked dedup
+    DEDUP_REPLICA_HOSTS = [h.strip() for h in os.getenv('DEDUP_REPLICA_HOSTS', '').split(',') if h.strip()]
+    DEDUP_MAX_REPLICA_LAG = int(os.getenv('DEDUP_MAX_REPLICA_LAG', 5))
+    # Give up when replicas stay behind for this many seconds
+    DEDUP_REPLICA_WAIT_SECONDS = int(os.getenv('DEDUP_REPLICA_WAIT_SECONDS', 600))
+    
+    # Rollback settings
+    ROLLBACK_CHUNK_SIZE = int(os.getenv('ROLLBACK_CHUNK_SIZE', 5000))
+    ROLLBACK_THROTTLE_SECONDS = float(os.getenv('ROLLBACK_THROTTLE_SECONDS', 0.1))
+    
+    # V2 snapshot settings
+    SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'logs/snapshots')
+    SNAPSHOT_CHUNK_SIZE = int(os.getenv('SNAPSHOT_CHUNK_SIZE', 10000))
+    
+    # Backup settings
+    BACKUP_WORKERS = int(os.getenv('BACKUP_WORKERS', 4))
+    BACKUP_CHUNK_ROWS = int(os.getenv('BACKUP_CHUNK_ROWS', 100000))
+    BACKUP_COMPRESSION = os.getenv('BACKUP_COMPRESSION', 'zstd')
+    
+    # Dry run settings (fraction of V1 to read, sample rows timed against temporary V2 tables)
+    DRY_RUN_FRACTION = float(os.getenv('DRY_RUN_FRACTION', 1.0))
+    DRY_RUN_PROBE_ROWS = int(os.getenv('DRY_RUN_PROBE_ROWS', 500))
+    
+    # Validation settings
+    CHECKSUM_CHUNK_SIZE = int(os.getenv('CHECKSUM_CHUNK_SIZE', 10000))
     
     # Default timestamp for verified emails
     DEFAULT_VERIFIED_TIMESTAMP = os.getenv('DEFAULT_VERIFIED_TIMESTAMP', 
@@ -49,4 +116,5 @@ class Config:
     # File paths
     LOG_FILE = f"logs/migration_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     BACKUP_FILE = f"backup/v1_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.sql"
+    MANIFEST_DIR = os.getenv('MANIFEST_DIR', 'logs/manifests')
     FAILED_RECORDS_FILE = f"logs/failed_records_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
\ No newline at end of file
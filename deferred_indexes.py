@@ -0,0 +1,85 @@
+from colorama import init, Fore
+from schema_cache import index_definition
+
+init(autoreset=True)
+
+class DeferredIndexBuild:
+    """Drop a table's secondary indexes for a bulk load and rebuild them in one ALTER afterwards.
+
+    Unique indexes are dropped too, so duplicates are no longer rejected row by
+    row; find_duplicates() locates them after the load so they can be removed
+    (keeping the first inserted row, as the per-row path did) before the unique
+    indexes are recreated. Indexes that back a foreign key, or lead with one of
+    keep_columns (the id-map column child batches look parents up by), stay in place.
+    """
+
+    def __init__(self, conn, schema, table, logger, indexes=None, keep_columns=()):
+        self.conn = conn
+        self.schema = schema
+        self.table = table
+        self.logger = logger
+        self.indexes = indexes
+        self.keep_columns = set(keep_columns)
+
+    def droppable_indexes(self):
+        """Secondary indexes that can be dropped (not needed by a foreign key or a kept column)"""
+        fk_columns = {fk['columns'][0] for fk in self.schema.get_foreign_keys(self.table)} | self.keep_columns
+        return [index for index in self.schema.get_indexes(self.table)
+                if not index['columns'] or index['columns'][0] not in fk_columns]
+
+    def drop(self):
+        """Drop the secondary indexes and remember their definitions"""
+        if self.indexes is None:
+            self.indexes = self.droppable_indexes()
+        if not self.indexes:
+            return []
+        drops = ', '.join(f"DROP INDEX `{index['name']}`" for index in self.indexes)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"ALTER TABLE {self.table} {drops}")
+        finally:
+            cursor.close()
+        self.logger.info(f"Dropped {len(self.indexes)} index(es) on {self.table} for bulk load: "
+                         f"{', '.join(i['name'] for i in self.indexes)}")
+        print(f"{Fore.GREEN}✓ Deferred {len(self.indexes)} index(es) on {self.table}")
+        return self.indexes
+
+    def find_duplicates(self, index):
+        """Rows that would violate a unique index, excluding the first (lowest id) row of each group"""
+        columns = index['columns']
+        if len(columns) != len(index['parts']):
+            # Functional index parts cannot be grouped on; the rebuild will report them
+            return []
+        not_null = ' AND '.join(f"`{c}` IS NOT NULL" for c in columns)
+        join = ' AND '.join(f"t.`{c}` = d.`{c}`" for c in columns)
+        column_list = ', '.join(f"`{c}`" for c in columns)
+
+        cursor = self.conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"""
+                SELECT t.* FROM {self.table} t
+                JOIN (
+                    SELECT {column_list}, MIN(id) as keep_id
+                    FROM {self.table}
+                    WHERE {not_null}
+                    GROUP BY {column_list}
+                    HAVING COUNT(*) > 1
+                ) d ON {join} AND t.id != d.keep_id
+                ORDER BY t.id
+            """)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def rebuild(self):
+        """Recreate all deferred indexes with a single ALTER TABLE"""
+        if not self.indexes:
+            return
+        print(f"{Fore.CYAN}Rebuilding {len(self.indexes)} index(es) on {self.table}...")
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"ALTER TABLE {self.table} {', '.join(index_definition(i) for i in self.indexes)}")
+        finally:
+            cursor.close()
+        self.logger.info(f"Rebuilt {len(self.indexes)} index(es) on {self.table}")
+        print(f"{Fore.GREEN}✓ Indexes rebuilt on {self.table}")
@@ -0,0 +1,249 @@
+import json
+import os
+from datetime import datetime, timedelta
+from tqdm import tqdm
+from colorama import init, Fore
+from migration import MagiyaMigration
+
+init(autoreset=True)
+
+class DeltaSync(MagiyaMigration):
+    """Incremental catch-up runs driven by a per-table updated_at/id watermark"""
+    
+    def __init__(self, config):
+        super().__init__(config)
+        self.migration_mode = 'upsert'
+        self.state_file = config.DELTA_STATE_FILE
+        self.watermarks = self.load_watermarks()
+        self.detected_deletes = {'users': [], 'addresses': []}
+    
+    def load_watermarks(self):
+        """Load persisted watermarks from the state file"""
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as f:
+            return json.load(f)
+    
+    def save_watermarks(self):
+        """Persist watermarks atomically so an interrupted run resumes from the last committed batch"""
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.watermarks, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+    
+    def get_table_names(self, table_type):
+        """Return (V1 table, V2 table) for a table type"""
+        if table_type == 'users':
+            return self.config.V1_TABLE, self.config.V2_TABLE
+        return self.config.V1_ADDRESS_TABLE, self.config.V2_ADDRESS_TABLE
+    
+    def get_v2_key_column(self, table_type):
+        """Column in V2 that holds the V1 primary key"""
+        if self.preserve_ids:
+            return 'id'
+        return 'v1_id' if table_type == 'users' else None
+    
+    def fetch_changed_batches(self, table_type):
+        """Yield batches of V1 rows changed since the watermark, ordered by (updated_at, id)"""
+        source_table, _ = self.get_table_names(table_type)
+        watermark = self.watermarks.get(table_type)
+        # The columns the transform reads plus the watermark columns, and only the rows the migration reads
+        columns = list(dict.fromkeys([*self.source_projection(table_type), 'id', 'updated_at']))
+        select = f"SELECT {', '.join(f'`{column}`' for column in columns)} FROM {source_table}"
+        source_filter = self.source_filter(table_type)
+        v1_cursor = self.v1_conn.cursor(dictionary=True)
+        
+        try:
+            if watermark:
+                # Re-read a small overlap window to catch rows committed late with an older updated_at
+                last_updated = datetime.strptime(watermark['updated_at'], '%Y-%m-%d %H:%M:%S')
+                last_updated -= timedelta(seconds=self.config.DELTA_OVERLAP_SECONDS)
+                last_id = 0
+                print(f"{Fore.CYAN}Syncing {table_type} changed since {watermark['updated_at']} "
+                      f"(overlap: {self.config.DELTA_OVERLAP_SECONDS}s)")
+            else:
+                # First run: rows with a NULL updated_at are only picked up here
+                last_updated, last_id = None, 0
+                print(f"{Fore.YELLOW}No watermark for {table_type} - running initial full sync")
+            
+            while True:
+                if last_updated is None:
+                    v1_cursor.execute(f"""
+                        {select}
+                        WHERE updated_at IS NULL AND id > %s AND {source_filter}
+                        ORDER BY id
+                        LIMIT {self.config.BATCH_SIZE}
+                    """, (last_id,))
+                    records = v1_cursor.fetchall()
+                    if not records:
+                        last_updated, last_id = datetime.min, 0
+                        continue
+                else:
+                    v1_cursor.execute(f"""
+                        {select}
+                        WHERE (updated_at > %s OR (updated_at = %s AND id > %s)) AND {source_filter}
+                        ORDER BY updated_at, id
+                        LIMIT {self.config.BATCH_SIZE}
+                    """, (last_updated, last_updated, last_id))
+                    records = v1_cursor.fetchall()
+                    if not records:
+                        break
+                
+                yield records
+                
+                last_record = records[-1]
+                last_id = last_record['id']
+                if last_record['updated_at'] is not None:
+                    last_updated = last_record['updated_at']
+        finally:
+            v1_cursor.close()
+    
+    def sync_table(self, table_type):
+        """Upsert all rows of a table changed since its watermark"""
+        print(f"\n{Fore.CYAN}Delta sync: {table_type}...")
+        progress_bar = tqdm(desc=f"Syncing {table_type}", unit="records")
+        
+        for records in self.fetch_changed_batches(table_type):
+            self.migrate_batch(records, table_type)
+            self.stats[table_type]['total_records'] += len(records)
+            progress_bar.update(len(records))
+            
+            # Advance the watermark only after the batch is committed
+            changed = [r for r in records if r['updated_at'] is not None]
+            if changed:
+                self.watermarks[table_type] = {
+                    'updated_at': changed[-1]['updated_at'].strftime('%Y-%m-%d %H:%M:%S'),
+                    'id': changed[-1]['id']
+                }
+                self.save_watermarks()
+        
+        progress_bar.close()
+    
+    def _range_signatures(self, cursor, table, key_column, where=''):
+        """Per id-range row count and XOR of ids, computed in one index scan"""
+        cursor.execute(f"""
+            SELECT FLOOR({key_column} / %s) as chunk, COUNT(*), BIT_XOR({key_column})
+            FROM {table}
+            WHERE {key_column} IS NOT NULL {where}
+            GROUP BY chunk
+        """, (self.config.DELTA_DELETE_CHUNK_SIZE,))
+        return {int(chunk): (count, int(xor)) for chunk, count, xor in cursor.fetchall()}
+    
+    def detect_deletes(self, table_type):
+        """Find V2 rows whose V1 source no longer exists (or is now skipped) by set-difference per id range"""
+        source_table, target_table = self.get_table_names(table_type)
+        key_column = self.get_v2_key_column(table_type)
+        if key_column is None:
+            print(f"{Fore.YELLOW}⚠ Delete detection for {table_type} needs preserved IDs - skipped")
+            return []
+        
+        # Rows the migration never reads or skips count as deleted
+        v1_filter = f"AND {self.source_filter(table_type)}" + (" AND NOT (status <=> 0)" if table_type == 'users' else '')
+        chunk_size = self.config.DELTA_DELETE_CHUNK_SIZE
+        v1_cursor = self.v1_conn.cursor()
+        v2_cursor = self.v2_conn.cursor()
+        deleted_ids = []
+        
+        try:
+            v1_ranges = self._range_signatures(v1_cursor, source_table, 'id', v1_filter)
+            v2_ranges = self._range_signatures(v2_cursor, target_table, key_column)
+            
+            for chunk in sorted(v2_ranges):
+                if v1_ranges.get(chunk) == v2_ranges[chunk]:
+                    continue
+                
+                lower_id, upper_id = chunk * chunk_size, (chunk + 1) * chunk_size
+                v1_cursor.execute(f"SELECT id FROM {source_table} WHERE id >= %s AND id < %s {v1_filter}",
+                                  (lower_id, upper_id))
+                v1_ids = {row[0] for row in v1_cursor.fetchall()}
+                v2_cursor.execute(f"SELECT {key_column} FROM {target_table} WHERE {key_column} >= %s AND {key_column} < %s",
+                                  (lower_id, upper_id))
+                v2_ids = {row[0] for row in v2_cursor.fetchall()}
+                deleted_ids.extend(sorted(v2_ids - v1_ids))
+        finally:
+            v1_cursor.close()
+            v2_cursor.close()
+        
+        self.detected_deletes[table_type] = deleted_ids
+        return deleted_ids
+    
+    def apply_deletes(self, table_type, v1_ids):
+        """Delete V2 rows (and their role assignments) for V1 rows that were removed"""
+        _, target_table = self.get_table_names(table_type)
+        key_column = self.get_v2_key_column(table_type)
+        v2_cursor = self.v2_conn.cursor()
+        deleted = 0
+        
+        try:
+            for start in range(0, len(v1_ids), self.config.BATCH_SIZE):
+                chunk = v1_ids[start:start + self.config.BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                if table_type == 'users' and self.has_role_user_table:
+                    v2_cursor.execute(f"""
+                        DELETE ru FROM role_user ru
+                        JOIN {target_table} u ON u.id = ru.user_id
+                        WHERE u.{key_column} IN ({placeholders})
+                    """, chunk)
+                v2_cursor.execute(f"DELETE FROM {target_table} WHERE {key_column} IN ({placeholders})", chunk)
+                deleted += v2_cursor.rowcount
+                self.v2_conn.commit()
+        except Exception as e:
+            self.v2_conn.rollback()
+            self.logger.error(f"Failed to apply deletes for {table_type}: {e}")
+            raise
+        finally:
+            v2_cursor.close()
+        
+        print(f"{Fore.GREEN}✓ Deleted {deleted} {table_type} records from V2")
+        return deleted
+    
+    def run(self):
+        """Execute one delta catch-up run"""
+        try:
+            if not self.connect_databases(): return
+            self.start_metrics_server()
+            if not self.select_tables_to_migrate():
+                print(f"{Fore.YELLOW}Delta sync cancelled by user")
+                return
+            if not self.select_id_strategy(): return
+            if not self.preserve_ids:
+                # The upsert matches changed rows on the V2 id; with auto-increment IDs there is
+                # no unique key to match on and every changed row would be inserted again
+                print(f"{Fore.RED}✗ Delta sync needs preserved IDs - run the initial migration with original IDs")
+                return
+            
+            table_types = []
+            if hasattr(self, 'migrate_users') and self.migrate_users:
+                table_types.append('users')
+            if self.migrate_addresses:
+                table_types.append('addresses')
+            
+            for table_type in table_types:
+                self.sync_table(table_type)
+            
+            print(f"\n{Fore.CYAN}Checking for deleted records...")
+            for table_type in table_types:
+                deleted_ids = self.detect_deletes(table_type)
+                if not deleted_ids:
+                    print(f"  {Fore.GREEN}✓ No deleted {table_type} records")
+                    continue
+                print(f"  {Fore.YELLOW}⚠ {len(deleted_ids)} {table_type} records exist in V2 but not in V1")
+                confirm = input(f"Delete them from V2? (yes/no): ")
+                if confirm.lower() == 'yes':
+                    self.apply_deletes(table_type, deleted_ids)
+            
+            self.save_migration_report()
+            
+            print(f"\n{Fore.CYAN}Delta Sync Summary:")
+            for table_type in table_types:
+                print(f"  {table_type}: {self.stats[table_type]['total_records']} changed, "
+                      f"{Fore.GREEN}{self.stats[table_type]['migrated_records']} inserted, "
+                      f"{Fore.BLUE}{self.stats[table_type]['updated_records']} updated, "
+                      f"{Fore.RED}{self.stats[table_type]['failed_records']} failed")
+                if table_type in self.watermarks:
+                    print(f"    Watermark: {self.watermarks[table_type]['updated_at']} (id {self.watermarks[table_type]['id']})")
+        except Exception as e:
+            self.logger.error(f"Delta sync failed: {e}", exc_info=True)
+            print(f"{Fore.RED}✗ Delta sync failed: {e}")
+        finally:
+            self.close_connections()
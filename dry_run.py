@@ -0,0 +1,320 @@
+import json
+import math
+import time
+from tqdm import tqdm
+from colorama import init, Fore
+import mysql.connector
+from duplicate_preflight import DuplicatePreflight
+from migration import MagiyaMigration
+from metrics import observe
+
+init(autoreset=True)
+
+class DryRun(MagiyaMigration):
+    """Read and transform V1 (all of it or an evenly spread fraction) without writing to V2.
+
+    Fetch and transform time are measured per batch as in a real run. Writes are
+    measured separately by inserting a sample of the transformed rows into
+    temporary copies of the V2 tables (CREATE TEMPORARY TABLE ... LIKE, dropped
+    afterwards), which includes the server's insert and index cost but never
+    touches the real tables. Together with the V1/V2 round-trip latency this
+    gives an estimate of how long the full migration will take.
+
+    Duplicate-key failures of users are counted exactly from a scan of all of
+    V1; for other tables they are extrapolated from the write probe and labelled
+    with its sample size.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.migration_mode = 'insert'
+        self.fraction = config.DRY_RUN_FRACTION
+        self.samples = {name: {'rows': [], 'sampled': 0, 'transform_errors': 0, 'write_candidates': 0}
+                        for name in self.mappings}
+        self.latency = {}
+        self.write_probe = {}
+        self.exact_duplicate_failures = {}
+
+    def select_fraction(self):
+        """Ask how much of V1 to read"""
+        answer = input(f"\nFraction of V1 to read (0-1) [{self.fraction}]: ") or str(self.fraction)
+        try:
+            fraction = float(answer)
+        except ValueError:
+            fraction = 0
+        if not 0 < fraction <= 1:
+            print(f"{Fore.RED}Invalid fraction")
+            return self.select_fraction()
+        self.fraction = fraction
+
+    def remap_reference(self, parent, v1_id):
+        """Parents are not written during a dry run, so references keep their V1 id"""
+        return v1_id
+
+    def dry_run_table(self, table_type):
+        """Fetch and transform a table batch by batch; with a fraction < 1 whole id ranges are skipped between batches"""
+        source_table = self.mappings[table_type]['source']
+        key = self.mappings[table_type]['key']
+        sample = self.samples[table_type]
+        self.count_source_rows(table_type)
+
+        columns = self.source_projection(table_type)
+        row_type = self.v1_schema.get_row_type(source_table, columns)
+        base_query = (f"SELECT {', '.join(f'`{col}`' for col in columns)} FROM {source_table} "
+                      f"WHERE `{key}` > %s AND {self.source_filter(table_type)} ORDER BY `{key}`")
+        v1_cursor = self.v1_conn.cursor(dictionary=not self.compact_rows)
+        progress_bar = tqdm(total=math.ceil(self.stats[table_type]['total_records'] * self.fraction),
+                            desc=f"Dry run {table_type}", unit="records")
+
+        last_id = 0
+        while True:
+            fetch_started = time.perf_counter()
+            v1_cursor.execute(f"{base_query} LIMIT {self.config.BATCH_SIZE}", (last_id,))
+            records = self.fetch_records(v1_cursor, row_type)
+            if not records:
+                break
+            observe(self.stats[table_type]['phase_seconds']['fetch'], time.perf_counter() - fetch_started)
+
+            self.transform_batch(records, table_type)
+            progress_bar.update(len(records))
+            last_id = records[-1][key]
+            if self.fraction < 1:
+                span = records[-1][key] - records[0][key] + 1
+                last_id += int(span * (1 / self.fraction - 1))
+
+        progress_bar.close()
+        v1_cursor.close()
+        print(f"  {Fore.GREEN}✓ {sample['sampled']} {table_type} records read and transformed")
+
+    def transform_batch(self, records, table_type):
+        """The read-side half of migrate_batch: the same skips and transforms, nothing is executed on V2"""
+        sample = self.samples[table_type]
+        self.stats[table_type]['rows_read'] += len(records)
+        sample['sampled'] += len(records)
+        started = time.perf_counter()
+
+        for record in records:
+            if table_type == 'users' and record.get('status') == 0:
+                self.stats['users']['skipped_status_zero'] += 1
+                continue
+            if table_type == 'users' and self.duplicate_preflight and record['id'] in self.duplicate_preflight.skip_ids:
+                self.stats['users']['preflight_duplicates_skipped'] += 1
+                continue
+            try:
+                transformed = self.transform_record(table_type, record)
+            except Exception as e:
+                sample['transform_errors'] += 1
+                self.failed_records[table_type].append({'record': dict(record), 'error': str(e), 'error_type': type(e).__name__})
+                continue
+            if table_type == 'users' and self.duplicate_preflight and record['id'] in self.duplicate_preflight.overrides:
+                transformed = self.duplicate_preflight.apply(record['id'], transformed)
+                self.stats['users']['preflight_duplicates_rewritten'] += 1
+            self.stats[table_type]['rows_transformed'] += 1
+            sample['write_candidates'] += 1
+            if len(sample['rows']) < self.config.DRY_RUN_PROBE_ROWS:
+                sample['rows'].append(transformed)
+
+        observe(self.stats[table_type]['phase_seconds']['transform'], time.perf_counter() - started)
+
+    def measure_latency(self, samples=20):
+        """Median round trip of a trivial query to each server, in seconds"""
+        for name, conn in [('v1', self.v1_conn), ('v2', self.v2_conn)]:
+            cursor = conn.cursor()
+            timings = []
+            for _ in range(samples):
+                started = time.perf_counter()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                timings.append(time.perf_counter() - started)
+            cursor.close()
+            self.latency[name] = sorted(timings)[len(timings) // 2]
+        print(f"\n{Fore.CYAN}Round-trip latency: V1 {self.latency['v1'] * 1000:.2f} ms, V2 {self.latency['v2'] * 1000:.2f} ms")
+
+    def probe_writes(self, table_type):
+        """Time the real insert statement on sample rows against a temporary copy of the V2 table"""
+        rows = self.samples[table_type]['rows']
+        if not rows:
+            return
+        live_tables = self.v2_tables
+        probe_tables = {key: f"{table}__dry_run" for key, table in live_tables.items()}
+        cursor = self.v2_conn.cursor()
+        with_roles = table_type == 'users' and self.has_role_user_table
+        created = []
+        try:
+            for key in [table_type] + (['role_user'] if with_roles else []):
+                cursor.execute(f"CREATE TEMPORARY TABLE {probe_tables[key]} LIKE {live_tables[key]}")
+                created.append(probe_tables[key])
+
+            self.v2_tables = probe_tables
+            insert_query = self.build_migration_query(table_type)
+            role_query = f"INSERT IGNORE INTO {probe_tables['role_user']} (user_id, role_id, created_at, updated_at) VALUES (%s, 10, NOW(), NOW())"
+            errors = 0
+            started = time.perf_counter()
+            for row in rows:
+                try:
+                    cursor.execute(insert_query, row)
+                    if with_roles:
+                        cursor.execute(role_query, (row['id'] if self.preserve_ids else cursor.lastrowid,))
+                except mysql.connector.IntegrityError:
+                    errors += 1
+            execute_seconds = time.perf_counter() - started
+            started = time.perf_counter()
+            self.v2_conn.commit()
+            commit_seconds = time.perf_counter() - started
+
+            self.write_probe[table_type] = {
+                'rows': len(rows),
+                'integrity_errors': errors,
+                'seconds_per_row': execute_seconds / len(rows),
+                'commit_seconds': commit_seconds
+            }
+            print(f"  {table_type}: {execute_seconds / len(rows) * 1000:.2f} ms per row write "
+                  f"({len(rows)} sample rows, {errors} duplicate-key errors)")
+        except mysql.connector.Error as e:
+            # Without CREATE TEMPORARY TABLES the estimate falls back to round-trip latency
+            self.v2_conn.rollback()
+            self.logger.warning(f"Write probe for {table_type} not possible: {e}")
+            print(f"  {Fore.YELLOW}⚠ Write probe for {table_type} skipped ({e}), using round-trip latency")
+        finally:
+            self.v2_tables = live_tables
+            for table in created:
+                cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {table}")
+            cursor.close()
+
+    def count_duplicate_failures(self):
+        """Exact number of users the migration would reject on the V2 email/mobile unique keys.
+
+        A pre-flight policy resolves every collision before anything is written.
+        Without one, rows are inserted in id order, so the rejected rows are the
+        ones keep_first would skip; they are counted with a read-only scan of V1.
+        """
+        if self.duplicate_preflight:
+            return 0
+        print(f"\n{Fore.CYAN}Counting V1 email/mobile collisions...")
+        scan = DuplicatePreflight(self.v1_conn, self.config, self.logger, 'keep_first')
+        scan.scan()
+        scan.resolve()
+        return len(scan.skip_ids)
+
+    def estimate(self, table_type):
+        """Projected full-run numbers for a table from the sample and the measurements"""
+        stats = self.stats[table_type]
+        sample = self.samples[table_type]
+        phases = stats['phase_seconds']
+        total = stats['total_records']
+        scale = total / sample['sampled'] if sample['sampled'] else 0
+        batches = math.ceil(total / self.config.BATCH_SIZE)
+
+        probe = self.write_probe.get(table_type)
+        if probe:
+            seconds_per_row, commit_seconds = probe['seconds_per_row'], probe['commit_seconds']
+        else:
+            # One round trip per row (two with the role_user insert) and one per commit
+            round_trips = 2 if table_type == 'users' and self.has_role_user_table else 1
+            seconds_per_row, commit_seconds = self.latency['v2'] * round_trips, self.latency['v2']
+        rows_to_write = round(sample['write_candidates'] * scale)
+
+        fetch_seconds = phases['fetch']['sum'] / phases['fetch']['count'] * batches if phases['fetch']['count'] else 0
+        transform_seconds = phases['transform']['sum'] * scale
+        write_seconds = rows_to_write * seconds_per_row + batches * commit_seconds
+
+        duplicate_failures, duplicate_basis = self.exact_duplicate_failures.get(table_type), 'exact'
+        if duplicate_failures is None and probe:
+            duplicate_failures = round(probe['integrity_errors'] / probe['rows'] * rows_to_write)
+            duplicate_basis = f"estimate from {probe['rows']} sample rows"
+        return {
+            'v1_rows': total,
+            'sampled_rows': sample['sampled'],
+            'transform_rows_per_second': round(stats['rows_transformed'] / phases['transform']['sum']) if phases['transform']['sum'] else None,
+            'rows_to_write': rows_to_write,
+            'predicted_transform_failures': round(sample['transform_errors'] * scale),
+            'predicted_duplicate_key_failures': duplicate_failures,
+            'duplicate_key_failures_basis': duplicate_basis if duplicate_failures is not None else None,
+            'estimated_seconds': {
+                'fetch': round(fetch_seconds, 1),
+                'transform': round(transform_seconds, 1),
+                'write': round(write_seconds, 1),
+                'total': round(fetch_seconds + transform_seconds + write_seconds, 1)
+            }
+        }
+
+    def print_estimate(self, estimates):
+        print(f"\n{Fore.CYAN}Dry Run Summary (fraction read: {self.fraction:.0%}, no V2 writes):")
+        for table_type, estimate in estimates.items():
+            seconds = estimate['estimated_seconds']
+            print(f"\n  {Fore.CYAN}{table_type}:")
+            print(f"    V1 rows: {estimate['v1_rows']} ({estimate['sampled_rows']} read)")
+            print(f"    Transform rate: {estimate['transform_rows_per_second']} rows/s")
+            print(f"    Rows to write: {estimate['rows_to_write']}")
+            print(f"    Predicted transform failures: {Fore.RED}{estimate['predicted_transform_failures']}")
+            if estimate['predicted_duplicate_key_failures'] is not None:
+                print(f"    Predicted duplicate-key failures ({estimate['duplicate_key_failures_basis']}): "
+                      f"{Fore.RED}{estimate['predicted_duplicate_key_failures']}")
+            print(f"    Estimated time: fetch {seconds['fetch']}s, transform {seconds['transform']}s, "
+                  f"write {seconds['write']}s → {Fore.YELLOW}{format_duration(seconds['total'])}")
+
+        if self.duplicate_preflight:
+            print(f"\n  Pre-flight duplicates ({self.duplicate_preflight.policy}): "
+                  f"{Fore.YELLOW}{len(self.duplicate_preflight.skip_ids)} users skipped, "
+                  f"{len(self.duplicate_preflight.overrides)} rewritten")
+        total = sum(estimate['estimated_seconds']['total'] for estimate in estimates.values())
+        print(f"\n  {Fore.GREEN}Estimated migration duration: {format_duration(total)}")
+
+    def run(self):
+        """Execute a dry run and report the projection"""
+        try:
+            if not self.connect_databases(): return
+            if not self.select_tables_to_migrate():
+                print(f"{Fore.YELLOW}Dry run cancelled by user")
+                return
+            if not self.select_id_strategy(): return
+            self.select_fraction()
+
+            self.select_extra_tables()
+
+            table_types = self.selected_tables()
+            if 'users' in table_types:
+                if input("\nRun pre-flight duplicate detection on emails/mobiles? (yes/no): ").lower() == 'yes':
+                    self.select_duplicate_policy()
+                self.exact_duplicate_failures['users'] = self.count_duplicate_failures()
+
+            for table_type in table_types:
+                self.dry_run_table(table_type)
+
+            self.measure_latency()
+            print(f"\n{Fore.CYAN}Probing V2 write cost on temporary tables...")
+            for table_type in table_types:
+                self.probe_writes(table_type)
+
+            estimates = {table_type: self.estimate(table_type) for table_type in table_types}
+            self.print_estimate(estimates)
+
+            report_file = f"logs/dry_run_{self.run_id}.json"
+            with open(report_file, 'w') as f:
+                json.dump({
+                    'fraction': self.fraction,
+                    'preserve_ids': self.preserve_ids,
+                    'batch_size': self.config.BATCH_SIZE,
+                    'latency_seconds': self.latency,
+                    'write_probe': self.write_probe,
+                    'estimates': estimates,
+                    'duplicate_policy': self.duplicate_preflight.policy if self.duplicate_preflight else None,
+                    'failed_records': self.failed_records
+                }, f, indent=2, default=str)
+            print(f"\n{Fore.CYAN}Dry run report saved to: {report_file}")
+        except Exception as e:
+            self.logger.error(f"Dry run failed: {e}", exc_info=True)
+            print(f"{Fore.RED}✗ Dry run failed: {e}")
+        finally:
+            self.close_connections()
+
+
+def format_duration(seconds):
+    """Seconds as h/m/s"""
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours:
+        return f"{hours}h {minutes}m {seconds}s"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
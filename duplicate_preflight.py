@@ -0,0 +1,187 @@
+import json
+from collections import defaultdict
+from colorama import init, Fore
+from transforms import normalize_mobile, email_key
+
+init(autoreset=True)
+
+DUPLICATE_POLICIES = ['keep_first', 'keep_last', 'suffix', 'skip']
+
+class DuplicatePreflight:
+    """Find V1 users that would collide on V2's email/mobile unique keys before anything is written.
+
+    V1 ids, emails and normalized mobiles (the value V2 will actually store) of
+    the users the migration reads (V1_USER_FILTER) are streamed by id. Each key is reduced to its 64-bit hash and kept in a dict of
+    hash -> first V1 id, so memory stays at one small entry per user; only ids
+    whose hash was already seen are collected. Candidate groups are then
+    re-read and compared on the exact key, which discards hash collisions.
+
+    Policies for the rows of a duplicate group:
+      keep_first - migrate the lowest V1 id, skip the others
+      keep_last  - migrate the highest V1 id, skip the others
+                   (email and mobile groups are resolved together, see resolve())
+      suffix     - migrate all; later emails get '_DUP_<id>' appended and
+                   later mobiles are cleared (a suffixed number is not a valid mobile)
+      skip       - migrate none of the group, leave it for manual review
+    """
+
+    def __init__(self, conn, config, logger, policy='keep_first'):
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy '{policy}' (expected one of {', '.join(DUPLICATE_POLICIES)})")
+        self.conn = conn
+        self.config = config
+        self.logger = logger
+        self.policy = policy
+        self.groups = {'email': {}, 'mobile': {}}
+        self.skip_ids = set()
+        self.overrides = defaultdict(dict)
+        # Raw V1 values of the duplicate group members, by field and V1 id
+        self.member_values = {'email': {}, 'mobile': {}}
+        self.scanned = 0
+
+    def scan(self):
+        """Stream V1 keys into the hash index and return the verified duplicate groups"""
+        seen = {'email': {}, 'mobile': {}}
+        candidates = {'email': defaultdict(list), 'mobile': defaultdict(list)}
+        chunk_size = self.config.DUPLICATE_SCAN_CHUNK_SIZE
+        # The rows the migration loads: the users mapping filter, and never status=0 (skipped per row)
+        row_filter = f"({self.config.V1_USER_FILTER}) AND NOT (status <=> 0)" if self.config.V1_USER_FILTER else "NOT (status <=> 0)"
+        cursor = self.conn.cursor()
+        last_id = 0
+
+        try:
+            while True:
+                cursor.execute(f"""
+                    SELECT id, email, mobile FROM {self.config.V1_TABLE}
+                    WHERE id > %s AND {row_filter}
+                    ORDER BY id
+                    LIMIT {chunk_size}
+                """, (last_id,))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                for v1_id, email, mobile in rows:
+                    for field, key in (('email', email_key(email)), ('mobile', self._mobile_key(mobile))):
+                        if key is None:
+                            continue
+                        digest = hash(key)
+                        first_id = seen[field].setdefault(digest, v1_id)
+                        if first_id != v1_id:
+                            members = candidates[field][digest]
+                            if not members:
+                                members.append(first_id)
+                            members.append(v1_id)
+
+                self.scanned += len(rows)
+                last_id = rows[-1][0]
+                print(f"  Scanned {self.scanned} V1 users", end='\r')
+        finally:
+            cursor.close()
+        print()
+
+        del seen
+        for field in ('email', 'mobile'):
+            self.groups[field] = self._verify(field, candidates[field])
+        return self.groups
+
+    @staticmethod
+    def _mobile_key(mobile):
+        value, outcome = normalize_mobile(mobile)
+        return value if outcome in ('unchanged', 'converted') else None
+
+    def _verify(self, field, candidates):
+        """Re-read candidate rows and group them by exact key"""
+        ids = sorted({v1_id for members in candidates.values() for v1_id in members})
+        groups = defaultdict(list)
+        cursor = self.conn.cursor()
+        try:
+            for start in range(0, len(ids), self.config.BATCH_SIZE):
+                chunk = ids[start:start + self.config.BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"SELECT id, {field} FROM {self.config.V1_TABLE} WHERE id IN ({placeholders}) ORDER BY id", chunk)
+                for v1_id, value in cursor.fetchall():
+                    key = email_key(value) if field == 'email' else self._mobile_key(value)
+                    if key is not None:
+                        groups[key].append(v1_id)
+                        self.member_values[field][v1_id] = value
+        finally:
+            cursor.close()
+        return {key: members for key, members in groups.items() if len(members) > 1}
+
+    def resolve(self):
+        """Turn the duplicate groups into per-V1-id skip/override decisions"""
+        self.skip_ids.clear()
+        self.overrides.clear()
+        if self.policy in ('keep_first', 'keep_last'):
+            self._resolve_keep()
+        for field, groups in self.groups.items():
+            for key, members in groups.items():
+                if self.policy == 'skip':
+                    self.skip_ids.update(members)
+                elif self.policy == 'suffix':
+                    for v1_id in members[1:]:
+                        self.overrides[v1_id][field] = f"{self.member_values['email'][v1_id].rstrip()}_DUP_{v1_id}" if field == 'email' else None
+        self.logger.info(f"Pre-flight duplicates ({self.policy}): {len(self.skip_ids)} to skip, "
+                         f"{len(self.overrides)} to rewrite")
+
+    def _resolve_keep(self):
+        """keep_first/keep_last over both fields at once.
+
+        Users are visited in id order (descending for keep_last) and kept only
+        when neither their email nor their mobile is held by a user kept before,
+        as the row-by-row insert would. A user is therefore never the survivor of
+        one group while being skipped for another.
+        """
+        keys = defaultdict(list)
+        for field, groups in self.groups.items():
+            for key, members in groups.items():
+                for v1_id in members:
+                    keys[v1_id].append((field, key))
+        taken = set()
+        for v1_id in sorted(keys, reverse=self.policy == 'keep_last'):
+            if any(key in taken for key in keys[v1_id]):
+                self.skip_ids.add(v1_id)
+            else:
+                taken.update(keys[v1_id])
+
+    def run(self):
+        """Scan, resolve and print a summary"""
+        print(f"\n{Fore.CYAN}Pre-flight duplicate detection (policy: {self.policy})...")
+        self.scan()
+        self.resolve()
+
+        for field in ('email', 'mobile'):
+            groups = self.groups[field]
+            rows = sum(len(members) for members in groups.values())
+            color = Fore.YELLOW if groups else Fore.GREEN
+            print(f"  {color}{len(groups)} duplicate {field} group(s) covering {rows} V1 users")
+            for key, members in sorted(groups.items(), key=lambda item: -len(item[1]))[:5]:
+                print(f"    - {key}: {len(members)} records (IDs: {', '.join(map(str, members[:10]))}"
+                      f"{', ...' if len(members) > 10 else ''})")
+        if self.skip_ids:
+            print(f"  {Fore.YELLOW}⚠ {len(self.skip_ids)} user(s) will be skipped")
+        if self.overrides:
+            print(f"  {Fore.YELLOW}⚠ {len(self.overrides)} user(s) will be migrated with rewritten email/mobile")
+        return self
+
+    def apply(self, v1_id, row):
+        """Apply the policy's email/mobile rewrite to a transformed V2 row"""
+        overrides = self.overrides.get(v1_id)
+        if not overrides:
+            return row
+        if isinstance(row, dict):
+            return {**row, **overrides}
+        return row._replace(**overrides)
+
+    def save_report(self, path):
+        """Write every duplicate group with the policy decision"""
+        with open(path, 'w') as f:
+            json.dump({
+                'policy': self.policy,
+                'scanned': self.scanned,
+                'groups': self.groups,
+                'skipped_ids': sorted(self.skip_ids),
+                'rewritten': {str(v1_id): values for v1_id, values in sorted(self.overrides.items())}
+            }, f, indent=2)
+        return path
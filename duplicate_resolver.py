@@ -1,9 +1,25 @@
 import mysql.connector
 from colorama import init, Fore
+import csv
 import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from duplicate_preflight import DuplicatePreflight
+from schema_cache import SchemaCache
 
 init(autoreset=True)
 
+def iter_rows(cursor, size):
+    """Rows of the last query, fetched `size` at a time"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
 class DuplicateResolver:
     def __init__(self, config):
         self.config = config
@@ -54,19 +70,65 @@ class DuplicateResolver:
         print(f"\n{Fore.CYAN}Resolution Options:")
         print("1. Generate SQL to fix duplicates (keep first occurrence)")
         print("2. Generate SQL to fix duplicates (keep last occurrence)")
-        print("3. Export duplicate records for manual review")
-        print("4. Return to main menu")
+        print("3. Fix duplicates now in throttled chunks (keep first occurrence)")
+        print("4. Fix duplicates now in throttled chunks (keep last occurrence)")
+        print("5. Export duplicate records for manual review")
+        print("6. Undo a previous chunked fix")
+        print("7. Analyze mobile duplicates after +94 normalization")
+        print("8. Return to main menu")
         
-        choice = input("\nEnter your choice (1-4): ")
+        choice = input("\nEnter your choice (1-8): ")
         
         if choice in ['1', '2']:
             self.generate_dedup_sql(keep_first=(choice == '1'))
-        elif choice == '3':
+        elif choice in ['3', '4']:
+            self.execute_dedup(keep_first=(choice == '3'))
+        elif choice == '5':
             self.export_duplicates()
+        elif choice == '6':
+            self.undo_dedup()
+        elif choice == '7':
+            self.analyze_normalized_mobiles()
+    
+    def analyze_normalized_mobiles(self):
+        """Report mobile duplicates as they will look in V2, after the migration's +94 normalization.
+        
+        '0771234567', '+94771234567' and '94 77 123 4567' are different raw values but
+        the same V2 mobile, so GROUP BY mobile misses them while mobile_unique does not.
+        """
+        print(f"\n{Fore.CYAN}Streaming V1 mobiles through the +94 normalizer...")
+        v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+        try:
+            preflight = DuplicatePreflight(v1_conn, self.config, logging.getLogger('DuplicateResolver'))
+            preflight.scan()
+        finally:
+            v1_conn.close()
+        
+        raw_values = preflight.member_values['mobile']
+        groups = []
+        for mobile, ids in preflight.groups['mobile'].items():
+            variants = sorted({str(raw_values[v1_id]) for v1_id in ids})
+            groups.append({'mobile': mobile, 'count': len(ids), 'ids': ids, 'raw_values': variants,
+                           'only_after_normalization': len(variants) > 1})
+        groups.sort(key=lambda group: -group['count'])
+        hidden = sum(1 for group in groups if group['only_after_normalization'])
+        
+        print(f"\n{Fore.YELLOW}Duplicate Mobile Numbers (after normalization):")
+        print(f"  {len(groups)} groups covering {sum(group['count'] for group in groups)} of {preflight.scanned} active users")
+        print(f"  {hidden} groups are not visible to a GROUP BY on the raw mobile column")
+        for group in groups[:20]:
+            print(f"  {group['mobile']}: {group['count']} records (IDs: {', '.join(map(str, group['ids'][:10]))}"
+                  f"{', ...' if group['count'] > 10 else ''}) raw: {', '.join(group['raw_values'][:5])}")
+        
+        os.makedirs('logs', exist_ok=True)
+        report_file = f"logs/normalized_mobile_duplicates_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(report_file, 'w') as f:
+            json.dump({'scanned': preflight.scanned, 'groups': groups}, f, indent=2)
+        print(f"\n{Fore.GREEN}✓ Full report saved to: {report_file}")
     
     def generate_dedup_sql(self, keep_first=True):
         """Generate SQL to fix duplicates"""
-        order = "ASC" if keep_first else "DESC"
+        keep = "MIN" if keep_first else "MAX"
         
         sql_file = f"fix_duplicates_{'first' if keep_first else 'last'}.sql"
         
@@ -78,7 +140,7 @@ class DuplicateResolver:
             f.write(f"""
 UPDATE {self.config.V1_TABLE} t1
 JOIN (
-    SELECT email, MIN(id) as keep_id
+    SELECT email, {keep}(id) as keep_id
     FROM {self.config.V1_TABLE}
     WHERE email IS NOT NULL AND email != ''
     GROUP BY email
@@ -89,7 +151,7 @@ SET t1.email = CONCAT(t1.email, '_DUP_', t1.id);
 -- Fix duplicate mobiles
 UPDATE {self.config.V1_TABLE} t1
 JOIN (
-    SELECT mobile, MIN(id) as keep_id
+    SELECT mobile, {keep}(id) as keep_id
     FROM {self.config.V1_TABLE}
     WHERE mobile IS NOT NULL AND mobile != ''
     GROUP BY mobile
@@ -101,7 +163,322 @@ SET t1.mobile = CONCAT(t1.mobile, '_DUP_', t1.id);
         print(f"\n{Fore.GREEN}✓ SQL script generated: {sql_file}")
         print(f"  Review and run this script on your V1 database to fix duplicates")
     
+    def execute_dedup(self, keep_first=True):
+        """Suffix duplicate emails/mobiles with _DUP_<id> in small id-range chunks, logging every change.
+        
+        Each chunk is one short transaction: it locks the next DEDUP_CHUNK_SIZE rows by
+        id, locks the rows that decide which member of their groups is kept and updates
+        only that chunk's other rows, so concurrent writes cannot change a group between
+        the keeper lookup and the UPDATE. Groups are looked up through the column's
+        index; a column without one would be scanned in full for every chunk, so its
+        keepers are read once with a single GROUP BY before the first chunk and each
+        chunk only locks and re-checks them. The keeper of a group is never renamed,
+        so the decision stays stable as later chunks are processed.
+        """
+        keep = "MIN" if keep_first else "MAX"
+        chunk_size = self.config.DEDUP_CHUNK_SIZE
+        os.makedirs('logs', exist_ok=True)
+        log_path = f"logs/dedup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        
+        confirm = input(f"\n{Fore.RED}⚠ This will modify duplicate rows in the V1 table. Continue? (yes/no): ")
+        if confirm.lower() != 'yes':
+            return
+        
+        v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+        v1_cursor = v1_conn.cursor()
+        changed = {'email': 0, 'mobile': 0}
+        stale_groups = 0
+        last_id = 0
+        
+        try:
+            indexes = SchemaCache(v1_conn, self.config.V1_DATABASE).get_indexes(self.config.V1_TABLE)
+            keepers = {}
+            for field in ('email', 'mobile'):
+                if not any(index['columns'][:1] == [field] for index in indexes):
+                    print(f"  {Fore.YELLOW}⚠ {self.config.V1_TABLE}.{field} is not indexed - reading its duplicate groups once up front")
+                    keepers[field] = self.read_keepers(v1_cursor, field, keep)
+            # End the snapshot of the setup reads; every chunk runs in its own transaction
+            v1_conn.commit()
+            
+            with open(log_path, 'w') as log:
+                log.write(json.dumps({'type': 'run', 'table': self.config.V1_TABLE, 'keep': keep.lower(),
+                                      'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) + '\n')
+                while True:
+                    self.wait_for_replicas()
+                    v1_conn.start_transaction()
+                    v1_cursor.execute(f"""
+                        SELECT id, email, mobile FROM {self.config.V1_TABLE}
+                        WHERE id > %s ORDER BY id LIMIT {chunk_size}
+                        FOR UPDATE
+                    """, (last_id,))
+                    rows = v1_cursor.fetchall()
+                    if not rows:
+                        v1_conn.commit()
+                        break
+                    
+                    for position, field in [(1, 'email'), (2, 'mobile')]:
+                        values = list({row[position] for row in rows if row[position]})
+                        if not values:
+                            continue
+                        if field in keepers:
+                            keep_ids, stale = self.lock_keepers(v1_cursor, field, keepers[field], values)
+                            stale_groups += stale
+                        else:
+                            keep_ids = self.lock_groups(v1_cursor, field, values, keep_first)
+                        
+                        changes = [(row[0], row[position]) for row in rows
+                                   if row[position] and keep_ids.get(str(row[position]).lower(), row[0]) != row[0]]
+                        if not changes:
+                            continue
+                        
+                        # Log before updating so an interrupted chunk can still be undone
+                        for row_id, before in changes:
+                            log.write(json.dumps({'type': 'change', 'id': row_id, 'field': field,
+                                                  'before': before, 'after': f"{before}_DUP_{row_id}"}) + '\n')
+                        log.flush()
+                        
+                        ids = [row_id for row_id, before in changes]
+                        placeholders = ', '.join(['%s'] * len(ids))
+                        v1_cursor.execute(f"""
+                            UPDATE {self.config.V1_TABLE} SET {field} = CONCAT({field}, '_DUP_', id)
+                            WHERE id IN ({placeholders})
+                        """, ids)
+                        changed[field] += v1_cursor.rowcount
+                    
+                    v1_conn.commit()
+                    last_id = rows[-1][0]
+                    print(f"  Processed up to id {last_id} ({changed['email']} emails, {changed['mobile']} mobiles fixed)", end='\r')
+                    time.sleep(self.config.DEDUP_THROTTLE_SECONDS)
+                
+                log.write(json.dumps({'type': 'end', 'changed': changed,
+                                      'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) + '\n')
+        except Exception as e:
+            v1_conn.rollback()
+            print(f"\n{Fore.RED}✗ Dedup stopped after id {last_id}: {e}")
+            print(f"  Changes made so far are listed in {log_path}")
+            return
+        finally:
+            v1_cursor.close()
+            v1_conn.close()
+        
+        print()
+        print(f"{Fore.GREEN}✓ Fixed {changed['email']} duplicate emails and {changed['mobile']} duplicate mobiles")
+        if stale_groups:
+            print(f"{Fore.YELLOW}⚠ {stale_groups} group(s) changed since the up-front scan were left alone - run the fix again")
+        print(f"  Change log (for undo): {log_path}")
+    
+    def read_keepers(self, cursor, field, keep):
+        """Kept id of every duplicate group of an unindexed column, from one GROUP BY scan"""
+        cursor.execute(f"""
+            SELECT {field}, {keep}(id) FROM {self.config.V1_TABLE}
+            WHERE {field} IS NOT NULL AND {field} != ''
+            GROUP BY {field}
+            HAVING COUNT(*) > 1
+        """)
+        # Lower-cased the way the column's case-insensitive collation groups values
+        return {str(value).lower(): keep_id for value, keep_id in cursor.fetchall()}
+    
+    def lock_groups(self, cursor, field, values, keep_first):
+        """Lock every row holding one of the values (through the column's index) and return the kept id per duplicate value"""
+        placeholders = ', '.join(['%s'] * len(values))
+        cursor.execute(f"""
+            SELECT id, {field} FROM {self.config.V1_TABLE}
+            WHERE {field} IN ({placeholders})
+            FOR UPDATE
+        """, values)
+        members = defaultdict(list)
+        for row_id, value in cursor.fetchall():
+            members[str(value).lower()].append(row_id)
+        pick = min if keep_first else max
+        return {key: pick(ids) for key, ids in members.items() if len(ids) > 1}
+    
+    def lock_keepers(self, cursor, field, keepers, values):
+        """Lock the scanned keepers of the values' groups; returns the kept id per value still valid and the stale count"""
+        keep_ids = {str(value).lower(): keepers[str(value).lower()] for value in values if str(value).lower() in keepers}
+        if not keep_ids:
+            return {}, 0
+        ids = sorted(set(keep_ids.values()))
+        cursor.execute(f"""
+            SELECT id, {field} FROM {self.config.V1_TABLE}
+            WHERE id IN ({', '.join(['%s'] * len(ids))})
+            FOR UPDATE
+        """, ids)
+        current = {row_id: str(value).lower() for row_id, value in cursor.fetchall()}
+        # A keeper changed or deleted since the scan: its group is left for a later run
+        valid = {key: keep_id for key, keep_id in keep_ids.items() if current.get(keep_id) == key}
+        return valid, len(keep_ids) - len(valid)
+    
+    def replica_lag(self):
+        """Highest replication lag in seconds across DEDUP_REPLICA_HOSTS (raises if a replica is not replicating)"""
+        lags = []
+        for host in self.config.DEDUP_REPLICA_HOSTS:
+            hostname, _, port = host.partition(':')
+            replica_conn = mysql.connector.connect(**{**self.config.V1_CONFIG, 'host': hostname, 'port': int(port or 3306)})
+            try:
+                cursor = replica_conn.cursor(dictionary=True)
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except mysql.connector.Error:
+                    # MySQL < 8.0.22
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+                cursor.close()
+            finally:
+                replica_conn.close()
+            if status:
+                lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+                if lag is None:
+                    # A stopped replica reports NULL and would never catch up
+                    raise RuntimeError(f"Replica {host} is not replicating (replication lag is NULL)")
+                lags.append(lag)
+        return max(lags) if lags else 0
+    
+    def wait_for_replicas(self):
+        """Pause while any replica lags more than DEDUP_MAX_REPLICA_LAG seconds (at most DEDUP_REPLICA_WAIT_SECONDS)"""
+        if not self.config.DEDUP_REPLICA_HOSTS:
+            return
+        deadline = time.monotonic() + self.config.DEDUP_REPLICA_WAIT_SECONDS
+        while True:
+            lag = self.replica_lag()
+            if lag <= self.config.DEDUP_MAX_REPLICA_LAG:
+                return
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Replica lag still {lag}s after waiting {self.config.DEDUP_REPLICA_WAIT_SECONDS}s")
+            print(f"  {Fore.YELLOW}⚠ Replica lag {lag}s - waiting...", end='\r')
+            time.sleep(max(self.config.DEDUP_THROTTLE_SECONDS, 1))
+    
+    def undo_dedup(self, log_path=None):
+        """Restore the original values recorded in a chunked dedup change log"""
+        if log_path is None:
+            log_path = input("Path to dedup change log (logs/dedup_*.jsonl): ").strip()
+        if not os.path.exists(log_path):
+            print(f"{Fore.RED}✗ Log not found: {log_path}")
+            return
+        
+        v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+        v1_cursor = v1_conn.cursor()
+        restored = 0
+        
+        def restore(changes):
+            nonlocal restored
+            self.wait_for_replicas()
+            for change in changes:
+                # Only rows still holding the suffixed value are put back
+                v1_cursor.execute(f"""
+                    UPDATE {self.config.V1_TABLE} SET {change['field']} = %s
+                    WHERE id = %s AND {change['field']} = %s
+                """, (change['before'], change['id'], change['after']))
+                restored += v1_cursor.rowcount
+            v1_conn.commit()
+            time.sleep(self.config.DEDUP_THROTTLE_SECONDS)
+        
+        try:
+            changes = []
+            with open(log_path) as log:
+                for line in log:
+                    entry = json.loads(line)
+                    if entry['type'] != 'change':
+                        continue
+                    changes.append(entry)
+                    if len(changes) >= self.config.DEDUP_CHUNK_SIZE:
+                        restore(changes)
+                        changes = []
+            if changes:
+                restore(changes)
+        except Exception as e:
+            v1_conn.rollback()
+            print(f"{Fore.RED}✗ Undo failed after restoring {restored} values: {e}")
+            return
+        finally:
+            v1_cursor.close()
+            v1_conn.close()
+        
+        print(f"{Fore.GREEN}✓ Restored {restored} original values from {log_path}")
+    
     def export_duplicates(self):
-        """Export duplicate records for review"""
-        # Implementation for exporting duplicates to CSV
-        pass
\ No newline at end of file
+        """Export every duplicate email/mobile group with its full member rows for review"""
+        print(f"\n{Fore.CYAN}Select export format:")
+        print("1. CSV")
+        print("2. JSONL")
+        file_format = 'jsonl' if input("\nEnter your choice (1-2): ") == '2' else 'csv'
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        os.makedirs('logs', exist_ok=True)
+        v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+        try:
+            for field in ['email', 'mobile']:
+                path = f"logs/duplicates_{field}_{timestamp}.{file_format}"
+                groups, rows = self.export_duplicate_groups(v1_conn, field, path, file_format)
+                print(f"{Fore.GREEN}✓ {groups} duplicate {field} groups ({rows} records) exported to: {path}")
+        finally:
+            v1_conn.close()
+    
+    def export_duplicate_groups(self, v1_conn, field, path, file_format='csv'):
+        """Stream duplicate groups of one column to a file, a page of groups at a time.
+        
+        The groups come from a single ordered GROUP BY read through an unbuffered
+        cursor, so V1 aggregates once however many groups exist; member rows are
+        read per page of BATCH_SIZE groups on a second connection (the first one is
+        busy streaming) and written BATCH_SIZE rows at a time, which keeps memory
+        bounded however large a group is.
+        """
+        page_size = self.config.BATCH_SIZE
+        groups_cursor = v1_conn.cursor(buffered=False)
+        rows_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+        v1_cursor = rows_conn.cursor()
+        group_count = row_count = 0
+        
+        try:
+            groups_cursor.execute(f"""
+                SELECT {field}, COUNT(*) as count
+                FROM {self.config.V1_TABLE}
+                WHERE {field} IS NOT NULL AND {field} != ''
+                GROUP BY {field}
+                HAVING count > 1
+                ORDER BY {field}
+            """)
+            with open(path, 'w', newline='') as f:
+                writer = None
+                while True:
+                    groups = groups_cursor.fetchmany(page_size)
+                    if not groups:
+                        break
+                    # Keyed case-insensitively: IN matches every case variant of a group's value
+                    sizes = {str(value).lower(): count for value, count in groups}
+                    
+                    placeholders = ', '.join(['%s'] * len(groups))
+                    v1_cursor.execute(f"""
+                        SELECT * FROM {self.config.V1_TABLE}
+                        WHERE {field} IN ({placeholders})
+                        ORDER BY {field}, id
+                    """, [value for value, count in groups])
+                    columns = v1_cursor.column_names
+                    position = columns.index(field)
+                    
+                    for row in iter_rows(v1_cursor, page_size):
+                        value = row[position]
+                        group_size = sizes.get(str(value).lower())
+                        if file_format == 'jsonl':
+                            record = dict(zip(columns, row))
+                            f.write(json.dumps({'duplicate_field': field, 'duplicate_value': value,
+                                                'group_size': group_size, 'record': record}, default=str) + '\n')
+                        else:
+                            if writer is None:
+                                writer = csv.writer(f)
+                                writer.writerow(['duplicate_field', 'duplicate_value', 'group_size', *columns])
+                            writer.writerow([field, value, group_size, *row])
+                        row_count += 1
+                    
+                    group_count += len(groups)
+                    print(f"  {field}: {group_count} groups exported", end='\r')
+        finally:
+            v1_cursor.close()
+            rows_conn.close()
+            try:
+                groups_cursor.close()
+            except mysql.connector.Error:
+                # Unread groups after a failure; the caller closes the connection
+                pass
+        
+        print()
+        return group_count, row_count
@@ -0,0 +1,207 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed via extra= and goes into the JSON line
+STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message plus any extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RepeatedMessageFilter(logging.Filter):
+    """Rate-limit records that carry a category (extra={'category': ...}).
+
+    The first `samples` records of a category pass through; after that they are
+    counted and at most one summary line per `interval` seconds is let through
+    in their place. Records without a category are never limited. Loggers are
+    shared by the table worker threads, so the counters are updated under a lock.
+    """
+
+    def __init__(self, samples, interval):
+        super().__init__()
+        self.samples = samples
+        self.interval = interval
+        self.counts = {}
+        self.suppressed = {}
+        self.last_summary = {}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Start counting afresh for a new run"""
+        with self.lock:
+            self.counts.clear()
+            self.suppressed.clear()
+            self.last_summary.clear()
+
+    def filter(self, record):
+        category = getattr(record, 'category', None)
+        if category is None:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            count = self.counts[category] = self.counts.get(category, 0) + 1
+            if count <= self.samples:
+                # The first summary is due one interval after the last sample
+                self.last_summary[category] = now
+                return True
+
+            # With no samples the first summary is due one interval after the first record
+            last_summary = self.last_summary.setdefault(category, now)
+            self.suppressed[category] = self.suppressed.get(category, 0) + 1
+            if now - last_summary < self.interval:
+                return False
+            suppressed = self.suppressed[category]
+            self.suppressed[category] = 0
+            self.last_summary[category] = now
+        last_message = record.getMessage()
+        record.msg = "%s: %d similar messages suppressed (%d so far), last: %s"
+        record.args = (category, suppressed, count, last_message)
+        return True
+
+
+class _InProcessQueueHandler(QueueHandler):
+    """Enqueue the record untouched so message formatting happens on the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+class _RunFileRouter(logging.Handler):
+    """Listener-side handler that writes each record to the open run log files of its logger.
+
+    Files are opened and closed through control records sent down the same
+    queue, so a file is only closed after everything logged before it was written.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}
+
+    def handle(self, record):
+        control = getattr(record, 'run_log_control', None)
+        if control:
+            action, file_handler, done = control
+            if action == 'open':
+                self.files.setdefault(record.name, []).append(file_handler)
+            else:
+                self.files.get(record.name, []).remove(file_handler)
+                file_handler.close()
+            done.set()
+            return True
+        for file_handler in self.files.get(record.name, ()):
+            if record.levelno >= file_handler.level:
+                file_handler.handle(record)
+        return True
+
+
+# Process-wide logging state: one queue and one listener thread however many runs are started
+_queue = None
+_listener = None
+_router = None
+
+
+def _start_listener():
+    global _queue, _listener, _router
+    if _listener:
+        return
+    _queue = queue.SimpleQueue()
+    _router = _RunFileRouter()
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    _listener = QueueListener(_queue, console_handler, _router, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Write out queued records, stop the listener thread and close every run log file"""
+    global _listener
+    if not _listener:
+        return
+    _listener.stop()
+    _listener = None
+    for file_handlers in _router.files.values():
+        for file_handler in file_handlers:
+            file_handler.close()
+    _router.files.clear()
+
+
+def configure_logger(name, config):
+    """Attach a logger to the shared queue; later calls for the same name return it unchanged"""
+    _start_listener()
+    logger = logging.getLogger(name)
+    logger.setLevel(getattr(logging, config.LOG_LEVEL))
+    if not any(isinstance(handler, _InProcessQueueHandler) for handler in logger.handlers):
+        queue_handler = _InProcessQueueHandler(_queue)
+        queue_handler.addFilter(RepeatedMessageFilter(config.LOG_SAMPLE_LIMIT, config.LOG_AGGREGATE_SECONDS))
+        logger.addHandler(queue_handler)
+        # Records are written by the listener; the root logger's handlers would duplicate them
+        logger.propagate = False
+    return logger
+
+
+class RunLog:
+    """A log file that receives one logger's records for the duration of a run"""
+
+    def __init__(self, logger, path, config):
+        self.logger = logger
+        self.path = path
+        self.file_handler = logging.FileHandler(path)
+        self.file_handler.setLevel(logging.DEBUG)
+        if config.LOG_FORMAT == 'json':
+            self.file_handler.setFormatter(JsonFormatter())
+        else:
+            self.file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        for log_filter in self._rate_filters():
+            log_filter.reset()
+        self._control('open')
+
+    def _rate_filters(self):
+        return [log_filter for handler in self.logger.handlers for log_filter in handler.filters
+                if isinstance(log_filter, RepeatedMessageFilter)]
+
+    def _control(self, action):
+        done = threading.Event()
+        record = self.logger.makeRecord(self.logger.name, logging.DEBUG, __file__, 0, '', (), None,
+                                        extra={'run_log_control': (action, self.file_handler, done)})
+        _queue.put(record)
+        if not done.wait(timeout=10):
+            raise RuntimeError(f"Log listener did not {action} {self.path}")
+
+    def close(self):
+        """Flush this run's records to the file and release its descriptor"""
+        if self.file_handler is None:
+            return
+        if _listener:
+            self._control('close')
+        else:
+            self.file_handler.close()
+        self.file_handler = None
+
+    def repeated_message_counts(self):
+        """Total count per rate-limited category seen during this run"""
+        counts = {}
+        for log_filter in self._rate_filters():
+            with log_filter.lock:
+                counts.update(log_filter.counts)
+        return counts
@@ -7,6 +7,10 @@ from migration import MagiyaMigration
 from validator import MigrationValidator
 from rollback import MigrationRollback
 from duplicate_resolver import DuplicateResolver
+from delta_sync import DeltaSync
+from cdc_follower import BinlogFollower
+from dry_run import DryRun
+from run_manifest import RunManifest
 
 init(autoreset=True)
 
@@ -26,8 +30,19 @@ def print_menu():
     print("2. Validate existing migration")
     print("3. Rollback migration")
     print("4. Analyze and fix duplicates")
-    print("5. Exit")
-    return input("\nEnter your choice (1-5): ")
+    print("5. Incremental delta sync (catch-up run)")
+    print("6. Follow V1 binlog (CDC)")
+    print("7. Dry run (estimate duration, no V2 writes)")
+    print("8. Exit")
+    return input("\nEnter your choice (1-8): ")
+
+def print_validation_menu():
+    """Print validation sub-menu"""
+    print(f"\n{Fore.CYAN}Select validation type:")
+    print("1. Quick validation checks")
+    print("2. Chunked checksum reconciliation (V1 ↔ V2)")
+    print("3. Validate the latest run only (from its manifest)")
+    return input("\nEnter your choice (1-3): ")
 
 def main():
     """Main application entry point"""
@@ -47,7 +62,19 @@ def main():
         elif choice == '2':
             # Validate migration
             validator = MigrationValidator(config)
-            validator.validate()
+            validation_choice = print_validation_menu()
+            if validation_choice == '1':
+                validator.validate()
+            elif validation_choice == '2':
+                validator.checksum_reconcile()
+            elif validation_choice == '3':
+                manifests = [m for m in RunManifest.list_manifests(config) if m.run]
+                if manifests:
+                    validator.validate_run(manifests[0])
+                else:
+                    print(f"{Fore.YELLOW}No run manifests found")
+            else:
+                print(f"{Fore.RED}Invalid choice")
             
         elif choice == '3':
             # Rollback migration
@@ -60,6 +87,21 @@ def main():
             resolver.analyze_duplicates()
             
         elif choice == '5':
+            # Delta sync
+            delta_sync = DeltaSync(config)
+            delta_sync.run()
+            
+        elif choice == '6':
+            # Binlog follower
+            follower = BinlogFollower(config)
+            follower.run()
+            
+        elif choice == '7':
+            # Dry run
+            dry_run = DryRun(config)
+            dry_run.run()
+            
+        elif choice == '8':
             print(f"\n{Fore.YELLOW}Goodbye!")
             sys.exit(0)
             
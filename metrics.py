@@ -0,0 +1,138 @@
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BATCH_SECONDS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+PHASE_SECONDS_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Per-batch phases of the migration loop
+PHASES = ['fetch', 'transform', 'execute', 'commit']
+
+def new_histogram(bounds=BATCH_SECONDS_BUCKETS):
+    """Histogram kept as plain data so it can live in the stats dict and the JSON report"""
+    return {'bounds': list(bounds), 'counts': [0] * (len(bounds) + 1), 'sum': 0.0, 'count': 0}
+
+def new_phase_histograms():
+    """One histogram of per-batch seconds for each phase"""
+    return {phase: new_histogram(PHASE_SECONDS_BUCKETS) for phase in PHASES}
+
+def observe(histogram, value):
+    """Record one observation"""
+    histogram['counts'][bisect_left(histogram['bounds'], value)] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+def _family(lines, name, metric_type, description, samples):
+    if not samples:
+        return
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in samples:
+        if metric_type == 'histogram':
+            cumulative = 0
+            for bound, count in zip(value['bounds'] + ['+Inf'], value['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+        else:
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+def render_metrics(stats, queue_depths=None):
+    """Render migration stats in the Prometheus text exposition format"""
+    tables = {table: table_stats for table, table_stats in stats.items()
+              if isinstance(table_stats, dict) and 'migrated_records' in table_stats}
+    lines = []
+
+    def per_table(key):
+        return [({'table': table}, table_stats[key]) for table, table_stats in tables.items() if key in table_stats]
+
+    _family(lines, 'magiya_source_rows', 'gauge', 'V1 rows to migrate', per_table('total_records'))
+    _family(lines, 'magiya_rows_read_total', 'counter', 'V1 rows read', per_table('rows_read'))
+    _family(lines, 'magiya_rows_transformed_total', 'counter', 'Rows transformed to the V2 format', per_table('rows_transformed'))
+    _family(lines, 'magiya_rows_written_total', 'counter', 'Rows written to V2', [
+        ({'table': table, 'result': result}, table_stats[key])
+        for table, table_stats in tables.items()
+        for result, key in [('inserted', 'migrated_records'), ('updated', 'updated_records'), ('skipped', 'skipped_records')]
+    ])
+    _family(lines, 'magiya_rows_failed_total', 'counter', 'Rows that could not be written', per_table('failed_records'))
+    _family(lines, 'magiya_rows_orphaned_total', 'counter', 'Rows whose parent row was not migrated', per_table('orphaned_records'))
+    _family(lines, 'magiya_duplicate_errors_total', 'counter', 'Unique-key violations by key', [
+        ({'table': table, 'key': key}, table_stats[f"duplicate_{key}_errors"])
+        for table, table_stats in tables.items()
+        for key in ['key', 'email', 'mobile'] if f"duplicate_{key}_errors" in table_stats
+    ])
+    _family(lines, 'magiya_v1_id_watermark', 'gauge', 'Highest V1 id of the last committed batch', per_table('last_v1_id'))
+    _family(lines, 'magiya_batch_duration_seconds', 'histogram', 'Time to migrate one batch', per_table('batch_seconds'))
+    _family(lines, 'magiya_phase_duration_seconds', 'histogram', 'Time per batch spent in each phase', [
+        ({'table': table, 'phase': phase}, histogram)
+        for table, table_stats in tables.items()
+        for phase, histogram in table_stats.get('phase_seconds', {}).items()
+    ])
+
+    users = tables.get('users', {})
+    _family(lines, 'magiya_role_assignments_total', 'counter', 'role_user assignments', [
+        ({'result': result}, users[f"role_assignments_{result}"])
+        for result in ['success', 'failed'] if f"role_assignments_{result}" in users
+    ])
+    _family(lines, 'magiya_queue_depth', 'gauge', 'Rows waiting in in-process queues',
+            [({'queue': queue}, depth) for queue, depth in (queue_depths or {}).items()])
+
+    cdc = stats.get('cdc')
+    if cdc:
+        _family(lines, 'magiya_cdc_replication_lag_seconds', 'gauge', 'Age of the last binlog event applied',
+                [({}, cdc['replication_lag_seconds'])])
+        _family(lines, 'magiya_cdc_events_total', 'counter', 'Binlog row events received', [({}, cdc['events_received'])])
+        _family(lines, 'magiya_cdc_rows_total', 'counter', 'Rows applied from the binlog', [
+            ({'action': 'upsert'}, cdc['rows_upserted']), ({'action': 'delete'}, cdc['rows_deleted'])
+        ])
+        _family(lines, 'magiya_cdc_deletes_skipped_total', 'counter', 'Binlog deletes not applied (no V1 key in V2)',
+                [({}, cdc.get('deletes_skipped', 0))])
+        _family(lines, 'magiya_cdc_batches_total', 'counter', 'Micro-batches applied', [({}, cdc['batches_applied'])])
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serve collect() on /metrics from a daemon thread"""
+
+    def __init__(self, collect, port, host='0.0.0.0'):
+        self.collect = collect
+        self.port = port
+        self.host = host
+        self.server = None
+
+    def start(self):
+        collect = self.collect
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = collect().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes are not worth a log line each
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -2,96 +2,142 @@ import mysql.connector
 from mysql.connector import Error
 import logging
 import json
+import os
+import time
+import cProfile
+import threading
+import pstats
 from datetime import datetime
 from tqdm import tqdm
 from colorama import init, Fore, Style
 import sys
 from collections import defaultdict
-import re
+from transforms import normalize_mobile
+from schema_cache import SchemaCache
+from rollback import MigrationRollback
+from run_manifest import RunManifest
+from shadow_tables import ShadowTableLoader
+from deferred_indexes import DeferredIndexBuild
+from duplicate_preflight import DuplicatePreflight, DUPLICATE_POLICIES
+from v2_snapshot import V2Snapshot
+from metrics import MetricsServer, PHASES, new_histogram, new_phase_histograms, observe, render_metrics
+from logging_setup import configure_logger, RunLog
+from table_mappings import load_mappings, dependency_order, TransformPlan, OrphanedReference, AmbiguousReference, Ref
+from table_scheduler import TableScheduler
 
 init(autoreset=True)
 
+_run_id_lock = threading.Lock()
+_last_run_id = None
+
+def new_run_id():
+    """Timestamp id of a run (microsecond resolution), never repeated within the process"""
+    global _last_run_id
+    with _run_id_lock:
+        run_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        while run_id == _last_run_id:
+            run_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        _last_run_id = run_id
+        return run_id
+
+def new_table_stats():
+    """Counters kept for every migrated table"""
+    return {
+        'total_records': 0,
+        'rows_read': 0,
+        'rows_transformed': 0,
+        'migrated_records': 0,
+        'skipped_records': 0,
+        'updated_records': 0,
+        'failed_records': 0,
+        'duplicate_key_errors': 0,
+        'orphaned_records': 0,
+        'filtered_at_source': 0,
+        'last_v1_id': 0,
+        'batch_seconds': new_histogram(),
+        'phase_seconds': new_phase_histograms(),
+        'warnings': []
+    }
+
 class MagiyaMigration:
     def __init__(self, config):
         self.config = config
         self.v1_conn = None
         self.v2_conn = None
         self.logger = self._setup_logger()
-        self.failed_records = {'users': [], 'addresses': []}
+        self.mappings = load_mappings(config)
+        self.failed_records = {name: [] for name in self.mappings}
         self.duplicate_emails = defaultdict(list)
         self.duplicate_mobiles = defaultdict(list)
-        self.id_mapping = {'users': {}, 'addresses': {}}  # Maps V1 IDs to V2 IDs
-        self.stats = {
-            'users': {
-                'total_records': 0,
-                'migrated_records': 0,
-                'skipped_records': 0,
-                'skipped_status_zero': 0,
-                'updated_records': 0,
-                'failed_records': 0,
-                'duplicate_key_errors': 0,
-                'duplicate_email_errors': 0,
-                'duplicate_mobile_errors': 0,
-                'mobile_conversions': 0,
-                'mobile_null_or_empty': 0,
-                'mobile_invalid': 0,
-                'role_assignments_success': 0,
-                'role_assignments_failed': 0,
-                'gender_conversions': {
-                    'M_to_Male': 0, 
-                    'F_to_Female': 0, 
-                    'null': 0, 
-                    'empty': 0,
-                    'unchanged': 0,
-                    'other_values': defaultdict(int)
-                },
-                'warnings': []
-            },
-            'addresses': {
-                'total_records': 0,
-                'migrated_records': 0,
-                'skipped_records': 0,
-                'updated_records': 0,
-                'failed_records': 0,
-                'duplicate_key_errors': 0,
-                'warnings': []
+        self.id_mapping = {name: {} for name in self.mappings}  # Maps V1 IDs to V2 IDs
+        self.stats = {name: new_table_stats() for name in self.mappings}
+        self.stats['users'].update({
+            'skipped_status_zero': 0,
+            'preflight_duplicates_skipped': 0,
+            'preflight_duplicates_rewritten': 0,
+            'duplicate_email_errors': 0,
+            'duplicate_mobile_errors': 0,
+            'mobile_conversions': 0,
+            'mobile_null_or_empty': 0,
+            'mobile_invalid': 0,
+            'role_assignments_success': 0,
+            'role_assignments_failed': 0,
+            'gender_conversions': {
+                'M_to_Male': 0, 
+                'F_to_Female': 0, 
+                'null': 0, 
+                'empty': 0,
+                'unchanged': 0,
+                'other_values': defaultdict(int)
             }
-        }
+        })
         self.migration_mode = 'insert'
         self.preserve_ids = True
         self.migrate_addresses = False
+        # Tables from TABLE_MAPPINGS_MODULE selected for this run
+        self.extra_tables = []
+        self.compact_rows = config.COMPACT_ROWS
+        self.v1_schema = None
+        self.v2_schema = None
+        self.plans = {}
+        self.projections = {}
+        # Per table: whether its V2 id-map column is indexed (see uses_id_map_store)
+        self.id_map_indexed = {}
+        # Set while a TableScheduler runs tables concurrently
+        self.scheduler = None
+        # Parent V1 -> V2 ids of the batch being transformed, per thread
+        self.reference_maps = threading.local()
+        self.run_id = new_run_id()
+        # Each run writes its own log file; the handlers behind self.logger are shared by the process
+        self.log_file = os.path.join(os.path.dirname(config.LOG_FILE), f"migration_{self.run_id}.log")
+        self.run_log = RunLog(self.logger, self.log_file, config)
+        self.manifest = None
+        # V2 tables written by this run (shadow copies when loading via shadow tables)
+        self.v2_tables = self.mapped_v2_tables()
+        self.shadow_loader = None
+        self.deferred_index_builds = {}
+        self.duplicate_preflight = None
+        self.snapshot = None
+        self.metrics_server = None
+        self.profile_batches_left = config.PROFILE_BATCHES
+        self.profiler = None
+        self.default_verified_at = datetime.strptime(self.config.DEFAULT_VERIFIED_TIMESTAMP, '%Y-%m-%d %H:%M:%S')
     
     def _setup_logger(self):
-        """Set up logging configuration"""
-        logger = logging.getLogger('MagiyaMigration')
-        logger.setLevel(getattr(logging, self.config.LOG_LEVEL))
-        
-        fh = logging.FileHandler(self.config.LOG_FILE)
-        fh.setLevel(logging.DEBUG)
-        
-        ch = logging.StreamHandler()
-        ch.setLevel(logging.INFO)
-        
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        fh.setFormatter(formatter)
-        ch.setFormatter(formatter)
-        
-        logger.addHandler(fh)
-        logger.addHandler(ch)
-        
-        return logger
+        """Set up logging configuration (once per process, see logging_setup)"""
+        return configure_logger('MagiyaMigration', self.config)
     
     def connect_databases(self):
         """Establish connections to both databases"""
         try:
             self.logger.info("Connecting to V1 database...")
             self.v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+            self.v1_schema = SchemaCache(self.v1_conn, self.config.V1_DATABASE)
             print(f"{Fore.GREEN}✓ Connected to V1 database")
             
             self.logger.info("Connecting to V2 database...")
             self.v2_conn = mysql.connector.connect(**self.config.V2_CONFIG)
+            self.v2_schema = SchemaCache(self.v2_conn, self.config.V2_DATABASE)
             print(f"{Fore.GREEN}✓ Connected to V2 database")
             
             return True
@@ -101,42 +147,46 @@ class MagiyaMigration:
             print(f"{Fore.RED}✗ Database connection failed: {e}")
             return False
     
+    def start_metrics_server(self):
+        """Expose self.stats on http://<host>:METRICS_PORT/metrics while the run is active (METRICS_PORT=0 disables it)"""
+        if not self.config.METRICS_PORT or self.metrics_server:
+            return
+        try:
+            self.metrics_server = MetricsServer(
+                lambda: render_metrics(self.stats, self.queue_depths()), self.config.METRICS_PORT, self.config.METRICS_HOST
+            ).start()
+            print(f"{Fore.CYAN}Metrics: http://{self.config.METRICS_HOST}:{self.config.METRICS_PORT}/metrics")
+        except OSError as e:
+            self.logger.warning(f"Metrics endpoint not started: {e}")
+            print(f"{Fore.YELLOW}⚠ Metrics endpoint not started: {e}")
+    
+    def queue_depths(self):
+        """Rows waiting in in-process queues, by queue name (child batches held by the table scheduler)"""
+        scheduler = self.scheduler
+        return scheduler.queue_depths() if scheduler else {}
+    
     def convert_mobile_number(self, mobile):
         """Convert mobile number to +94 format"""
-        if mobile is None:
-            self.stats['users']['mobile_null_or_empty'] += 1
-            return None
-            
-        mobile = str(mobile).strip()
+        value, outcome = normalize_mobile(mobile)
         
-        if not mobile or mobile == '':
+        if outcome == 'empty':
             self.stats['users']['mobile_null_or_empty'] += 1
             return None
         
-        mobile = re.sub(r'[\s\-\(\)]', '', mobile)
-        
-        if mobile.startswith('+94') and len(mobile) == 12:
-            return mobile
-        
-        mobile = re.sub(r'^\+94', '', mobile)
-        mobile = re.sub(r'^0094', '', mobile)
-        mobile = re.sub(r'^94', '', mobile)
-        
-        if mobile.startswith('0'):
-            mobile = mobile[1:]
-        
-        if not mobile or not mobile.isdigit():
+        if outcome == 'invalid_format':
             self.stats['users']['mobile_invalid'] += 1
-            self.logger.warning(f"Invalid mobile number format: {mobile}")
+            self.logger.warning("Invalid mobile number format: %s", value, extra={'category': 'invalid_mobile_format'})
             return None
         
-        if len(mobile) == 9:
-            self.stats['users']['mobile_conversions'] += 1
-            return f"+94{mobile}"
-        else:
+        if outcome == 'invalid_length':
             self.stats['users']['mobile_invalid'] += 1
-            self.logger.warning(f"Invalid mobile number length: {mobile} (length: {len(mobile)})")
+            self.logger.warning("Invalid mobile number length: %s (length: %d)", value, len(value),
+                                extra={'category': 'invalid_mobile_length'})
             return None
+        
+        if outcome == 'converted':
+            self.stats['users']['mobile_conversions'] += 1
+        return value
     
     def convert_gender(self, gender):
         """Convert gender values M/F to Male/Female"""
@@ -166,7 +216,7 @@ class MagiyaMigration:
             return 'Female'
         else:
             self.stats['users']['gender_conversions']['other_values'][gender_str] += 1
-            self.logger.warning(f"Unknown gender value: {gender_str}")
+            self.logger.warning("Unknown gender value: %s", gender_str, extra={'category': 'unknown_gender'})
             return gender_str
     
     def check_address_table_exists(self):
@@ -240,6 +290,7 @@ class MagiyaMigration:
             
             if choice == '1':
                 self.migrate_addresses = False
+                self.migrate_users = True
                 return True
             elif choice == '2':
                 self.migrate_addresses = True
@@ -260,6 +311,25 @@ class MagiyaMigration:
             print(f"{Fore.CYAN}Will migrate users table only")
             return True
     
+    def select_extra_tables(self):
+        """Offer the tables defined in TABLE_MAPPINGS_MODULE"""
+        extra = [name for name in self.mappings if name not in ('users', 'addresses')]
+        if not extra:
+            return
+        print(f"\n{Fore.CYAN}Additional mapped tables: {', '.join(extra)}")
+        answer = input("Tables to migrate as well (comma-separated, 'all' or empty for none): ").strip()
+        if answer.lower() == 'all':
+            self.extra_tables = extra
+        else:
+            self.extra_tables = [name.strip() for name in answer.split(',') if name.strip() in extra]
+    
+    def selected_tables(self):
+        """Table mappings selected for this run"""
+        tables = ['users'] if hasattr(self, 'migrate_users') and self.migrate_users else []
+        if self.migrate_addresses:
+            tables.append('addresses')
+        return tables + self.extra_tables
+    
     def analyze_existing_data(self):
         """Analyze existing data in V2 tables"""
         v2_cursor = self.v2_conn.cursor(dictionary=True)
@@ -307,10 +377,11 @@ class MagiyaMigration:
                 return self.select_id_strategy()
             elif choice == '2':
                 self.migration_mode = 'upsert'
-                return self.select_id_strategy()
+                return self.select_id_strategy() and self.offer_v2_snapshot(scoped=True)
             elif choice == '3':
                 confirm = input(f"\n{Fore.RED}⚠ This will DELETE all existing V2 data. Are you sure? (yes/no): ")
                 if confirm.lower() == 'yes':
+                    self.offer_v2_snapshot(scoped=False)
                     self.clear_v2_tables()
                     self.migration_mode = 'insert'
                     return self.select_id_strategy()
@@ -340,25 +411,280 @@ class MagiyaMigration:
             print(f"{Fore.RED}Invalid choice")
             return self.select_id_strategy()
     
-    def clear_v2_tables(self):
-        """Clear V2 tables"""
-        v2_cursor = self.v2_conn.cursor()
+    def select_duplicate_policy(self):
+        """Choose how V1 rows sharing an email/mobile are handled, then run the pre-flight scan"""
+        print(f"\n{Fore.CYAN}Select duplicate policy:")
+        print("1. Keep first occurrence (lowest V1 id), skip the rest")
+        print("2. Keep last occurrence (highest V1 id), skip the rest")
+        print("3. Migrate all, suffix duplicate emails with _DUP_<id> and clear duplicate mobiles")
+        print("4. Skip every row of a duplicate group")
         
-        if hasattr(self, 'migrate_users') and self.migrate_users:
-            v2_cursor.execute(f"DELETE FROM {self.config.V2_TABLE}")
-            v2_cursor.execute(f"ALTER TABLE {self.config.V2_TABLE} AUTO_INCREMENT = 1")
-            print(f"{Fore.GREEN}✓ V2 users table cleared")
+        if self.config.DUPLICATE_POLICY in DUPLICATE_POLICIES:
+            default = DUPLICATE_POLICIES.index(self.config.DUPLICATE_POLICY) + 1
+        else:
+            print(f"{Fore.YELLOW}⚠ Unknown DUPLICATE_POLICY '{self.config.DUPLICATE_POLICY}' - defaulting to {DUPLICATE_POLICIES[0]}")
+            default = 1
+        choice = input(f"\nEnter your choice (1-4) [{default}]: ") or str(default)
+        if choice not in ['1', '2', '3', '4']:
+            print(f"{Fore.RED}Invalid choice")
+            return self.select_duplicate_policy()
+        
+        self.run_duplicate_preflight(DUPLICATE_POLICIES[int(choice) - 1])
+    
+    def run_duplicate_preflight(self, policy):
+        """Scan V1 for email/mobile collisions and record the per-row decisions (reads V1 only)"""
+        self.duplicate_preflight = DuplicatePreflight(self.v1_conn, self.config, self.logger, policy).run()
+        for key, members in self.duplicate_preflight.groups['email'].items():
+            self.duplicate_emails[key].extend(members)
+        for key, members in self.duplicate_preflight.groups['mobile'].items():
+            self.duplicate_mobiles[key].extend(members)
+        report_file = self.duplicate_preflight.save_report(f"logs/preflight_duplicates_{self.run_id}.json")
+        print(f"  {Fore.CYAN}Duplicate groups saved to: {report_file}")
+    
+    def mapped_v2_tables(self):
+        """Live V2 table of every mapping, plus role_user"""
+        tables = {name: mapping['target'] for name, mapping in self.mappings.items()}
+        tables['role_user'] = 'role_user'
+        return tables
+    
+    def get_live_v2_tables(self):
+        """Live V2 tables this run writes to (children first)"""
+        tables = []
+        # References count as dependencies whatever the ID strategy: they are the V2 parent/child relations
+        for table_type in reversed(dependency_order(self.mappings, self.selected_tables(), preserve_ids=False)):
+            if table_type == 'users' and self.has_role_user_table:
+                tables.append('role_user')
+            tables.append(self.mappings[table_type]['target'])
+        return tables
+    
+    def use_shadow_tables(self, tables):
+        """Point all V2 writes of this run at the shadow copies of the given tables"""
+        self.shadow_loader = ShadowTableLoader(self.v2_conn, self.v2_schema, tables, self.logger)
+        for key, table in self.v2_tables.items():
+            if table in tables:
+                self.v2_tables[key] = ShadowTableLoader.shadow_name(table)
+    
+    def select_load_target(self):
+        """Offer loading into shadow tables with an atomic RENAME cutover (insert mode only)"""
+        print(f"\n{Fore.CYAN}Select load target:")
+        print("1. Live V2 tables")
+        print("2. Shadow tables (*__shadow), then atomic RENAME cutover")
+        print("3. Live V2 tables with deferred index build (empty tables only)")
+        
+        choice = input("\nEnter your choice (1-3): ")
+        if choice == '3':
+            return self.select_deferred_index_build()
+        if choice != '2':
+            return True
+        
+        tables = self.get_live_v2_tables()
+        loader = ShadowTableLoader(self.v2_conn, self.v2_schema, tables, self.logger)
+        blocking = loader.find_blocking_references()
+        if blocking:
+            print(f"{Fore.RED}⚠ Shadow load not possible - these foreign keys would follow the renamed tables:")
+            for referencing, table in blocking:
+                print(f"  - {referencing} → {table}")
+            return input("Continue with a live-table load instead? (yes/no): ").lower() == 'yes'
         
+        self.use_shadow_tables(tables)
+        return True
+    
+    def select_deferred_index_build(self):
+        """Drop secondary indexes on the (empty) target tables during the load"""
+        table_types = []
+        if hasattr(self, 'migrate_users') and self.migrate_users:
+            table_types.append('users')
         if self.migrate_addresses:
-            try:
-                v2_cursor.execute(f"DELETE FROM {self.config.V2_ADDRESS_TABLE}")
-                v2_cursor.execute(f"ALTER TABLE {self.config.V2_ADDRESS_TABLE} AUTO_INCREMENT = 1")
-                print(f"{Fore.GREEN}✓ V2 address table cleared")
-            except Exception as e:
-                self.logger.warning(f"Could not clear address table: {e}")
+            table_types.append('addresses')
         
-        self.v2_conn.commit()
-        v2_cursor.close()
+        v2_cursor = self.v2_conn.cursor()
+        try:
+            for table_type in table_types:
+                v2_cursor.execute(f"SELECT 1 FROM {self.v2_tables[table_type]} LIMIT 1")
+                if v2_cursor.fetchall():
+                    print(f"{Fore.RED}⚠ {self.v2_tables[table_type]} is not empty - deferred index build is only for empty tables")
+                    return input("Continue with a normal load instead? (yes/no): ").lower() == 'yes'
+        finally:
+            v2_cursor.close()
+        
+        for table_type in table_types:
+            build = DeferredIndexBuild(self.v2_conn, self.v2_schema, self.v2_tables[table_type], self.logger,
+                                       keep_columns=[self.get_plan(table_type).id_map_column] if self.get_plan(table_type).id_map_column else [])
+            build.indexes = build.droppable_indexes()
+            self.deferred_index_builds[table_type] = build
+        return True
+    
+    def resolve_post_load_duplicates(self, table_type, build):
+        """Remove rows that violate the deferred unique indexes and account for them as duplicate failures"""
+        unique_indexes = [index for index in build.indexes if index['unique']]
+        if not unique_indexes:
+            return
+        
+        print(f"{Fore.CYAN}Scanning {build.table} for unique-key violations...")
+        v2_cursor = self.v2_conn.cursor()
+        try:
+            # One index at a time: removing duplicates of one key can resolve groups of the next
+            for index in unique_indexes:
+                duplicates = build.find_duplicates(index)
+                if not duplicates:
+                    continue
+                
+                v1_records = self.fetch_v1_records(table_type, [self.v1_key_of(table_type, row) for row in duplicates])
+                for row in duplicates:
+                    value = '-'.join(str(row[col]) for col in index['columns'])
+                    if "email_unique" in index['name']:
+                        self.stats[table_type]['duplicate_email_errors'] += 1
+                        self.duplicate_emails[value].append(row.get('v1_id'))
+                    elif "mobile_unique" in index['name']:
+                        self.stats[table_type]['duplicate_mobile_errors'] += 1
+                        self.duplicate_mobiles[value].append(row.get('v1_id'))
+                    else:
+                        self.stats[table_type]['duplicate_key_errors'] += 1
+                    v1_id = self.v1_key_of(table_type, row)
+                    self.failed_records[table_type].append({
+                        'record': v1_records.get(v1_id, {'id': v1_id}),
+                        'error': f"Duplicate entry '{value}' for key '{index['name']}' (post-load scan)",
+                        'error_type': 'IntegrityError'
+                    })
+                
+                ids = [row['id'] for row in duplicates]
+                self.fail_orphaned_children(table_type, ids, [self.v1_key_of(table_type, row) for row in duplicates], v2_cursor)
+                for start in range(0, len(ids), self.config.BATCH_SIZE):
+                    chunk = ids[start:start + self.config.BATCH_SIZE]
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    if table_type == 'users' and self.has_role_user_table:
+                        v2_cursor.execute(f"DELETE FROM {self.v2_tables['role_user']} WHERE user_id IN ({placeholders})", chunk)
+                        self.stats['users']['role_assignments_success'] -= v2_cursor.rowcount
+                    v2_cursor.execute(f"DELETE FROM {build.table} WHERE id IN ({placeholders})", chunk)
+                    self.v2_conn.commit()
+                
+                self.stats[table_type]['migrated_records'] -= len(ids)
+                self.stats[table_type]['failed_records'] += len(ids)
+                print(f"  {Fore.YELLOW}⚠ {len(ids)} duplicate(s) on {index['name']} removed (kept the first row of each group)")
+        finally:
+            v2_cursor.close()
+    
+    def v1_key_of(self, table_type, v2_row):
+        """V1 key of a migrated V2 row (its id-map column, or the id itself when IDs are preserved)"""
+        plan = self.get_plan(table_type)
+        return v2_row.get(plan.id_map_column) if plan.id_map_column else v2_row.get(plan.key)
+    
+    def fetch_v1_records(self, table_type, v1_ids):
+        """V1 rows of a table by key, for failure reports"""
+        mapping = self.mappings[table_type]
+        ids = [v1_id for v1_id in v1_ids if v1_id is not None]
+        records = {}
+        v1_cursor = self.v1_conn.cursor(dictionary=True)
+        try:
+            for start in range(0, len(ids), self.config.BATCH_SIZE):
+                chunk = ids[start:start + self.config.BATCH_SIZE]
+                v1_cursor.execute(f"SELECT * FROM {mapping['source']} WHERE `{mapping['key']}` IN ({', '.join(['%s'] * len(chunk))})", chunk)
+                records.update({record[mapping['key']]: record for record in v1_cursor.fetchall()})
+        finally:
+            v1_cursor.close()
+        return records
+    
+    def fail_orphaned_children(self, parent, v2_ids, v1_ids, v2_cursor):
+        """Delete the loaded child rows that reference parent rows about to be removed, and report them as orphaned"""
+        for child in self.selected_tables():
+            if child == parent:
+                continue
+            plan = self.get_plan(child)
+            for column, spec in plan.specs.items():
+                if not (isinstance(spec, Ref) and spec.parent == parent):
+                    continue
+                mapping = self.mappings[child]
+                v1_cursor = self.v1_conn.cursor(dictionary=True)
+                try:
+                    for start in range(0, len(v1_ids), self.config.BATCH_SIZE):
+                        chunk = [v1_id for v1_id in v1_ids[start:start + self.config.BATCH_SIZE] if v1_id is not None]
+                        if not chunk:
+                            continue
+                        v1_cursor.execute(f"""
+                            SELECT * FROM {mapping['source']}
+                            WHERE `{spec.column}` IN ({', '.join(['%s'] * len(chunk))}) AND {self.source_filter(child)}
+                        """, chunk)
+                        for record in v1_cursor.fetchall():
+                            error = OrphanedReference(parent, record[spec.column])
+                            self.failed_records[child].append({'record': record, 'error': f"{error} (removed as a duplicate)",
+                                                               'error_type': 'OrphanedReference'})
+                            self.stats[child]['orphaned_records'] += 1
+                            self.stats[child]['failed_records'] += 1
+                finally:
+                    v1_cursor.close()
+                
+                removed = 0
+                for start in range(0, len(v2_ids), self.config.BATCH_SIZE):
+                    chunk = v2_ids[start:start + self.config.BATCH_SIZE]
+                    v2_cursor.execute(f"DELETE FROM {self.v2_tables[child]} WHERE `{column}` IN ({', '.join(['%s'] * len(chunk))})", chunk)
+                    removed += v2_cursor.rowcount
+                self.stats[child]['migrated_records'] -= removed
+                if removed:
+                    print(f"  {Fore.YELLOW}⚠ {removed} {child} row(s) referencing removed {parent} duplicates deleted")
+    
+    def cutover_shadow_tables(self):
+        """Ask for and perform the shadow-table cutover"""
+        print(f"\n{Fore.CYAN}Shadow tables are loaded: {', '.join(self.shadow_loader.shadow_name(t) for t in self.shadow_loader.tables)}")
+        if input("Cut over now with RENAME TABLE? (yes/no): ").lower() != 'yes':
+            print(f"{Fore.YELLOW}Cutover skipped - shadow tables left in place")
+            return
+        self.shadow_loader.cutover()
+        self.v2_tables = self.mapped_v2_tables()
+    
+    def get_snapshot_scopes(self, scoped):
+        """(table, key column, key range) per live V2 table, children first.
+        
+        With preserved IDs an upsert can only touch V2 ids inside the V1 id range, so
+        the snapshot is limited to that range; otherwise whole tables are copied.
+        Tables with other unique keys (users: email, mobile) are copied whole as well,
+        since ON DUPLICATE KEY UPDATE can match and overwrite rows outside the range.
+        """
+        ranges = {}
+        if scoped and self.preserve_ids:
+            v1_cursor = self.v1_conn.cursor()
+            for table_type in self.selected_tables():
+                mapping = self.mappings[table_type]
+                unique_keys = [index['name'] for index in self.v2_schema.get_indexes(self.v2_tables[table_type]) if index['unique']]
+                if unique_keys:
+                    print(f"{Fore.YELLOW}⚠ {self.v2_tables[table_type]} has unique keys besides its id "
+                          f"({', '.join(unique_keys)}) - snapshotting the whole table")
+                    continue
+                v1_cursor.execute(f"SELECT MIN(`{mapping['key']}`), MAX(`{mapping['key']}`) FROM {mapping['source']}")
+                low, high = v1_cursor.fetchone()
+                ranges[table_type] = [low, high] if low is not None else None
+            v1_cursor.close()
+        
+        table_types = {mapping['target']: table_type for table_type, mapping in self.mappings.items()}
+        scopes = []
+        for table in self.get_live_v2_tables():
+            if table == 'role_user':
+                scopes.append((table, 'user_id', ranges.get('users')))
+            else:
+                table_type = table_types[table]
+                scopes.append((table, self.mappings[table_type]['key'], ranges.get(table_type)))
+        return scopes
+    
+    def offer_v2_snapshot(self, scoped):
+        """Offer a snapshot of the V2 rows this run can overwrite or delete, restorable from the rollback menu"""
+        what = "rows the upsert can touch" if scoped and self.preserve_ids else "tables"
+        if input(f"\nSnapshot the affected V2 {what} first (restorable via rollback)? (yes/no): ").lower() != 'yes':
+            return True
+        
+        print(f"\n{Fore.CYAN}Creating V2 snapshot...")
+        self.snapshot = V2Snapshot.create(self.v2_conn, self.config, self.get_snapshot_scopes(scoped), self.logger,
+                                          snapshot_id=self.run_id)
+        print(f"{Fore.CYAN}Snapshot saved: {self.snapshot.path}")
+        return True
+    
+    def clear_v2_tables(self):
+        """Clear V2 tables with TRUNCATE (role assignments of cleared users go with them)"""
+        tables = self.get_live_v2_tables()
+        
+        try:
+            MigrationRollback(self.config).truncate_tables(self.v2_conn, tables)
+        except Exception as e:
+            self.logger.error(f"Could not clear V2 tables: {e}")
+            raise
     
     def pre_migration_checks(self):
         """Perform pre-migration validation checks"""
@@ -366,59 +692,76 @@ class MagiyaMigration:
         
         if not self.select_tables_to_migrate():
             return False
+        self.select_extra_tables()
         
         v1_cursor = self.v1_conn.cursor(dictionary=True)
         
         if hasattr(self, 'migrate_users') and self.migrate_users:
-            v1_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V1_TABLE}")
-            total = v1_cursor.fetchone()['count']
-            self.stats['users']['total_records'] = total
+            # One scan for every pre-flight statistic: per gender, all rows, rows passing the
+            # source filter, status=0 rows left to skip in Python and mobiles to convert
+            kept = self.source_filter('users')
+            v1_cursor.execute(f"""
+                SELECT CASE WHEN gender IS NULL THEN 'NULL' WHEN gender = '' THEN 'EMPTY' ELSE gender END as gender_value,
+                COUNT(*) as total,
+                SUM(CASE WHEN {kept} THEN 1 ELSE 0 END) as kept,
+                SUM(CASE WHEN {kept} AND status = 0 THEN 1 ELSE 0 END) as status_zero,
+                SUM(CASE WHEN {kept} AND (status IS NULL OR status != 0) AND mobile IS NOT NULL AND mobile != '' AND mobile NOT LIKE '+94%' THEN 1 ELSE 0 END) as mobile_converts
+                FROM {self.mappings['users']['source']} WHERE `{self.mappings['users']['key']}` > 0
+                GROUP BY gender_value ORDER BY kept DESC
+            """)
+            gender_stats = v1_cursor.fetchall()
+            total = sum(int(stat['total']) for stat in gender_stats)
+            kept_count = sum(int(stat['kept']) for stat in gender_stats)
+            status_zero_count = sum(int(stat['status_zero']) for stat in gender_stats)
+            mobile_converts = sum(int(stat['mobile_converts']) for stat in gender_stats)
+            self.stats['users']['total_records'] = kept_count
+            self.stats['users']['filtered_at_source'] = total - kept_count
             print(f"\n{Fore.CYAN}Users table:")
             print(f"  Total records in V1: {Fore.YELLOW}{total}")
             
-            v1_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V1_TABLE} WHERE status = 0")
-            status_zero_count = v1_cursor.fetchone()['count']
+            if total > kept_count:
+                print(f"  {Fore.YELLOW}⚠ {total - kept_count} records excluded by the V1 filter ({self.mappings['users']['filter']}) will not be read")
             if status_zero_count > 0:
                 print(f"  {Fore.YELLOW}⚠ {status_zero_count} records with status=0 will be skipped")
             
-            actual_migration_count = total - status_zero_count
+            actual_migration_count = kept_count - status_zero_count
             print(f"  Records to actually migrate: {Fore.GREEN}{actual_migration_count}")
             
-            v1_cursor.execute(f"""
-                SELECT COUNT(*) as count FROM {self.config.V1_TABLE} 
-                WHERE mobile IS NOT NULL AND mobile != '' AND mobile NOT LIKE '+94%' AND status != 0
-            """)
-            mobile_converts = v1_cursor.fetchone()['count']
             if mobile_converts > 0:
                 print(f"  {Fore.CYAN}ℹ {mobile_converts} mobile numbers will be converted to +94 format")
             
-            v1_cursor.execute(f"""
-                SELECT CASE WHEN gender IS NULL THEN 'NULL' WHEN gender = '' THEN 'EMPTY' ELSE gender END as gender_value,
-                COUNT(*) as count FROM {self.config.V1_TABLE} WHERE status != 0 GROUP BY gender_value ORDER BY count DESC
-            """)
-            gender_stats = v1_cursor.fetchall()
-            
-            print(f"  {Fore.CYAN}Gender distribution (excluding status=0):")
+            print(f"  {Fore.CYAN}Gender distribution (excluding skipped records):")
             for stat in gender_stats:
-                print(f"    - {stat['gender_value']}: {stat['count']} records")
+                if int(stat['kept']) - int(stat['status_zero']) > 0:
+                    print(f"    - {stat['gender_value']}: {int(stat['kept']) - int(stat['status_zero'])} records")
             
             if self.has_role_user_table:
                 print(f"  {Fore.CYAN}ℹ Users will be assigned role_id=10 in role_user table")
             else:
                 print(f"  {Fore.YELLOW}⚠ role_user table not found - no role assignments will be made")
+            
+            if input("\nRun pre-flight duplicate detection on emails/mobiles? (yes/no): ").lower() == 'yes':
+                self.select_duplicate_policy()
         
         if self.migrate_addresses:
-            v1_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V1_ADDRESS_TABLE}")
-            total_addresses = v1_cursor.fetchone()['count']
-            self.stats['addresses']['total_records'] = total_addresses
+            total_addresses = self.count_source_rows('addresses')
             print(f"\n{Fore.CYAN}Address table:")
             print(f"  Total records to migrate: {Fore.YELLOW}{total_addresses}")
+            if self.stats['addresses']['filtered_at_source'] > 0:
+                print(f"  {Fore.YELLOW}⚠ {self.stats['addresses']['filtered_at_source']} records excluded by the V1 filter will not be read")
             
             if self.preserve_ids:
                 v1_cursor.execute(f"SELECT COUNT(DISTINCT user_id) as unique_users FROM {self.config.V1_ADDRESS_TABLE} WHERE user_id IS NOT NULL")
                 unique_users = v1_cursor.fetchone()['unique_users']
                 print(f"  Addresses linked to {unique_users} unique users")
         
+        for table_type in self.extra_tables:
+            self.count_source_rows(table_type)
+            print(f"\n{Fore.CYAN}{table_type} table:")
+            print(f"  Total records to migrate: {Fore.YELLOW}{self.stats[table_type]['total_records']}")
+            if self.stats[table_type]['filtered_at_source'] > 0:
+                print(f"  {Fore.YELLOW}⚠ {self.stats[table_type]['filtered_at_source']} records excluded by the V1 filter will not be read")
+        
         v1_cursor.close()
         
         existing_data = self.analyze_existing_data()
@@ -427,14 +770,27 @@ class MagiyaMigration:
         if not self.select_migration_strategy(has_existing_data=has_existing):
             return False
         
+        if self.migration_mode == 'insert' and not self.select_load_target():
+            return False
+        
         print(f"\n{Fore.CYAN}Migration settings:")
         if hasattr(self, 'migrate_users') and self.migrate_users:
-            actual_migration_count = self.stats['users']['total_records'] - self.stats['users'].get('skipped_status_zero_pre', status_zero_count)
-            print(f"  - Users table: {actual_migration_count} records (skipping {status_zero_count} with status=0)")
+            print(f"  - Users table: {actual_migration_count} records (skipping {total - actual_migration_count} inactive or filtered)")
         if self.migrate_addresses:
             print(f"  - Address table: {self.stats['addresses']['total_records']} records")
+        for table_type in self.extra_tables:
+            print(f"  - {table_type} table: {self.stats[table_type]['total_records']} records")
         print(f"  - Migration mode: {self.migration_mode.upper()}")
         print(f"  - ID handling: {'Preserve original' if self.preserve_ids else 'Auto-increment'}")
+        if self.shadow_loader:
+            print(f"  - Load target: shadow tables ({', '.join(self.shadow_loader.tables)}), RENAME cutover afterwards")
+        if self.snapshot:
+            print(f"  - V2 snapshot: {self.snapshot.snapshot_id} ({', '.join(t['snapshot_table'] for t in self.snapshot.meta['tables'])})")
+        if self.duplicate_preflight:
+            print(f"  - Pre-flight duplicates: {self.duplicate_preflight.policy} "
+                  f"({len(self.duplicate_preflight.skip_ids)} skipped, {len(self.duplicate_preflight.overrides)} rewritten)")
+        for build in self.deferred_index_builds.values():
+            print(f"  - Deferred indexes on {build.table}: {', '.join(i['name'] for i in build.indexes) or 'none'}")
         if hasattr(self, 'migrate_users') and self.migrate_users:
             print(f"  - Mobile format: Convert to +94")
             print(f"  - Gender format: M→Male, F→Female")
@@ -444,109 +800,186 @@ class MagiyaMigration:
         response = input("\nContinue with migration? (yes/no): ").lower()
         return response == 'yes'
 
-    def transform_user_record(self, record):
-        """Transform a V1 user record to V2 format, including address JSON conversion."""
+    def source_filter(self, table_type):
+        """SQL condition a V1 row must meet to be read ('1' when the mapping has no filter)"""
+        row_filter = self.mappings[table_type].get('filter')
+        return f"({row_filter})" if row_filter else '1'
+    
+    def count_source_rows(self, table_type, start_after_id=0):
+        """Count the rows of a V1 table after start_after_id, and those the source filter excludes, in one query.
+        
+        Sets total_records (rows that will be read) and filtered_at_source; returns total_records.
+        """
+        key = self.mappings[table_type]['key']
+        v1_cursor = self.v1_conn.cursor()
+        v1_cursor.execute(f"""
+            SELECT COUNT(*), SUM(CASE WHEN {self.source_filter(table_type)} THEN 1 ELSE 0 END)
+            FROM {self.mappings[table_type]['source']} WHERE `{key}` > %s
+        """, (start_after_id,))
+        total, kept = v1_cursor.fetchone()
+        v1_cursor.close()
+        self.stats[table_type]['total_records'] = int(kept or 0)
+        self.stats[table_type]['filtered_at_source'] = total - int(kept or 0)
+        return self.stats[table_type]['total_records']
+    
+    def full_name(self, firstname, lastname, v1_id):
+        """Combine V1 first and last name (User_<id> when both are empty)"""
+        firstname = (firstname or '').strip()
+        lastname = (lastname or '').strip()
+        return f"{firstname} {lastname}".strip() or f"User_{v1_id}"
+    
+    def email_verified_timestamp(self, ev):
+        """Convert the V1 email verified flag to a timestamp"""
+        return self.default_verified_at if ev == 1 else None
+    
+    def address_string(self, address_json, v1_id):
+        """Flatten the V1 address JSON to 'address,city,zip,state,country'"""
+        if not address_json:
+            return None
         try:
-            # Combine names
-            firstname = (record.get('firstname') or '').strip()
-            lastname = (record.get('lastname') or '').strip()
-            name = f"{firstname} {lastname}".strip() or f"User_{record['id']}"
-
-            # Convert email verified flag to timestamp
-            email_verified_at = datetime.strptime(self.config.DEFAULT_VERIFIED_TIMESTAMP, '%Y-%m-%d %H:%M:%S') if record.get('ev') == 1 else None
-
-            # Convert mobile number
-            mobile = self.convert_mobile_number(record.get('mobile'))
-
-            # Convert gender
-            gender = self.convert_gender(record.get('gender'))
-
-            # Round balance
-            balance = round(float(record.get('balance', 0)), 2)
-
-            # --- Address Transformation ---
-            address_str = None
-            address_json = record.get('address')
-            if address_json:
-                try:
-                    address_data = json.loads(address_json)
-                    part_order = ['address', 'city', 'zip', 'state', 'country']
-                    address_parts = []
-                    for key in part_order:
-                        value = address_data.get(key)
-                        if value is not None:
-                            # Convert to string, strip whitespace, and replace double quotes with single quotes
-                            value_str = str(value).strip().replace('"', "'")
-                            if value_str:
-                                address_parts.append(value_str)
-                    if address_parts:
-                        address_str = ','.join(address_parts)
-                except (json.JSONDecodeError, TypeError):
-                    self.logger.warning(f"Could not parse address JSON for user record {record['id']}. Using raw value. Value: {address_json}")
-                    # If JSON parsing fails, use the raw value and replace double quotes
-                    if isinstance(address_json, str):
-                        address_str = address_json.replace('"', "'")
-
-            result = {
-                'operator_id': None,
-                'name': name,
-                'email': record.get('email'),
-                'email_verified_at': email_verified_at,
-                'password': record.get('password'),
-                'two_factor_secret': None,
-                'two_factor_recovery_codes': None,
-                'two_factor_confirmed_at': None,
-                'mobile': mobile,
-                'gender': gender,
-                'city_id': record.get('city_id'),
-                'address': address_str,  # Use the transformed address string
-                'privacy_policy': None,
-                'terms_of_service': None,
-                'postal_code': None,
-                'balance': balance,
-                'remember_token': record.get('remember_token'),
-                'current_team_id': None,
-                'profile_photo_path': None,
-                'keycard': record.get('rfid_key'),
-                'otp': record.get('ver_code'),
-                'otp_generated_at': record.get('ver_code_send_at'),
-                'public': record.get('public', 0),
-                'status': record.get('status', 1),
-                'created_by': None,
-                'updated_by': None,
-                'created_at': record.get('created_at'),
-                'updated_at': record.get('updated_at'),
-                'otp_verified': 0,
-                'v1_id': record['id']
-            }
-            
-            if self.preserve_ids:
-                result['id'] = record['id']
-            
-            return result
-            
+            address_data = json.loads(address_json)
+            part_order = ['address', 'city', 'zip', 'state', 'country']
+            address_parts = []
+            for key in part_order:
+                value = address_data.get(key)
+                if value is not None:
+                    # Convert to string, strip whitespace, and replace double quotes with single quotes
+                    value_str = str(value).strip().replace('"', "'")
+                    if value_str:
+                        address_parts.append(value_str)
+            if address_parts:
+                return ','.join(address_parts)
+        except (json.JSONDecodeError, TypeError):
+            self.logger.warning("Could not parse address JSON for user record %s. Using raw value. Value: %s",
+                                v1_id, address_json, extra={'category': 'address_json'})
+            # If JSON parsing fails, use the raw value and replace double quotes
+            if isinstance(address_json, str):
+                return address_json.replace('"', "'")
+        return None
+    
+    def resolve_references(self, table_type, records, v2_conn):
+        """Look up the V2 ids of all parent rows a batch references, with one query per parent.
+        
+        The ID-map store is the parent's V2 table itself (its indexed v1_id column), so
+        only the ids of the current batch are held in memory. Parents without such a
+        column or index fall back to the ids recorded in memory (see uses_id_map_store).
+        A V1 id held by several V2 rows is resolved to all of them and reported as
+        ambiguous by remap_reference.
+        """
+        maps = {}
+        if not self.preserve_ids:
+            v2_cursor = v2_conn.cursor()
+            try:
+                for column, parent in self.get_plan(table_type).references:
+                    ids = list({record.get(column) for record in records} - {None})
+                    found = maps.setdefault(parent, {})
+                    parent_plan = self.get_plan(parent)
+                    if not ids:
+                        continue
+                    if self.uses_id_map_store(parent):
+                        placeholders = ', '.join(['%s'] * len(ids))
+                        v2_cursor.execute(f"""
+                            SELECT {parent_plan.id_map_column}, {parent_plan.key} FROM {self.v2_tables[parent]}
+                            WHERE {parent_plan.id_map_column} IN ({placeholders})
+                        """, ids)
+                        for v1_id, v2_id in v2_cursor.fetchall():
+                            if v1_id in found:
+                                # Tuples mark ambiguous ids
+                                previous = found[v1_id] if isinstance(found[v1_id], tuple) else (found[v1_id],)
+                                found[v1_id] = previous + (v2_id,)
+                            else:
+                                found[v1_id] = v2_id
+                    else:
+                        found.update({v1_id: self.id_mapping[parent][v1_id] for v1_id in ids if v1_id in self.id_mapping[parent]})
+            finally:
+                v2_cursor.close()
+        self.reference_maps.current = maps
+    
+    def remap_reference(self, parent, v1_id):
+        """V2 id of a parent row migrated with auto-increment IDs (resolved for the batch by resolve_references)"""
+        if v1_id is None:
+            return None
+        v2_id = getattr(self.reference_maps, 'current', {}).get(parent, {}).get(v1_id)
+        if v2_id is None:
+            raise OrphanedReference(parent, v1_id)
+        if isinstance(v2_id, tuple):
+            raise AmbiguousReference(parent, v1_id, v2_id)
+        return v2_id
+    
+    def uses_id_map_store(self, table_type):
+        """Whether child batches look up this table's V2 ids in V2 (needs an indexed id-map column).
+        
+        Otherwise the V1 -> V2 ids are kept in memory while the table is migrated,
+        since every lookup would scan the whole V2 table.
+        """
+        if table_type not in self.id_map_indexed:
+            column = self.get_plan(table_type).id_map_column
+            indexed = bool(column) and any(index['columns'][:1] == [column]
+                                           for index in self.v2_schema.get_indexes(self.v2_tables[table_type]))
+            if column and not indexed:
+                self.logger.warning("%s.%s is not indexed; keeping the V1 -> V2 id mapping of %s in memory",
+                                    self.v2_tables[table_type], column, table_type)
+            self.id_map_indexed[table_type] = indexed
+        return self.id_map_indexed[table_type]
+    
+    def get_plan(self, table_type):
+        """Transform plan of a table for the current ID strategy (compiled once per strategy)"""
+        key = (table_type, self.preserve_ids)
+        if key not in self.plans:
+            self.plans[key] = TransformPlan(self.mappings[table_type], self)
+        return self.plans[key]
+    
+    def source_projection(self, table_type):
+        """V1 columns to select for a table, in schema order: what its transform plan reads.
+        
+        Columns the plan reads but the cached V1 schema lacks are transformed as
+        missing (None or the Copy default); with STRICT_SOURCE_COLUMNS they are an error.
+        """
+        key = (table_type, self.preserve_ids)
+        if key not in self.projections:
+            source_table = self.mappings[table_type]['source']
+            available = self.v1_schema.get_columns(source_table)
+            needed = self.get_plan(table_type).read_columns
+            missing = [column for column in needed if column not in available]
+            if missing and self.config.STRICT_SOURCE_COLUMNS:
+                raise ValueError(f"V1 table {source_table} has no column(s) {', '.join(missing)} required by the {table_type} mapping")
+            if missing:
+                self.logger.warning("V1 table %s has no column(s) %s; they are migrated as missing values",
+                                    source_table, ', '.join(missing))
+            self.projections[key] = [column for column in available if column in needed]
+        return self.projections[key]
+    
+    def transform_record(self, table_type, record):
+        """Transform a V1 record to the V2 row of its table mapping"""
+        try:
+            return self.make_output_row(table_type, self.get_plan(table_type).transform(record))
+        except OrphanedReference as e:
+            self.logger.warning("Orphaned %s record %s: %s", table_type, record.get('id', 'unknown'), e,
+                                extra={'category': 'ambiguous_reference' if isinstance(e, AmbiguousReference) else 'orphaned_reference'})
+            raise
         except Exception as e:
-            self.logger.error(f"Error transforming user record {record['id']}: {e}")
+            self.logger.error("Error transforming %s record %s: %s", table_type, record.get('id', 'unknown'), e,
+                              extra={'category': 'transform_error'})
             raise
     
+    def transform_user_record(self, record):
+        """Transform a V1 user record to V2 format, including address JSON conversion."""
+        return self.transform_record('users', record)
+    
     def transform_address_record(self, record):
         """Transform a V1 address record to V2 format"""
-        try:
-            result = dict(record)
-            result['v1_id'] = record.get('id')
-            
-            if not self.preserve_ids and 'user_id' in record and record['user_id'] in self.id_mapping['users']:
-                result['user_id'] = self.id_mapping['users'][record['user_id']]
-                self.logger.debug(f"Updated address user_id: {record['user_id']} -> {result['user_id']}")
-            
-            if not self.preserve_ids and 'id' in result:
-                del result['id']
-            
-            return result
-            
-        except Exception as e:
-            self.logger.error(f"Error transforming address record {record.get('id', 'unknown')}: {e}")
-            raise
+        return self.transform_record('addresses', record)
+    
+    def make_output_row(self, table_type, values):
+        """Wrap positional V2 values as a compact row (or a dict when compact rows are disabled)"""
+        row_type = self.get_output_row_type(table_type)
+        if self.compact_rows:
+            return row_type._make(values)
+        return dict(zip(row_type.columns, values))
+    
+    def get_output_row_type(self, table_type):
+        """V2 row type for a table's insert columns (depends on the ID strategy)"""
+        return self.get_plan(table_type).row_type
     
     def verify_role_user_table_structure(self):
         """Verify role_user table structure"""
@@ -591,90 +1024,84 @@ class MagiyaMigration:
             return
         
         try:
-            insert_role_query = "INSERT IGNORE INTO role_user (user_id, role_id, created_at, updated_at) VALUES (%s, 10, NOW(), NOW())"
+            insert_role_query = f"INSERT IGNORE INTO {self.v2_tables['role_user']} (user_id, role_id, created_at, updated_at) VALUES (%s, 10, NOW(), NOW())"
             
-            self.logger.debug(f"Attempting to insert role for user_id={user_id}, role_id=10")
+            self.logger.debug("Attempting to insert role for user_id=%s, role_id=10", user_id)
             cursor.execute(insert_role_query, (user_id,))
             rows_affected = cursor.rowcount
             
             if rows_affected > 0:
                 self.stats['users']['role_assignments_success'] += 1
-                self.logger.info(f"✓ Role assigned: user_id={user_id} (V1_ID={v1_id}) -> role_id=10")
+                self.logger.debug("✓ Role assigned: user_id=%s (V1_ID=%s) -> role_id=10", user_id, v1_id)
             else:
-                self.logger.debug(f"Role already exists for user_id {user_id} (V1 ID: {v1_id})")
+                self.logger.debug("Role already exists for user_id %s (V1 ID: %s)", user_id, v1_id)
             
         except Exception as e:
             self.stats['users']['role_assignments_failed'] += 1
-            self.logger.error(f"✗ Failed to assign role for user_id {user_id} (V1 ID: {v1_id}): {e}")
+            self.logger.error("✗ Failed to assign role for user_id %s (V1 ID: %s): %s", user_id, v1_id, e,
+                              extra={'category': 'role_assignment'})
     
     def build_migration_query(self, table_type='users'):
-        """Build the appropriate migration query based on mode and table type"""
-        if table_type == 'users':
-            return self.build_users_migration_query()
-        else:
-            return self.build_address_migration_query()
-    
-    def build_users_migration_query(self):
-        """Build users table migration query"""
-        columns_list = [
-            'operator_id', 'name', 'email', 'email_verified_at', 'password',
-            'two_factor_secret', 'two_factor_recovery_codes', 'two_factor_confirmed_at',
-            'mobile', 'gender', 'city_id', 'address', 'privacy_policy', 'terms_of_service',
-            'postal_code', 'balance', 'remember_token', 'current_team_id', 
-            'profile_photo_path', 'keycard', 'otp', 'otp_generated_at', 'public', 
-            'status', 'created_by', 'updated_by', 'created_at', 'updated_at', 'otp_verified'
-        ]
-        if self.preserve_ids:
-            columns_list.insert(0, 'id')
-            
-        base_columns = ", ".join(columns_list)
-        value_placeholders = ", ".join([f"%({col})s" for col in columns_list])
+        """Build the insert query of a table for the migration mode"""
+        plan = self.get_plan(table_type)
+        base_columns = ", ".join(plan.columns)
+        value_placeholders = self.get_value_placeholders(plan.columns)
         
         if self.migration_mode == 'skip':
-            return f"INSERT IGNORE INTO {self.config.V2_TABLE} ({base_columns}) VALUES ({value_placeholders})"
+            return f"INSERT IGNORE INTO {self.v2_tables[table_type]} ({base_columns}) VALUES ({value_placeholders})"
         elif self.migration_mode == 'upsert':
-            update_clause = ", ".join([f"{col} = VALUES({col})" for col in columns_list if col != 'id'])
-            return f"INSERT INTO {self.config.V2_TABLE} ({base_columns}) VALUES ({value_placeholders}) ON DUPLICATE KEY UPDATE {update_clause}"
+            update_clause = ", ".join([f"{col} = VALUES({col})" for col in plan.columns if col not in plan.update_exclude])
+            return f"INSERT INTO {self.v2_tables[table_type]} ({base_columns}) VALUES ({value_placeholders}) ON DUPLICATE KEY UPDATE {update_clause}"
         else:
-            return f"INSERT INTO {self.config.V2_TABLE} ({base_columns}) VALUES ({value_placeholders})"
+            return f"INSERT INTO {self.v2_tables[table_type]} ({base_columns}) VALUES ({value_placeholders})"
     
-    def build_address_migration_query(self):
-        """Build dynamic address table migration query"""
-        v1_cursor = self.v1_conn.cursor()
-        v1_cursor.execute(f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s", (self.config.V1_DATABASE, self.config.V1_ADDRESS_TABLE))
-        columns = [row[0] for row in v1_cursor.fetchall()]
-        v1_cursor.close()
-        
-        if not self.preserve_ids and 'id' in columns:
-            columns.remove('id')
-        
-        base_columns = ', '.join(columns)
-        value_placeholders = ', '.join([f'%({col})s' for col in columns])
-        
-        if self.migration_mode == 'skip':
-            return f"INSERT IGNORE INTO {self.config.V2_ADDRESS_TABLE} ({base_columns}) VALUES ({value_placeholders})"
-        elif self.migration_mode == 'upsert':
-            update_cols = [f"{col} = VALUES({col})" for col in columns if col not in ['id', 'user_id']]
-            update_clause = ', '.join(update_cols)
-            return f"INSERT INTO {self.config.V2_ADDRESS_TABLE} ({base_columns}) VALUES ({value_placeholders}) ON DUPLICATE KEY UPDATE {update_clause}"
-        else:
-            return f"INSERT INTO {self.config.V2_ADDRESS_TABLE} ({base_columns}) VALUES ({value_placeholders})"
+    def get_value_placeholders(self, columns):
+        """Positional placeholders for compact rows, named placeholders for dict rows"""
+        if self.compact_rows:
+            return ", ".join(["%s"] * len(columns))
+        return ", ".join([f"%({col})s" for col in columns])
     
-    def migrate_batch(self, records, table_type='users'):
-        """Migrate a batch of records"""
-        v2_cursor = self.v2_conn.cursor()
+    def migrate_batch(self, records, table_type='users', v2_conn=None):
+        """Migrate a batch of records (on v2_conn when a scheduler worker passes its own connection)"""
+        v2_conn = v2_conn or self.v2_conn
+        v2_cursor = v2_conn.cursor()
         insert_query = self.build_migration_query(table_type)
+        plan = self.get_plan(table_type)
+        key, after_insert = plan.key, plan.after_insert
         success_count = 0
+        inserted_ids = []
+        updated_ids = []
+        batch_started = time.monotonic()
+        clock = time.perf_counter
+        phase_totals = {'transform': 0.0, 'execute': 0.0, 'commit': 0.0}
+        self.stats[table_type]['rows_read'] += len(records)
         
         try:
+            phase_started = clock()
+            self.resolve_references(table_type, records, v2_conn)
+            phase_totals['transform'] += clock() - phase_started
+            
             for record in records:
                 try:
                     if table_type == 'users' and record.get('status') == 0:
                         self.stats['users']['skipped_status_zero'] += 1
-                        self.logger.debug(f"Skipped user record {record['id']} with status=0")
+                        self.logger.debug("Skipped user record %s with status=0", record[key])
+                        continue
+                    
+                    if table_type == 'users' and self.duplicate_preflight and record[key] in self.duplicate_preflight.skip_ids:
+                        self.stats['users']['preflight_duplicates_skipped'] += 1
                         continue
                     
-                    transformed = self.transform_user_record(record) if table_type == 'users' else self.transform_address_record(record)
+                    phase_started = clock()
+                    transformed = self.transform_record(table_type, record)
+                    self.stats[table_type]['rows_transformed'] += 1
+                    
+                    if table_type == 'users' and self.duplicate_preflight and record[key] in self.duplicate_preflight.overrides:
+                        transformed = self.duplicate_preflight.apply(record[key], transformed)
+                        self.stats['users']['preflight_duplicates_rewritten'] += 1
+                    now = clock()
+                    phase_totals['transform'] += now - phase_started
+                    phase_started = now
                     
                     v2_cursor.execute(insert_query, transformed)
                     rows_affected = v2_cursor.rowcount
@@ -683,17 +1110,29 @@ class MagiyaMigration:
                         self.stats[table_type]['skipped_records'] += 1
                     elif self.migration_mode == 'upsert' and rows_affected == 2:
                         self.stats[table_type]['updated_records'] += 1
+                        if self.preserve_ids:
+                            updated_ids.append(record[key])
                     else:
                         self.stats[table_type]['migrated_records'] += 1
-                        new_id = v2_cursor.lastrowid if not self.preserve_ids else record['id']
-                        if not self.preserve_ids:
-                            self.id_mapping[table_type][record['id']] = new_id
-                        if table_type == 'users':
-                            self.insert_user_role(v2_cursor, new_id, record['id'])
+                        new_id = v2_cursor.lastrowid if not self.preserve_ids else record[key]
+                        if rows_affected == 1:
+                            inserted_ids.append(new_id)
+                        if not self.preserve_ids and not self.uses_id_map_store(table_type):
+                            self.id_mapping[table_type][record[key]] = new_id
+                        if after_insert:
+                            after_insert(v2_cursor, new_id, record[key])
+                    phase_totals['execute'] += clock() - phase_started
                     
                     success_count += 1
                     
+                except OrphanedReference as e:
+                    phase_totals['transform'] += clock() - phase_started
+                    self.failed_records[table_type].append({'record': dict(record), 'error': str(e), 'error_type': type(e).__name__})
+                    self.stats[table_type]['orphaned_records'] += 1
+                    self.stats[table_type]['failed_records'] += 1
+                    
                 except mysql.connector.IntegrityError as e:
+                    phase_totals['execute'] += clock() - phase_started
                     error_msg = str(e)
                     if "Duplicate entry" in error_msg:
                         if "PRIMARY" in error_msg:
@@ -704,17 +1143,27 @@ class MagiyaMigration:
                             self.stats[table_type]['duplicate_mobile_errors'] += 1
                         if self.migration_mode == 'skip':
                             self.stats[table_type]['skipped_records'] += 1
-                    self.failed_records[table_type].append({'record': record, 'error': str(e), 'error_type': 'IntegrityError'})
+                    self.failed_records[table_type].append({'record': dict(record), 'error': str(e), 'error_type': 'IntegrityError'})
                     self.stats[table_type]['failed_records'] += 1
                     
                 except Exception as e:
-                    self.failed_records[table_type].append({'record': record, 'error': str(e), 'error_type': type(e).__name__})
+                    self.failed_records[table_type].append({'record': dict(record), 'error': str(e), 'error_type': type(e).__name__})
                     self.stats[table_type]['failed_records'] += 1
             
-            self.v2_conn.commit()
+            phase_started = clock()
+            v2_conn.commit()
+            phase_totals['commit'] = clock() - phase_started
+            
+            if self.manifest and records:
+                self.manifest.record_batch(table_type, records[0][key], records[-1][key], inserted_ids, updated_ids)
+            if records:
+                self.stats[table_type]['last_v1_id'] = records[-1][key]
+            observe(self.stats[table_type]['batch_seconds'], time.monotonic() - batch_started)
+            for phase, seconds in phase_totals.items():
+                observe(self.stats[table_type]['phase_seconds'][phase], seconds)
             
         except Exception as e:
-            self.v2_conn.rollback()
+            v2_conn.rollback()
             self.logger.error(f"Batch failed, rolled back: {e}")
             raise
         finally:
@@ -722,40 +1171,179 @@ class MagiyaMigration:
         
         return success_count
     
-    def migrate_table(self, table_type='users'):
-        """Migrate a specific table"""
-        source_table = self.config.V1_TABLE if table_type == 'users' else self.config.V1_ADDRESS_TABLE
-        table_desc = "users" if table_type == 'users' else "addresses"
-        print(f"\n{Fore.CYAN}Migrating {table_desc}...")
+    def migrate_table(self, table_type='users', start_after_id=0, v1_conn=None, v2_conn=None):
+        """Migrate a specific table, paging by its key (start_after_id resumes an interrupted run)"""
+        source_table = self.mappings[table_type]['source']
+        # Worker threads write above the progress bars instead of through them
+        (tqdm.write if self.scheduler else print)(f"\n{Fore.CYAN}Migrating {table_type}...")
         
-        v1_cursor = self.v1_conn.cursor(dictionary=True)
-        base_query = f"SELECT * FROM {source_table} ORDER BY id"
+        v1_conn = v1_conn or self.v1_conn
+        v1_cursor = v1_conn.cursor(dictionary=not self.compact_rows)
+        columns = self.source_projection(table_type)
+        row_type = self.v1_schema.get_row_type(source_table, columns)
+        key = self.mappings[table_type]['key']
+        base_query = (f"SELECT {', '.join(f'`{col}`' for col in columns)} FROM {source_table} "
+                      f"WHERE `{key}` > %s AND {self.source_filter(table_type)} ORDER BY `{key}`")
         
-        progress_bar = tqdm(total=self.stats[table_type]['total_records'], desc=f"Migrating {table_desc}", unit="records")
+        progress_bar = tqdm(total=self.stats[table_type]['total_records'], desc=f"Migrating {table_type}", unit="records",
+                            position=self.scheduler.tables.index(table_type) if self.scheduler else None)
         
-        offset = 0
+        last_id = start_after_id
         while True:
-            v1_cursor.execute(f"{base_query} LIMIT {self.config.BATCH_SIZE} OFFSET {offset}")
-            records = v1_cursor.fetchall()
+            profiling = self.start_profiler()
+            fetch_started = time.perf_counter()
+            v1_cursor.execute(f"{base_query} LIMIT {self.config.BATCH_SIZE}", (last_id,))
+            records = self.fetch_records(v1_cursor, row_type)
             if not records:
+                if profiling:
+                    self.profiler.disable()
                 break
+            observe(self.stats[table_type]['phase_seconds']['fetch'], time.perf_counter() - fetch_started)
             
-            self.migrate_batch(records, table_type)
+            if self.scheduler:
+                self.scheduler.wait_for_parents(table_type, records)
+            self.migrate_batch(records, table_type, v2_conn=v2_conn)
+            if profiling:
+                self.stop_profiler()
             progress_bar.update(len(records))
-            offset += self.config.BATCH_SIZE
+            last_id = records[-1][key]
+            if self.scheduler:
+                self.scheduler.batch_committed(table_type, last_id)
         
         progress_bar.close()
         v1_cursor.close()
     
+    def start_profiler(self):
+        """Profile the next batch while PROFILE_BATCHES batches remain to be profiled (main thread only)"""
+        if self.profile_batches_left <= 0 or threading.current_thread() is not threading.main_thread():
+            return False
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return True
+    
+    def stop_profiler(self):
+        """Stop profiling a batch; save the profile once the requested number of batches is covered"""
+        self.profiler.disable()
+        self.profile_batches_left -= 1
+        if self.profile_batches_left == 0:
+            self.save_profile()
+    
+    def save_profile(self):
+        """Write the collected profile (and a text summary) next to the log file"""
+        if self.profiler is None:
+            return
+        profile_file = f"{os.path.splitext(self.log_file)[0]}.prof"
+        self.profiler.dump_stats(profile_file)
+        with open(f"{profile_file}.txt", 'w') as f:
+            pstats.Stats(self.profiler, stream=f).sort_stats('cumulative').print_stats(40)
+        self.profiler = None
+        self.profile_batches_left = 0
+        print(f"\n{Fore.CYAN}Profile saved to: {profile_file} (summary: {profile_file}.txt)")
+    
+    def timing_breakdown(self):
+        """Seconds spent per phase and table, with each phase's share of the table's total"""
+        breakdown = {}
+        for table_type in self.mappings:
+            phases = self.stats[table_type]['phase_seconds']
+            total = sum(phases[phase]['sum'] for phase in PHASES)
+            if not total:
+                continue
+            breakdown[table_type] = {
+                phase: {
+                    'total_seconds': round(phases[phase]['sum'], 3),
+                    'batches': phases[phase]['count'],
+                    'mean_seconds': round(phases[phase]['sum'] / phases[phase]['count'], 4) if phases[phase]['count'] else 0,
+                    'share': round(phases[phase]['sum'] / total, 3)
+                }
+                for phase in PHASES
+            }
+        return breakdown
+    
+    def fetch_records(self, v1_cursor, row_type):
+        """Fetch the current result set as compact rows (or dicts when compact rows are disabled)"""
+        if self.compact_rows:
+            return [row_type._make(row) for row in v1_cursor.fetchall()]
+        return v1_cursor.fetchall()
+    
     def migrate(self):
         """Main migration process"""
         print(f"\n{Fore.CYAN}Starting migration... Mode: {self.migration_mode.upper()}")
-        if hasattr(self, 'migrate_users') and self.migrate_users:
-            self.migrate_table('users')
-        if self.migrate_addresses:
-            self.migrate_table('addresses')
+        tables = self.selected_tables()
+        for table_type in tables:
+            # Fails here, before anything is written, when STRICT_SOURCE_COLUMNS finds a missing V1 column
+            self.source_projection(table_type)
+        
+        if self.manifest is None:
+            self.manifest = RunManifest.create(self.config, self.run_id, {
+                'mode': self.migration_mode,
+                'preserve_ids': self.preserve_ids,
+                'tables': tables,
+                'shadow_tables': self.shadow_loader.tables if self.shadow_loader else None,
+                'deferred_indexes': {table_type: build.indexes for table_type, build in self.deferred_index_builds.items()},
+                'duplicate_policy': self.duplicate_preflight.policy if self.duplicate_preflight else None,
+                'snapshot': self.snapshot.snapshot_id if self.snapshot else None
+            })
+            if self.shadow_loader:
+                self.shadow_loader.create()
+            for build in self.deferred_index_builds.values():
+                build.drop()
+        print(f"{Fore.CYAN}Run manifest: {self.manifest.path}")
+        
+        if self.config.PARALLEL_TABLES > 1 and len(tables) > 1:
+            if self.profile_batches_left > 0:
+                print(f"{Fore.YELLOW}⚠ PROFILE_BATCHES is ignored while tables run in parallel (set PARALLEL_TABLES=1 to profile)")
+                self.logger.warning("Batch profiling skipped: tables run on %d worker threads", self.config.PARALLEL_TABLES)
+            scheduler = TableScheduler(self, tables, {table_type: self.manifest.last_v1_id(table_type) for table_type in tables})
+            scheduler.run(self.config.PARALLEL_TABLES)
+        else:
+            for table_type in dependency_order(self.mappings, tables, self.preserve_ids):
+                self.migrate_table(table_type, start_after_id=self.manifest.last_v1_id(table_type))
+        if self.shadow_loader:
+            self.shadow_loader.finish_load()
+        for table_type, build in self.deferred_index_builds.items():
+            self.resolve_post_load_duplicates(table_type, build)
+            build.rebuild()
+        self.save_profile()
+        self.manifest.finish(self.stats)
         self.save_migration_report()
     
+    def resume_from_manifest(self, manifest):
+        """Restore the settings of an interrupted run so migrate() continues after its last committed batch"""
+        self.manifest = manifest
+        self.run_id = manifest.run_id
+        self.migration_mode = manifest.run['mode']
+        self.preserve_ids = manifest.run['preserve_ids']
+        self.migrate_users = 'users' in manifest.run['tables']
+        self.migrate_addresses = 'addresses' in manifest.run['tables']
+        self.extra_tables = [table for table in manifest.run['tables'] if table not in ('users', 'addresses')]
+        self.has_role_user_table = self.check_role_user_table_exists() if self.migrate_users else False
+        if manifest.run.get('shadow_tables'):
+            self.use_shadow_tables(manifest.run['shadow_tables'])
+            self.shadow_loader.attach()
+        if manifest.run.get('duplicate_policy') and self.migrate_users:
+            # Decisions are not stored in the manifest; the scan is deterministic for unchanged V1 data
+            self.run_duplicate_preflight(manifest.run['duplicate_policy'])
+        for table_type, indexes in (manifest.run.get('deferred_indexes') or {}).items():
+            # The indexes were dropped when the run started; rebuild them when it finishes
+            self.deferred_index_builds[table_type] = DeferredIndexBuild(
+                self.v2_conn, self.v2_schema, self.v2_tables[table_type], self.logger, indexes=indexes
+            )
+        
+        for table_type in manifest.run['tables']:
+            plan = self.get_plan(table_type)
+            if not self.preserve_ids and plan.id_map_column and not self.uses_id_map_store(table_type):
+                # Children look this table up in memory; reload the ids committed by the interrupted run
+                v2_cursor = self.v2_conn.cursor()
+                v2_cursor.execute(f"SELECT {plan.id_map_column}, {plan.key} FROM {self.v2_tables[table_type]} "
+                                  f"WHERE {plan.id_map_column} IS NOT NULL")
+                self.id_mapping[table_type] = dict(v2_cursor.fetchall())
+                v2_cursor.close()
+        for table_type in manifest.run['tables']:
+            self.count_source_rows(table_type, manifest.last_v1_id(table_type))
+            print(f"  {table_type}: resuming after V1 id {manifest.last_v1_id(table_type)} "
+                  f"({self.stats[table_type]['total_records']} records left)")
+    
     def save_migration_report(self):
         """Save detailed migration report"""
         report = {
@@ -765,6 +1353,8 @@ class MagiyaMigration:
             'duplicate_mobiles': dict(self.duplicate_mobiles),
             'migration_mode': self.migration_mode,
             'preserve_ids': self.preserve_ids,
+            'timing': self.timing_breakdown(),
+            'repeated_log_messages': self.run_log.repeated_message_counts(),
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
         
@@ -789,9 +1379,9 @@ class MagiyaMigration:
         
         try:
             v2_cursor = self.v2_conn.cursor(dictionary=True)
-            v2_cursor.execute("SELECT COUNT(*) as count FROM role_user WHERE role_id = 10")
+            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.v2_tables['role_user']} WHERE role_id = 10")
             role_10_count = v2_cursor.fetchone()['count']
-            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V2_TABLE}")
+            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.v2_tables['users']}")
             users_count = v2_cursor.fetchone()['count']
             
             print(f"\n{Fore.CYAN}Role Assignment Verification:")
@@ -814,17 +1404,22 @@ class MagiyaMigration:
         v2_cursor = self.v2_conn.cursor(dictionary=True)
         
         if hasattr(self, 'migrate_users') and self.migrate_users:
-            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V2_TABLE}")
+            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.v2_tables['users']}")
             v2_count = v2_cursor.fetchone()['count']
             
             print(f"\n{Fore.CYAN}Users Table Migration Summary:")
             print(f"  Total V1 records: {self.stats['users']['total_records']}")
+            if self.stats['users']['filtered_at_source'] > 0: print(f"  Excluded by V1 filter (not read): {Fore.YELLOW}{self.stats['users']['filtered_at_source']}")
             print(f"  Skipped (status=0): {Fore.YELLOW}{self.stats['users']['skipped_status_zero']}")
+            if self.duplicate_preflight:
+                print(f"  Skipped (pre-flight duplicates): {Fore.YELLOW}{self.stats['users']['preflight_duplicates_skipped']}")
+                print(f"  Rewritten (pre-flight duplicates): {Fore.YELLOW}{self.stats['users']['preflight_duplicates_rewritten']}")
             print(f"  Successfully migrated: {Fore.GREEN}{self.stats['users']['migrated_records']}")
             if self.stats['users']['updated_records'] > 0: print(f"  Updated existing: {Fore.BLUE}{self.stats['users']['updated_records']}")
             if self.stats['users']['skipped_records'] > 0: print(f"  Skipped existing: {Fore.YELLOW}{self.stats['users']['skipped_records']}")
             print(f"  Failed records: {Fore.RED}{self.stats['users']['failed_records']}")
             print(f"  V2 table total count: {v2_count}")
+            self.print_timing('users')
             
             if self.has_role_user_table:
                 print(f"\n{Fore.CYAN}Role Assignment Statistics:")
@@ -833,21 +1428,56 @@ class MagiyaMigration:
                 self.verify_role_assignments()
         
         if self.migrate_addresses:
-            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V2_ADDRESS_TABLE}")
+            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.v2_tables['addresses']}")
             v2_address_count = v2_cursor.fetchone()['count']
             
             print(f"\n{Fore.CYAN}Address Table Migration Summary:")
             print(f"  Total V1 records: {self.stats['addresses']['total_records']}")
             print(f"  Successfully migrated: {Fore.GREEN}{self.stats['addresses']['migrated_records']}")
+            if self.stats['addresses']['orphaned_records'] > 0: print(f"  Orphaned (user not migrated): {Fore.RED}{self.stats['addresses']['orphaned_records']}")
             if self.stats['addresses']['updated_records'] > 0: print(f"  Updated existing: {Fore.BLUE}{self.stats['addresses']['updated_records']}")
             if self.stats['addresses']['skipped_records'] > 0: print(f"  Skipped existing: {Fore.YELLOW}{self.stats['addresses']['skipped_records']}")
             print(f"  Failed records: {Fore.RED}{self.stats['addresses']['failed_records']}")
             print(f"  V2 table total count: {v2_address_count}")
+            self.print_timing('addresses')
+        
+        for table_type in self.extra_tables:
+            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.v2_tables[table_type]}")
+            v2_table_count = v2_cursor.fetchone()['count']
+            
+            print(f"\n{Fore.CYAN}{table_type} Table Migration Summary:")
+            print(f"  Total V1 records: {self.stats[table_type]['total_records']}")
+            print(f"  Successfully migrated: {Fore.GREEN}{self.stats[table_type]['migrated_records']}")
+            if self.stats[table_type]['orphaned_records'] > 0: print(f"  Orphaned (parent not migrated): {Fore.RED}{self.stats[table_type]['orphaned_records']}")
+            if self.stats[table_type]['updated_records'] > 0: print(f"  Updated existing: {Fore.BLUE}{self.stats[table_type]['updated_records']}")
+            if self.stats[table_type]['skipped_records'] > 0: print(f"  Skipped existing: {Fore.YELLOW}{self.stats[table_type]['skipped_records']}")
+            print(f"  Failed records: {Fore.RED}{self.stats[table_type]['failed_records']}")
+            print(f"  V2 table total count: {v2_table_count}")
+            self.print_timing(table_type)
+        
+        repeated = {category: count for category, count in self.run_log.repeated_message_counts().items()
+                    if count > self.config.LOG_SAMPLE_LIMIT}
+        if repeated:
+            print(f"\n{Fore.CYAN}Repeated warnings (first {self.config.LOG_SAMPLE_LIMIT} of each logged in full):")
+            for category, count in sorted(repeated.items()):
+                print(f"  {category}: {Fore.YELLOW}{count}")
         
         v2_cursor.close()
     
+    def print_timing(self, table_type):
+        """One-line phase timing summary for a table"""
+        timing = self.timing_breakdown().get(table_type)
+        if timing:
+            print("  Time: " + ', '.join(
+                f"{phase} {values['total_seconds']:.1f}s ({values['share']:.0%})" for phase, values in timing.items()
+            ))
+    
     def close_connections(self):
-        """Close database connections"""
+        """Close database connections, the metrics endpoint and the run log file"""
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        
         if self.v1_conn and self.v1_conn.is_connected():
             self.v1_conn.close()
             self.logger.info("V1 connection closed")
@@ -855,16 +1485,30 @@ class MagiyaMigration:
         if self.v2_conn and self.v2_conn.is_connected():
             self.v2_conn.close()
             self.logger.info("V2 connection closed")
+        
+        self.run_log.close()
     
     def run(self):
         """Execute the complete migration process"""
         try:
             if not self.connect_databases(): return
-            if not self.pre_migration_checks():
+            self.start_metrics_server()
+            
+            incomplete = RunManifest.find_incomplete(self.config)
+            if incomplete:
+                print(f"\n{Fore.YELLOW}⚠ Run {incomplete.run_id} did not finish ({len(incomplete.batches)} batches committed)")
+                if input("Resume it? (yes/no): ").lower() == 'yes':
+                    self.resume_from_manifest(incomplete)
+                else:
+                    incomplete.abandon()
+            
+            if not self.manifest and not self.pre_migration_checks():
                 print(f"{Fore.YELLOW}Migration cancelled by user")
                 return
             self.migrate()
             self.post_migration_validation()
+            if self.shadow_loader:
+                self.cutover_shadow_tables()
         except Exception as e:
             self.logger.error(f"Migration failed: {e}", exc_info=True)
             print(f"{Fore.RED}✗ Migration failed: {e}")
@@ -1,6 +1,13 @@
 import mysql.connector
 from colorama import init, Fore
 import logging
+import time
+from datetime import datetime
+from run_manifest import RunManifest
+from schema_cache import SchemaCache, foreign_key_definition
+from shadow_tables import ShadowTableLoader
+from table_mappings import load_mappings, dependency_order, Ref
+from v2_snapshot import V2Snapshot
 
 init(autoreset=True)
 
@@ -8,39 +15,291 @@ class MigrationRollback:
     def __init__(self, config):
         self.config = config
         self.logger = logging.getLogger('MigrationRollback')
-    
+        self.mappings = load_mappings(config)
+
+    def rollback_order(self, table_types):
+        """(table type, V2 table) of the given mappings, children first; role_user goes with users"""
+        steps = []
+        for table_type in reversed(dependency_order(self.mappings, list(table_types), preserve_ids=False)):
+            if table_type == 'users':
+                steps.append(('users', 'role_user'))
+            steps.append((table_type, self.mappings[table_type]['target']))
+        return steps
+
+    def user_key_column(self, table):
+        """Column of a V2 table holding the V2 users id (None if the table does not reference users)"""
+        if table == self.mappings['users']['target']:
+            return 'id'
+        if table == 'role_user':
+            return 'user_id'
+        for mapping in self.mappings.values():
+            if mapping['target'] == table:
+                specs = dict(mapping.get('overrides', {}))
+                if isinstance(mapping['columns'], dict):
+                    specs.update(mapping['columns'])
+                return next((column for column, spec in specs.items()
+                             if isinstance(spec, Ref) and spec.parent == 'users'), None)
+        return None
+
+    def get_existing_tables(self, v2_conn):
+        """Return the V2 tables of every table mapping (and role_user) that exist, children first"""
+        candidates = [table for _, table in self.rollback_order(self.mappings)]
+        v2_cursor = v2_conn.cursor()
+        try:
+            placeholders = ', '.join(['%s'] * len(candidates))
+            v2_cursor.execute(f"""
+                SELECT TABLE_NAME FROM information_schema.tables
+                WHERE table_schema = %s AND table_name IN ({placeholders})
+            """, (self.config.V2_DATABASE, *candidates))
+            existing = {row[0] for row in v2_cursor.fetchall()}
+        finally:
+            v2_cursor.close()
+        return [table for table in candidates if table in existing]
+
+    def count_users(self, v2_conn):
+        """Return (total users, migrated users) in one scan"""
+        v2_cursor = v2_conn.cursor()
+        try:
+            v2_cursor.execute(f"""
+                SELECT COUNT(*), COALESCE(SUM(CASE WHEN v1_id IS NOT NULL THEN 1 ELSE 0 END), 0)
+                FROM {self.config.V2_TABLE}
+            """)
+            total, migrated = v2_cursor.fetchone()
+            return total, int(migrated)
+        finally:
+            v2_cursor.close()
+
+    def truncate_tables(self, v2_conn, tables):
+        """TRUNCATE tables (drops and recreates them: no undo, no per-row replication, resets AUTO_INCREMENT)"""
+        v2_cursor = v2_conn.cursor()
+        try:
+            v2_cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for table in tables:
+                v2_cursor.execute(f"TRUNCATE TABLE {table}")
+                print(f"{Fore.GREEN}✓ Truncated {table}")
+        finally:
+            v2_cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            v2_cursor.close()
+
+    def swap_out_tables(self, v2_conn, schema, tables):
+        """Replace tables with empty copies in one atomic RENAME, keeping the old data aside.
+
+        CREATE TABLE ... LIKE does not copy foreign keys, so they are added to the
+        empty copies before the swap. Foreign keys of other tables would follow the
+        RENAME to the old data, so the swap is refused when there are any.
+        """
+        blocking = ShadowTableLoader(v2_conn, schema, tables, self.logger).find_blocking_references()
+        if blocking:
+            raise RuntimeError("Tables outside the rollback reference the swapped tables: "
+                               f"{', '.join(f'{referencing} -> {table}' for referencing, table in blocking)}")
+
+        suffix = f"__rollback_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        v2_cursor = v2_conn.cursor()
+        try:
+            for table in tables:
+                v2_cursor.execute(f"CREATE TABLE {table}__empty LIKE {table}")
+            for table in tables:
+                for fk in schema.get_foreign_keys(table):
+                    referenced = fk['referenced_table']
+                    if referenced in tables:
+                        referenced = f"{referenced}__empty"
+                    # The old tables keep their constraint names until they are dropped
+                    name = ShadowTableLoader.shadow_constraint_name(fk['name'])
+                    v2_cursor.execute(f"ALTER TABLE {table}__empty {foreign_key_definition(fk, name, referenced)}")
+            renames = ', '.join(f"{table} TO {table}{suffix}, {table}__empty TO {table}" for table in tables)
+            v2_cursor.execute(f"RENAME TABLE {renames}")
+        except Exception:
+            for table in tables:
+                v2_cursor.execute(f"DROP TABLE IF EXISTS {table}__empty")
+            raise
+        finally:
+            v2_cursor.close()
+
+        for table in tables:
+            print(f"{Fore.GREEN}✓ Swapped out {table} (old data kept in {table}{suffix})")
+        return [f"{table}{suffix}" for table in tables]
+
+    def delete_migrated_rows(self, v2_conn, tables):
+        """Delete migrated users (v1_id IS NOT NULL) with the rows referencing them in throttled chunks"""
+        chunk_size = self.config.ROLLBACK_CHUNK_SIZE
+        users_table = self.mappings['users']['target']
+        key_columns = {table: self.user_key_column(table) for table in tables}
+        for table in [table for table, key_column in key_columns.items() if key_column is None]:
+            print(f"{Fore.YELLOW}⚠ {table} does not reference users - roll back its rows with a run manifest")
+            del key_columns[table]
+        v2_cursor = v2_conn.cursor()
+        deleted = {table: 0 for table in key_columns}
+        last_id = 0
+
+        try:
+            while True:
+                v2_cursor.execute(f"""
+                    SELECT id FROM {users_table}
+                    WHERE id > %s AND v1_id IS NOT NULL
+                    ORDER BY id
+                    LIMIT {chunk_size}
+                """, (last_id,))
+                user_ids = [row[0] for row in v2_cursor.fetchall()]
+                if not user_ids:
+                    break
+
+                placeholders = ', '.join(['%s'] * len(user_ids))
+                for table, key_column in key_columns.items():
+                    v2_cursor.execute(f"DELETE FROM {table} WHERE {key_column} IN ({placeholders})", user_ids)
+                    deleted[table] += v2_cursor.rowcount
+                v2_conn.commit()
+
+                last_id = user_ids[-1]
+                print(f"  Deleted users up to id {last_id} ({deleted.get(users_table, 0)} so far)", end='\r')
+                # Short pauses keep undo small and let replicas keep up
+                time.sleep(self.config.ROLLBACK_THROTTLE_SECONDS)
+        except Exception:
+            v2_conn.rollback()
+            raise
+        finally:
+            v2_cursor.close()
+
+        print()
+        for table, count in deleted.items():
+            print(f"{Fore.GREEN}✓ Deleted {count} rows from {table}")
+        return deleted
+
+    def delete_run_rows(self, v2_conn, manifest, tables):
+        """Delete exactly the rows a run inserted, using PK range deletes from its manifest"""
+        chunk_size = self.config.ROLLBACK_CHUNK_SIZE
+        v2_cursor = v2_conn.cursor()
+
+        # (table, key column, manifest table type) of the run's tables, children first
+        run_tables = [table_type for table_type in manifest.run['tables'] if table_type in self.mappings]
+        unknown = [table_type for table_type in manifest.run['tables'] if table_type not in self.mappings]
+        if unknown:
+            print(f"{Fore.YELLOW}⚠ No table mapping for {', '.join(unknown)} (check TABLE_MAPPINGS_MODULE) - not rolled back")
+        steps = []
+        for table_type, table in self.rollback_order(run_tables):
+            if table not in tables:
+                continue
+            key_column = 'user_id' if table == 'role_user' else self.mappings[table_type]['key']
+            steps.append((table, key_column, table_type))
+        deleted = {table: 0 for table, _, _ in steps}
+
+        try:
+            for table, key_column, table_type in steps:
+                for start, end in manifest.inserted_ranges(table_type):
+                    for chunk_start in range(start, end + 1, chunk_size):
+                        chunk_end = min(chunk_start + chunk_size - 1, end)
+                        v2_cursor.execute(f"DELETE FROM {table} WHERE {key_column} BETWEEN %s AND %s",
+                                          (chunk_start, chunk_end))
+                        deleted[table] += v2_cursor.rowcount
+                        v2_conn.commit()
+                        time.sleep(self.config.ROLLBACK_THROTTLE_SECONDS)
+        except Exception:
+            v2_conn.rollback()
+            raise
+        finally:
+            v2_cursor.close()
+
+        for table, count in deleted.items():
+            print(f"{Fore.GREEN}✓ Deleted {count} rows from {table}")
+        return deleted
+
+    def select_manifest(self):
+        """Let the user pick a run manifest"""
+        manifests = [m for m in RunManifest.list_manifests(self.config) if m.run][:10]
+        if not manifests:
+            print(f"{Fore.YELLOW}No run manifests found in {self.config.MANIFEST_DIR}")
+            return None
+
+        print(f"\n{Fore.CYAN}Recent runs:")
+        for i, manifest in enumerate(manifests, 1):
+            status = 'finished' if manifest.finished else 'incomplete'
+            counts = ', '.join(f"{t}: {manifest.inserted_count(t)} inserted" for t in manifest.run['tables'])
+            print(f"{i}. {manifest.run_id} ({manifest.run['mode']}, {status}) - {counts}")
+
+        choice = input(f"\nEnter run number (1-{len(manifests)}): ")
+        if not choice.isdigit() or not 1 <= int(choice) <= len(manifests):
+            return None
+        return manifests[int(choice) - 1]
+
+    def select_snapshot(self):
+        """Let the user pick a V2 snapshot"""
+        snapshots = V2Snapshot.list_snapshots(self.config)[:10]
+        if not snapshots:
+            print(f"{Fore.YELLOW}No V2 snapshots found in {self.config.SNAPSHOT_DIR}")
+            return None
+
+        print(f"\n{Fore.CYAN}V2 snapshots:")
+        for i, snapshot in enumerate(snapshots, 1):
+            tables = ', '.join(f"{t['table']} ({t['rows']} rows)" for t in snapshot.meta['tables'])
+            restored = f", restored {snapshot.meta['restored_at']}" if snapshot.meta['restored_at'] else ''
+            print(f"{i}. {snapshot.snapshot_id} (created {snapshot.meta['created_at']}{restored}) - {tables}")
+
+        choice = input(f"\nEnter snapshot number (1-{len(snapshots)}): ")
+        if not choice.isdigit() or not 1 <= int(choice) <= len(snapshots):
+            return None
+        return snapshots[int(choice) - 1]
+
     def rollback(self):
-        """Rollback the migration by clearing V2 table"""
-        print(f"\n{Fore.RED}⚠ WARNING: This will delete all data from the V2 table!")
-        response = input("Are you sure you want to rollback? (yes/no): ").lower()
-        
-        if response != 'yes':
-            print(f"{Fore.YELLOW}Rollback cancelled")
-            return
-        
+        """Rollback the migration, using TRUNCATE/table swap when V2 holds only migrated data"""
         try:
             v2_conn = mysql.connector.connect(**self.config.V2_CONFIG)
-            v2_cursor = v2_conn.cursor()
-            
-            # Get count before deletion
-            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V2_TABLE}")
-            count = v2_cursor.fetchone()[0]
-            
-            print(f"\n{Fore.YELLOW}Deleting {count} records from V2...")
-            
-            # Delete all records
-            v2_cursor.execute(f"DELETE FROM {self.config.V2_TABLE}")
-            v2_conn.commit()
-            
-            # Reset auto-increment
-            v2_cursor.execute(f"ALTER TABLE {self.config.V2_TABLE} AUTO_INCREMENT = 1")
-            v2_conn.commit()
-            
-            print(f"{Fore.GREEN}✓ Rollback completed! Deleted {count} records")
-            
-            v2_cursor.close()
+            tables = self.get_existing_tables(v2_conn)
+            total, migrated = self.count_users(v2_conn)
+            schema = SchemaCache(v2_conn, self.config.V2_DATABASE)
+            cutover_tables = [t for t in tables if schema.table_exists(ShadowTableLoader.old_name(t))]
+
+            print(f"\n{Fore.CYAN}V2 users: {total} total, {migrated} migrated from V1, {total - migrated} other")
+            print(f"  Tables affected: {', '.join(tables)}")
+
+            print(f"\n{Fore.CYAN}Select rollback method:")
+            if total == migrated:
+                print("1. Fast rollback: TRUNCATE tables")
+                print("2. Fast rollback: swap in empty tables (old data kept in *__rollback_* tables)")
+            else:
+                print(f"{Fore.YELLOW}  V2 contains non-migrated users - only scoped deletes are available")
+            print("3. Chunked delete of migrated rows only")
+            print("4. Roll back a single run (rows listed in its manifest)")
+            if cutover_tables:
+                print(f"5. Undo shadow-table cutover (swap {', '.join(cutover_tables)} back from *__old)")
+            print("6. Restore a pre-migration V2 snapshot")
+            print("7. Cancel")
+
+            choice = input("\nEnter your choice (1-7): ")
+            manifest = self.select_manifest() if choice == '4' else None
+            snapshot = self.select_snapshot() if choice == '6' else None
+            if choice not in ['1', '2', '3', '4', '5', '6'] or (choice in ['1', '2'] and total != migrated) \
+                    or (choice == '4' and manifest is None) or (choice == '5' and not cutover_tables) \
+                    or (choice == '6' and snapshot is None):
+                print(f"{Fore.YELLOW}Rollback cancelled")
+                v2_conn.close()
+                return
+
+            print(f"\n{Fore.RED}⚠ WARNING: This will delete migrated data from the V2 tables!")
+            response = input("Are you sure you want to rollback? (yes/no): ").lower()
+
+            if response != 'yes':
+                print(f"{Fore.YELLOW}Rollback cancelled")
+                v2_conn.close()
+                return
+
+            if choice == '1':
+                self.truncate_tables(v2_conn, tables)
+            elif choice == '2':
+                self.swap_out_tables(v2_conn, schema, tables)
+            elif choice == '3':
+                self.delete_migrated_rows(v2_conn, tables)
+            elif choice == '5':
+                ShadowTableLoader(v2_conn, schema, cutover_tables, self.logger).swap_back()
+            elif choice == '6':
+                snapshot.restore(v2_conn, self.config)
+                if input("Drop the snapshot tables now? (yes/no): ").lower() == 'yes':
+                    snapshot.drop(v2_conn)
+            else:
+                self.delete_run_rows(v2_conn, manifest, tables)
+
+            print(f"{Fore.GREEN}✓ Rollback completed!")
+
             v2_conn.close()
-            
+
         except Exception as e:
             self.logger.error(f"Rollback failed: {e}")
-            print(f"{Fore.RED}✗ Rollback failed: {e}")
\ No newline at end of file
+            print(f"{Fore.RED}✗ Rollback failed: {e}")
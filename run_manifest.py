@@ -0,0 +1,149 @@
+import glob
+import json
+import os
+import threading
+from datetime import datetime
+
+def to_ranges(ids):
+    """Collapse integer ids into sorted [start, end] ranges"""
+    ranges = []
+    for value in sorted(ids):
+        if ranges and value == ranges[-1][1] + 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return ranges
+
+
+class RunManifest:
+    """Append-only JSONL record of what a migration run wrote to V2.
+
+    One 'run' line with the settings, one 'batch' line per committed batch (V1 id
+    range plus inserted/updated V2 ids as ranges) and an 'end' line when the run
+    finishes. A manifest without an 'end' line belongs to an interrupted run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.run = None
+        self.batches = []
+        self.finished = False
+        # Tables migrated in parallel record their batches from several threads
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    @classmethod
+    def create(cls, config, run_id, settings):
+        """Start a new manifest for a run"""
+        os.makedirs(config.MANIFEST_DIR, exist_ok=True)
+        manifest = cls(os.path.join(config.MANIFEST_DIR, f"run_{run_id}.jsonl"))
+        manifest._append({
+            'type': 'run',
+            'run_id': run_id,
+            'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'config': {
+                'v1_database': config.V1_DATABASE,
+                'v2_database': config.V2_DATABASE,
+                'v1_table': config.V1_TABLE,
+                'v2_table': config.V2_TABLE,
+                'v1_address_table': config.V1_ADDRESS_TABLE,
+                'v2_address_table': config.V2_ADDRESS_TABLE,
+                'batch_size': config.BATCH_SIZE
+            },
+            **settings
+        })
+        return manifest
+
+    @classmethod
+    def list_manifests(cls, config):
+        """All manifests, newest first"""
+        paths = sorted(glob.glob(os.path.join(config.MANIFEST_DIR, 'run_*.jsonl')), reverse=True)
+        return [cls(path) for path in paths]
+
+    @classmethod
+    def find_incomplete(cls, config):
+        """Most recent manifest of a run that did not finish, if any"""
+        for manifest in cls.list_manifests(config):
+            if manifest.run and not manifest.finished:
+                return manifest
+        return None
+
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry['type'] == 'run':
+                    self.run = entry
+                elif entry['type'] == 'batch':
+                    self.batches.append(entry)
+                elif entry['type'] == 'end':
+                    self.finished = True
+
+    def _append(self, entry):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry, default=str) + '\n')
+            if entry['type'] == 'run':
+                self.run = entry
+            elif entry['type'] == 'batch':
+                self.batches.append(entry)
+            elif entry['type'] == 'end':
+                self.finished = True
+
+    def record_batch(self, table_type, v1_min_id, v1_max_id, inserted_ids, updated_ids):
+        """Record one committed batch"""
+        self._append({
+            'type': 'batch',
+            'table': table_type,
+            'v1_range': [v1_min_id, v1_max_id],
+            'inserted': to_ranges(inserted_ids),
+            'updated': to_ranges(updated_ids)
+        })
+
+    def finish(self, stats):
+        """Mark the run as finished"""
+        self._append({
+            'type': 'end',
+            'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'migrated': {table: table_stats['migrated_records'] for table, table_stats in stats.items()
+                         if isinstance(table_stats, dict) and 'migrated_records' in table_stats}
+        })
+
+    def abandon(self):
+        """Close an interrupted run that will not be resumed"""
+        self._append({
+            'type': 'end',
+            'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'abandoned': True
+        })
+
+    @property
+    def run_id(self):
+        return self.run['run_id'] if self.run else None
+
+    def last_v1_id(self, table_type):
+        """Highest V1 id already committed for a table (0 if none)"""
+        ids = [batch['v1_range'][1] for batch in self.batches if batch['table'] == table_type]
+        return max(ids) if ids else 0
+
+    def v1_ranges(self, table_type):
+        """V1 id ranges covered by the run for a table"""
+        return [batch['v1_range'] for batch in self.batches if batch['table'] == table_type]
+
+    def inserted_ranges(self, table_type):
+        """Merged V2 id ranges inserted by the run for a table"""
+        ids_ranges = sorted(r for batch in self.batches if batch['table'] == table_type for r in batch['inserted'])
+        merged = []
+        for start, end in ids_ranges:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def inserted_count(self, table_type):
+        """Number of V2 rows inserted by the run for a table"""
+        return sum(end - start + 1 for start, end in self.inserted_ranges(table_type))
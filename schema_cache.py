@@ -0,0 +1,176 @@
+from collections import namedtuple
+
+class SchemaCache:
+    """Caches INFORMATION_SCHEMA lookups for one database connection"""
+    
+    def __init__(self, conn, database):
+        self.conn = conn
+        self.database = database
+        self._columns = {}
+        self._row_types = {}
+        self._indexes = {}
+        self._foreign_keys = {}
+    
+    def get_columns(self, table):
+        """Return the column names of a table in ordinal order"""
+        if table not in self._columns:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+                    ORDER BY ORDINAL_POSITION
+                """, (self.database, table))
+                self._columns[table] = [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        return list(self._columns[table])
+    
+    def get_indexes(self, table):
+        """Return non-primary index definitions of a table, in creation order"""
+        if table not in self._indexes:
+            cursor = self.conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT INDEX_NAME, NON_UNIQUE, INDEX_TYPE, SEQ_IN_INDEX, COLUMN_NAME, SUB_PART, COLLATION, EXPRESSION
+                    FROM INFORMATION_SCHEMA.STATISTICS
+                    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME != 'PRIMARY'
+                    ORDER BY INDEX_NAME, SEQ_IN_INDEX
+                """, (self.database, table))
+                indexes = {}
+                for row in cursor.fetchall():
+                    index = indexes.setdefault(row['INDEX_NAME'], {
+                        'name': row['INDEX_NAME'],
+                        'unique': not int(row['NON_UNIQUE']),
+                        'type': row['INDEX_TYPE'],
+                        'columns': [],
+                        'parts': []
+                    })
+                    if row['COLUMN_NAME']:
+                        part = f"`{row['COLUMN_NAME']}`"
+                        index['columns'].append(row['COLUMN_NAME'])
+                    else:
+                        part = f"({row['EXPRESSION']})"
+                    if row['SUB_PART']:
+                        part += f"({row['SUB_PART']})"
+                    if row['COLLATION'] == 'D':
+                        part += ' DESC'
+                    index['parts'].append(part)
+                self._indexes[table] = list(indexes.values())
+            finally:
+                cursor.close()
+        return [dict(index) for index in self._indexes[table]]
+    
+    def get_foreign_keys(self, table):
+        """Return foreign keys declared on a table"""
+        if table not in self._foreign_keys:
+            cursor = self.conn.cursor(dictionary=True)
+            try:
+                cursor.execute("""
+                    SELECT k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+                           r.UPDATE_RULE, r.DELETE_RULE
+                    FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+                    JOIN INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS r
+                      ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+                    WHERE k.TABLE_SCHEMA = %s AND k.TABLE_NAME = %s AND k.REFERENCED_TABLE_NAME IS NOT NULL
+                    ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+                """, (self.database, table))
+                foreign_keys = {}
+                for row in cursor.fetchall():
+                    fk = foreign_keys.setdefault(row['CONSTRAINT_NAME'], {
+                        'name': row['CONSTRAINT_NAME'],
+                        'columns': [],
+                        'referenced_table': row['REFERENCED_TABLE_NAME'],
+                        'referenced_columns': [],
+                        'on_update': row['UPDATE_RULE'],
+                        'on_delete': row['DELETE_RULE']
+                    })
+                    fk['columns'].append(row['COLUMN_NAME'])
+                    fk['referenced_columns'].append(row['REFERENCED_COLUMN_NAME'])
+                self._foreign_keys[table] = list(foreign_keys.values())
+            finally:
+                cursor.close()
+        return [dict(fk) for fk in self._foreign_keys[table]]
+    
+    def get_referencing_tables(self, table):
+        """Tables that have a foreign key pointing at this table"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT DISTINCT TABLE_NAME FROM INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS
+                WHERE CONSTRAINT_SCHEMA = %s AND REFERENCED_TABLE_NAME = %s
+            """, (self.database, table))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    
+    def table_exists(self, table):
+        """Check whether a table exists (not cached: used around DDL)"""
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES
+                WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+            """, (self.database, table))
+            return cursor.fetchone()[0] > 0
+        finally:
+            cursor.close()
+    
+    def get_row_type(self, table, columns=None):
+        """Return a compact row type for a table (or a projection of its columns)"""
+        columns = tuple(columns or self.get_columns(table))
+        key = (table, columns)
+        if key not in self._row_types:
+            self._row_types[key] = make_row_type(f"{table}_row", columns)
+        return self._row_types[key]
+
+
+def index_definition(index):
+    """Render an index from SchemaCache.get_indexes() as an ALTER TABLE ... ADD clause"""
+    kind = 'UNIQUE INDEX' if index['unique'] else 'INDEX'
+    if index['type'] in ('FULLTEXT', 'SPATIAL'):
+        kind = f"{index['type']} INDEX"
+    return f"ADD {kind} `{index['name']}` ({', '.join(index['parts'])})"
+
+
+def make_row_type(name, columns):
+    """Build a tuple-backed row type that also supports dict-style access by column name.
+    
+    Rows cost one tuple allocation instead of a dict, can be passed straight to
+    cursor.execute() as positional parameters, and still work with code that uses
+    record['col'], record.get('col') or dict(record).
+    """
+    columns = tuple(columns)
+    index = {column: position for position, column in enumerate(columns)}
+    base = namedtuple(name, columns, rename=True)
+    
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, index[key])
+        return tuple.__getitem__(self, key)
+    
+    def get(self, key, default=None):
+        position = index.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+    
+    def keys(self):
+        return columns
+    
+    def __contains__(self, key):
+        return key in index
+    
+    return type(name, (base,), {
+        '__slots__': (),
+        'columns': columns,
+        '__getitem__': __getitem__,
+        'get': get,
+        'keys': keys,
+        '__contains__': __contains__
+    })
+
+
+def foreign_key_definition(fk, name, referenced_table):
+    """Render a foreign key from SchemaCache.get_foreign_keys() as an ALTER TABLE ... ADD clause"""
+    return (f"ADD CONSTRAINT `{name}` FOREIGN KEY ({', '.join(f'`{c}`' for c in fk['columns'])}) "
+            f"REFERENCES {referenced_table} ({', '.join(f'`{c}`' for c in fk['referenced_columns'])}) "
+            f"ON DELETE {fk['on_delete']} ON UPDATE {fk['on_update']}")
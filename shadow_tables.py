@@ -0,0 +1,138 @@
+from colorama import init, Fore
+from schema_cache import index_definition, foreign_key_definition
+
+init(autoreset=True)
+
+SHADOW_SUFFIX = '__shadow'
+OLD_SUFFIX = '__old'
+
+class ShadowTableLoader:
+    """Bulk-load into <table>__shadow copies and cut over with one atomic RENAME TABLE.
+
+    Shadow tables are created with CREATE TABLE ... LIKE. Non-unique secondary
+    indexes are dropped before the load and rebuilt with one ALTER per table
+    afterwards; unique indexes stay so duplicate rows are still rejected per row.
+    CREATE TABLE ... LIKE does not copy foreign keys, so they are re-added after
+    the load (pointing at the other shadow tables where applicable).
+    """
+
+    def __init__(self, conn, schema, tables, logger):
+        self.conn = conn
+        self.schema = schema
+        self.tables = tables
+        self.logger = logger
+        self.deferred_indexes = {}
+
+    @staticmethod
+    def shadow_name(table):
+        return f"{table}{SHADOW_SUFFIX}"
+
+    @staticmethod
+    def old_name(table):
+        return f"{table}{OLD_SUFFIX}"
+
+    @staticmethod
+    def shadow_constraint_name(name):
+        """Name for the shadow copy of a foreign key: the suffix is added or, after a
+        previous cutover made a suffixed name live, removed again, so names never grow"""
+        if name.endswith(SHADOW_SUFFIX):
+            return name[:-len(SHADOW_SUFFIX)]
+        return f"{name}{SHADOW_SUFFIX}"
+
+    def find_blocking_references(self):
+        """Foreign keys from tables outside the swap set; RENAME would re-point them at the old tables"""
+        blocking = []
+        for table in self.tables:
+            for referencing in self.schema.get_referencing_tables(table):
+                if referencing not in self.tables:
+                    blocking.append((referencing, table))
+        return blocking
+
+    def create(self):
+        """Create empty shadow tables and drop the indexes that will be built after the load"""
+        cursor = self.conn.cursor()
+        try:
+            for table in self.tables:
+                shadow = self.shadow_name(table)
+                cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+                cursor.execute(f"CREATE TABLE {shadow} LIKE {table}")
+
+                self.deferred_indexes[table] = [index for index in self.schema.get_indexes(table) if not index['unique']]
+                if self.deferred_indexes[table]:
+                    drops = ', '.join(f"DROP INDEX `{index['name']}`" for index in self.deferred_indexes[table])
+                    cursor.execute(f"ALTER TABLE {shadow} {drops}")
+
+                print(f"{Fore.GREEN}✓ Created {shadow} ({len(self.deferred_indexes[table])} index(es) deferred)")
+        finally:
+            cursor.close()
+
+    def attach(self):
+        """Re-attach to shadow tables created by an interrupted run"""
+        for table in self.tables:
+            built = {index['name'] for index in self.schema.get_indexes(self.shadow_name(table))}
+            self.deferred_indexes[table] = [
+                index for index in self.schema.get_indexes(table) if not index['unique'] and index['name'] not in built
+            ]
+
+    def finish_load(self):
+        """Rebuild deferred indexes and foreign keys on the loaded shadow tables"""
+        cursor = self.conn.cursor()
+        try:
+            for table in self.tables:
+                shadow = self.shadow_name(table)
+                index_clauses = [index_definition(index) for index in self.deferred_indexes.get(table, [])]
+                if index_clauses:
+                    print(f"{Fore.CYAN}Building {len(index_clauses)} index(es) on {shadow}...")
+                    cursor.execute(f"ALTER TABLE {shadow} {', '.join(index_clauses)}")
+
+            # Foreign keys last, once every shadow table has its data
+            for table in self.tables:
+                shadow = self.shadow_name(table)
+                for fk in self.schema.get_foreign_keys(table):
+                    referenced = fk['referenced_table']
+                    if referenced in self.tables:
+                        referenced = self.shadow_name(referenced)
+                    try:
+                        cursor.execute(f"ALTER TABLE {shadow} "
+                                       f"{foreign_key_definition(fk, self.shadow_constraint_name(fk['name']), referenced)}")
+                    except Exception as e:
+                        self.logger.warning(f"Could not add foreign key {fk['name']} to {shadow}: {e}")
+                        print(f"{Fore.YELLOW}⚠ Foreign key {fk['name']} not added to {shadow}: {e}")
+        finally:
+            cursor.close()
+
+    def cutover(self):
+        """Atomically swap the shadow tables in; the previous tables are kept as <table>__old"""
+        existing_old = [self.old_name(table) for table in self.tables if self.schema.table_exists(self.old_name(table))]
+        if existing_old:
+            raise RuntimeError(f"Previous cutover tables still exist: {', '.join(existing_old)} - drop them first")
+
+        renames = ', '.join(
+            f"{table} TO {self.old_name(table)}, {self.shadow_name(table)} TO {table}" for table in self.tables
+        )
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"RENAME TABLE {renames}")
+        finally:
+            cursor.close()
+        self.logger.info(f"Shadow cutover completed for: {', '.join(self.tables)}")
+        print(f"{Fore.GREEN}✓ Cutover completed (previous tables kept as *{OLD_SUFFIX})")
+
+    def swap_back(self):
+        """Undo a cutover: put the *__old tables back and move the migrated ones aside as shadows"""
+        missing = [self.old_name(table) for table in self.tables if not self.schema.table_exists(self.old_name(table))]
+        if missing:
+            raise RuntimeError(f"Cannot swap back, missing: {', '.join(missing)}")
+
+        renames = ', '.join(
+            f"{table} TO {self.shadow_name(table)}, {self.old_name(table)} TO {table}" for table in self.tables
+        )
+        cursor = self.conn.cursor()
+        try:
+            for table in self.tables:
+                cursor.execute(f"DROP TABLE IF EXISTS {self.shadow_name(table)}")
+            cursor.execute(f"RENAME TABLE {renames}")
+        finally:
+            cursor.close()
+        self.logger.info(f"Shadow cutover reverted for: {', '.join(self.tables)}")
+        print(f"{Fore.GREEN}✓ Swapped the pre-cutover tables back")
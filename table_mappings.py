@@ -0,0 +1,270 @@
+import importlib
+from schema_cache import make_row_type
+
+class Copy:
+    """Target column copied from a V1 column (default when the V1 row has no such column)"""
+
+    def __init__(self, column, default=None):
+        self.column = column
+        self.default = default
+
+
+class Const:
+    """Target column with a fixed value"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Call:
+    """Target column computed by func(*V1 values).
+
+    Arguments are V1 column names or Copy specs. A func given as a string is a
+    method of the migration, so transforms can keep using its statistics and logger.
+    """
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = [arg if isinstance(arg, Copy) else Copy(arg) for arg in args]
+
+
+class Ref:
+    """V1 id of a row in another mapped table.
+
+    With preserved IDs it is copied as is; otherwise it is replaced with the
+    parent row's V2 id, which makes the parent a dependency of this table.
+    """
+
+    def __init__(self, parent, column):
+        self.parent = parent
+        self.column = column
+
+
+class OrphanedReference(Exception):
+    """A Ref whose parent row has no V2 id (never migrated, skipped or failed)"""
+
+    def __init__(self, parent, v1_id):
+        super().__init__(f"No migrated {parent} row for V1 id {v1_id}")
+        self.parent = parent
+        self.v1_id = v1_id
+
+
+class AmbiguousReference(OrphanedReference):
+    """A Ref whose V1 id is held by several parent rows in V2"""
+
+    def __init__(self, parent, v1_id, v2_ids):
+        Exception.__init__(self, f"Several migrated {parent} rows for V1 id {v1_id}: {', '.join(map(str, v2_ids))}")
+        self.parent = parent
+        self.v1_id = v1_id
+        self.v2_ids = v2_ids
+
+
+def round_balance(balance):
+    return round(float(balance), 2)
+
+
+def builtin_mappings(config):
+    """users and addresses, as migrated since the first release"""
+    users = {
+        'name': 'users',
+        'source': config.V1_TABLE,
+        'target': config.V2_TABLE,
+        'key': 'id',
+        # Target columns in insert order; 'id' is added in front when IDs are preserved
+        'columns': {
+            'operator_id': Const(None),
+            'name': Call('full_name', 'firstname', 'lastname', 'id'),
+            'email': Copy('email'),
+            'email_verified_at': Call('email_verified_timestamp', 'ev'),
+            'password': Copy('password'),
+            'two_factor_secret': Const(None),
+            'two_factor_recovery_codes': Const(None),
+            'two_factor_confirmed_at': Const(None),
+            'mobile': Call('convert_mobile_number', 'mobile'),
+            'gender': Call('convert_gender', 'gender'),
+            'city_id': Copy('city_id'),
+            'address': Call('address_string', 'address', 'id'),
+            'privacy_policy': Const(None),
+            'terms_of_service': Const(None),
+            'postal_code': Const(None),
+            'balance': Call(round_balance, Copy('balance', 0)),
+            'remember_token': Copy('remember_token'),
+            'current_team_id': Const(None),
+            'profile_photo_path': Const(None),
+            'keycard': Copy('rfid_key'),
+            'otp': Copy('ver_code'),
+            'otp_generated_at': Copy('ver_code_send_at'),
+            'public': Copy('public', 0),
+            'status': Copy('status', 1),
+            'created_by': Const(None),
+            'updated_by': Const(None),
+            'created_at': Copy('created_at'),
+            'updated_at': Copy('updated_at'),
+            'otp_verified': Const(0),
+            'v1_id': Copy('id')
+        },
+        # Pushed down into every V1 read; status=0 users are never migrated
+        'filter': config.V1_USER_FILTER,
+        'after_insert': 'insert_user_role'
+    }
+    addresses = {
+        'name': 'addresses',
+        'source': config.V1_ADDRESS_TABLE,
+        'target': config.V2_ADDRESS_TABLE,
+        'key': 'id',
+        # '*' copies every column of the cached V1 schema (without the key unless IDs are preserved)
+        'columns': '*',
+        'overrides': {'user_id': Ref('users', 'user_id')},
+        'filter': config.V1_ADDRESS_FILTER,
+        'update_exclude': ['user_id']
+    }
+    return [users, addresses]
+
+
+def load_mappings(config):
+    """Built-in mappings plus those of TABLE_MAPPINGS_MODULE, keyed by name.
+
+    The module defines get_mappings(config) returning a list of mapping dicts, e.g.:
+
+        from table_mappings import Copy, Const, Call, Ref
+
+        def get_mappings(config):
+            return [{
+                'name': 'orders',
+                'source': 'orders',
+                'target': 'orders',
+                'key': 'id',
+                'columns': {
+                    'user_id': Ref('users', 'user_id'),
+                    'total': Call(lambda amount: round(float(amount or 0), 2), 'amount'),
+                    'status': Copy('state', 'pending'),
+                    'v1_id': Copy('id')
+                },
+                'filter': "state != 'draft'",
+                'depends_on': []
+            }]
+
+    'filter' is an optional SQL condition on the source table, added to every
+    query that reads or counts it. Only the V1 columns the transform reads are
+    selected; 'read_columns' lists any others a hook needs.
+    """
+    mappings = builtin_mappings(config)
+    if config.TABLE_MAPPINGS_MODULE:
+        mappings += importlib.import_module(config.TABLE_MAPPINGS_MODULE).get_mappings(config)
+
+    by_name = {}
+    for mapping in mappings:
+        for required in ('name', 'source', 'target', 'key', 'columns'):
+            if required not in mapping:
+                raise ValueError(f"Table mapping {mapping.get('name', '?')} has no '{required}'")
+        if mapping['name'] in by_name:
+            raise ValueError(f"Table mapping {mapping['name']} is defined twice")
+        by_name[mapping['name']] = mapping
+    for mapping in by_name.values():
+        for parent in mapping_parents(mapping, preserve_ids=False):
+            if parent not in by_name:
+                raise ValueError(f"Table mapping {mapping['name']} depends on unknown table {parent}")
+    return by_name
+
+
+def mapping_parents(mapping, preserve_ids):
+    """Tables that must be migrated before this one: depends_on plus, without preserved IDs, Ref parents"""
+    parents = list(mapping.get('depends_on', []))
+    if not preserve_ids:
+        specs = list(mapping.get('overrides', {}).values())
+        if isinstance(mapping['columns'], dict):
+            specs += list(mapping['columns'].values())
+        parents += [spec.parent for spec in specs if isinstance(spec, Ref)]
+    return list(dict.fromkeys(parents))
+
+
+def dependency_order(mappings, names, preserve_ids):
+    """Order the selected tables so each comes after the selected tables it depends on"""
+    remaining = list(names)
+    ordered = []
+    while remaining:
+        ready = [name for name in remaining
+                 if all(parent in ordered or parent not in names for parent in mapping_parents(mappings[name], preserve_ids))]
+        if not ready:
+            raise ValueError(f"Circular table dependencies between: {', '.join(remaining)}")
+        ordered += ready
+        remaining = [name for name in remaining if name not in ready]
+    return ordered
+
+
+class TransformPlan:
+    """A mapping compiled for one run: insert columns, V1 columns read and a single transform function.
+
+    The transform is generated as one Python function returning the tuple of
+    target values, so a row costs one call plus the column transforms instead
+    of a loop over column specs.
+    """
+
+    def __init__(self, mapping, migration):
+        self.name = mapping['name']
+        self.source = mapping['source']
+        self.key = mapping['key']
+        self.update_exclude = set(mapping.get('update_exclude', [])) | {self.key}
+        self.depends_on = mapping_parents(mapping, migration.preserve_ids)
+        self.extra_read_columns = list(mapping.get('read_columns', []))
+
+        if mapping['columns'] == '*':
+            specs = {column: Copy(column) for column in migration.v1_schema.get_columns(self.source)}
+            if not migration.preserve_ids:
+                specs.pop(self.key, None)
+        else:
+            specs = dict(mapping['columns'])
+            if migration.preserve_ids:
+                specs = {self.key: Copy(self.key), **specs}
+        specs.update({column: spec for column, spec in mapping.get('overrides', {}).items() if column in specs})
+
+        self.specs = specs
+        self.columns = list(specs)
+        # (V1 column, parent) of every Ref, and the target column holding the V1 key (the ID-map store)
+        self.references = [(spec.column, spec.parent) for spec in specs.values() if isinstance(spec, Ref)]
+        self.id_map_column = next((column for column, spec in specs.items()
+                                   if isinstance(spec, Copy) and spec.column == self.key and column != self.key), None)
+        self.row_type = make_row_type(f"v2_{self.name}_row", self.columns)
+        self.transform = self._compile(specs, migration)
+
+        after_insert = mapping.get('after_insert')
+        self.after_insert = getattr(migration, after_insert) if isinstance(after_insert, str) else after_insert
+
+    def _compile(self, specs, migration):
+        namespace = {'remap': migration.remap_reference}
+        source_columns = []
+
+        def bind(value):
+            name = f"v{len(namespace)}"
+            namespace[name] = value
+            return name
+
+        def read(copy):
+            if copy.column not in source_columns:
+                source_columns.append(copy.column)
+            if copy.default is None:
+                return f"r.get({copy.column!r})"
+            return f"r.get({copy.column!r}, {bind(copy.default)})"
+
+        expressions = []
+        for column, spec in specs.items():
+            if isinstance(spec, Copy):
+                expressions.append(read(spec))
+            elif isinstance(spec, Const):
+                expressions.append(bind(spec.value))
+            elif isinstance(spec, Call):
+                func = getattr(migration, spec.func) if isinstance(spec.func, str) else spec.func
+                expressions.append(f"{bind(func)}({', '.join(read(arg) for arg in spec.args)})")
+            elif isinstance(spec, Ref) and migration.preserve_ids:
+                expressions.append(read(Copy(spec.column)))
+            elif isinstance(spec, Ref):
+                expressions.append(f"remap({bind(spec.parent)}, {read(Copy(spec.column))})")
+            else:
+                raise ValueError(f"Table mapping {self.name}: unsupported spec for column {column}")
+
+        self.source_columns = source_columns
+        # What a V1 read must select: the key, every column the transform reads and any extra read_columns
+        self.read_columns = list(dict.fromkeys([self.key, *source_columns, *self.extra_read_columns]))
+        code = f"def transform(r):\n    return ({', '.join(expressions)},)\n"
+        exec(compile(code, f"<transform plan {self.name}>", 'exec'), namespace)
+        return namespace['transform']
@@ -0,0 +1,172 @@
+import threading
+import mysql.connector
+from colorama import init, Fore
+from table_mappings import Copy, Ref, dependency_order
+
+init(autoreset=True)
+
+class TableScheduler:
+    """Run the selected tables of a migration concurrently, in dependency order.
+
+    Two kinds of dependencies are taken from the table mappings and the cached
+    V2 schema:
+      - table: depends_on in the mapping; the child starts after the parent finished
+      - range: a column referencing the parent's key (a Ref when IDs are not
+        preserved, or a single-column V2 foreign key between the target tables);
+        the child starts with the parent and each child batch waits until the
+        parent has committed every key the batch references
+
+    With HOLD_CHILD_BATCHES off, batches only wait on V2 foreign keys; Ref rows
+    whose parent is not committed yet are then reported as orphaned.
+
+    Every table runs on its own thread with its own V1/V2 connections, at most
+    PARALLEL_TABLES at a time. Parents are always started before their children,
+    so waiting children never hold a slot a parent needs.
+    """
+
+    def __init__(self, migration, tables, start_after_ids):
+        self.migration = migration
+        self.tables = tables
+        self.start_after_ids = start_after_ids
+        self.table_parents = {table: [] for table in tables}
+        self.range_parents = {table: [] for table in tables}
+        self.committed = dict(start_after_ids)
+        # Rows of a child batch held back until its parent rows are committed
+        self.held_rows = {table: 0 for table in tables}
+        self.finished = set()
+        self.failed = {}
+        self.condition = threading.Condition()
+        self._build_graph()
+
+    def _build_graph(self):
+        migration = self.migration
+        targets = {migration.mappings[table]['target']: table for table in self.tables}
+        for table in self.tables:
+            mapping = migration.mappings[table]
+            self.table_parents[table] = [parent for parent in mapping.get('depends_on', []) if parent in self.tables]
+
+            foreign_keys = {}
+            for fk in migration.v2_schema.get_foreign_keys(mapping['target']):
+                parent = targets.get(fk['referenced_table'])
+                if parent and parent != table and len(fk['columns']) == 1:
+                    foreign_keys[fk['columns'][0]] = parent
+
+            range_parents = []
+            for column, spec in migration.get_plan(table).specs.items():
+                if isinstance(spec, Ref) and spec.parent in self.tables and (
+                        not migration.preserve_ids or foreign_keys.get(column) == spec.parent):
+                    range_parents.append((spec.column, spec.parent, foreign_keys.get(column) == spec.parent))
+                elif isinstance(spec, (Copy, Ref)) and migration.preserve_ids and column in foreign_keys:
+                    # A copied id with a V2 foreign key needs the parent row to exist first
+                    range_parents.append((spec.column, foreign_keys[column], True))
+            # (V1 column, parent, whether a V2 foreign key enforces it)
+            self.range_parents[table] = [edge for edge in range_parents if edge[1] not in self.table_parents[table]]
+
+    def describe(self):
+        """One line per table with what it waits for"""
+        lines = []
+        for table in self.tables:
+            waits = [f"{parent} (whole table)" for parent in self.table_parents[table]]
+            waits += [f"{parent} (committed keys, via {column})" for column, parent, enforced in self.range_parents[table]
+                      if enforced or self.migration.config.HOLD_CHILD_BATCHES]
+            waits += [f"{parent} (started, via {column})" for column, parent, enforced in self.range_parents[table]
+                      if not enforced and not self.migration.config.HOLD_CHILD_BATCHES]
+            lines.append(f"{table}: {', '.join(waits) if waits else 'independent'}")
+        return lines
+
+    def order(self):
+        """Start order: every parent, of either kind, before its children"""
+        mappings = {table: {'depends_on': self.table_parents[table] + [parent for _, parent, _ in self.range_parents[table]],
+                            'columns': {}} for table in self.tables}
+        return dependency_order(mappings, self.tables, self.migration.preserve_ids)
+
+    def wait_for_parents(self, table, records):
+        """Block until every parent row referenced by the batch is committed"""
+        for column, parent, enforced in self.range_parents[table]:
+            if not enforced and not self.migration.config.HOLD_CHILD_BATCHES:
+                continue
+            needed = max((record.get(column) for record in records if record.get(column) is not None), default=None)
+            if needed is None:
+                continue
+            with self.condition:
+                while parent not in self.finished and self.committed.get(parent, 0) < needed:
+                    self.held_rows[table] = len(records)
+                    self.condition.wait()
+                self.held_rows[table] = 0
+            if parent in self.failed:
+                raise RuntimeError(f"{table} cannot continue: {parent} failed")
+
+    def queue_depths(self):
+        """Held child-batch rows per table, as queue depths"""
+        with self.condition:
+            return {f"{table}_awaiting_parents": rows for table, rows in self.held_rows.items()}
+
+    def batch_committed(self, table, last_key):
+        """Called by migrate_table after each committed batch"""
+        with self.condition:
+            self.committed[table] = last_key
+            self.condition.notify_all()
+
+    def _worker(self, table):
+        config = self.migration.config
+        v1_conn = v2_conn = None
+        try:
+            v1_conn = mysql.connector.connect(**config.V1_CONFIG)
+            v2_conn = mysql.connector.connect(**config.V2_CONFIG)
+            self.migration.migrate_table(table, start_after_id=self.start_after_ids.get(table, 0),
+                                         v1_conn=v1_conn, v2_conn=v2_conn)
+        except Exception as e:
+            self.migration.logger.error(f"Migrating {table} failed: {e}", exc_info=True)
+            self.failed[table] = e
+        finally:
+            for conn in (v1_conn, v2_conn):
+                if conn and conn.is_connected():
+                    conn.close()
+            with self.condition:
+                self.finished.add(table)
+                self.condition.notify_all()
+
+    def run(self, max_workers):
+        """Migrate all tables; raises the first table failure after every thread has stopped"""
+        migration = self.migration
+        # Compile plans and read schemas up front; the worker threads only read them
+        for table in self.tables:
+            migration.source_projection(table)
+            migration.build_migration_query(table)
+            migration.uses_id_map_store(table)
+
+        print(f"\n{Fore.CYAN}Table schedule (up to {max_workers} in parallel):")
+        for line in self.describe():
+            print(f"  {line}")
+
+        migration.scheduler = self
+        pending = self.order()
+        threads = {}
+        try:
+            with self.condition:
+                while True:
+                    if self.failed:
+                        pending = []
+                    running = len(threads) - len(self.finished)
+                    for table in list(pending):
+                        if running >= max_workers:
+                            break
+                        if not all(parent in self.finished for parent in self.table_parents[table]):
+                            continue
+                        if not all(parent in threads for _, parent, _ in self.range_parents[table]):
+                            continue
+                        pending.remove(table)
+                        threads[table] = threading.Thread(target=self._worker, args=(table,), name=f"migrate-{table}")
+                        threads[table].start()
+                        running += 1
+                    if not pending and len(self.finished) == len(threads):
+                        break
+                    self.condition.wait()
+        finally:
+            for thread in threads.values():
+                thread.join()
+            migration.scheduler = None
+
+        if self.failed:
+            table, error = next(iter(self.failed.items()))
+            raise RuntimeError(f"Migrating {table} failed: {error}") from error
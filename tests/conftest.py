@@ -0,0 +1,37 @@
+import os
+import pytest
+from config import Config
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """Config with every file it names under tmp_path (also the working directory) and small batches"""
+    os.makedirs(tmp_path / 'logs')
+    monkeypatch.chdir(tmp_path)
+
+    class TestConfig(Config):
+        V1_DATABASE = 'magiya_v1'
+        V2_DATABASE = 'magiya_v2'
+        V1_TABLE = 'users'
+        V2_TABLE = 'users'
+        V1_ADDRESS_TABLE = 'addresses'
+        V2_ADDRESS_TABLE = 'addresses'
+        V1_USER_FILTER = 'status IS NULL OR status != 0'
+        V1_ADDRESS_FILTER = ''
+        TABLE_MAPPINGS_MODULE = ''
+        BATCH_SIZE = 100
+        METRICS_PORT = 0
+        PROFILE_BATCHES = 0
+        PARALLEL_TABLES = 1
+        DEFAULT_VERIFIED_TIMESTAMP = '2024-01-01 00:00:00'
+        LOG_FILE = str(tmp_path / 'logs' / 'migration.log')
+        MANIFEST_DIR = str(tmp_path / 'logs' / 'manifests')
+        SNAPSHOT_DIR = str(tmp_path / 'logs' / 'snapshots')
+        DELTA_STATE_FILE = str(tmp_path / 'logs' / 'delta_watermarks.json')
+        CDC_STATE_FILE = str(tmp_path / 'logs' / 'cdc_position.json')
+        FAILED_RECORDS_FILE = str(tmp_path / 'logs' / 'failed_records.json')
+        DEDUP_THROTTLE_SECONDS = 0
+        ROLLBACK_THROTTLE_SECONDS = 0
+        DEDUP_REPLICA_HOSTS = []
+
+    return TestConfig
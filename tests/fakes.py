@@ -0,0 +1,154 @@
+"""In-memory stand-ins for MySQL connections and schema caches.
+
+A FakeConnection answers queries from a list of (regex, result) rules: the
+first rule whose pattern matches the whitespace-collapsed query wins. A result
+is a list of rows, a rowcount for statements that change rows, or a callable
+(query, params) returning either. Every statement is recorded.
+"""
+import re
+from schema_cache import make_row_type
+
+
+class FakeCursor:
+    def __init__(self, connection, dictionary=False):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+        self.column_names = ()
+        self.closed = False
+
+    def execute(self, query, params=None):
+        query = ' '.join(query.split())
+        self.connection.executed.append((query, params))
+        result = self.connection.respond(query, params)
+        if isinstance(result, int):
+            self.rows, self.rowcount = [], result
+        else:
+            # Rows given as dicts also name the result columns
+            self.column_names = tuple(result[0]) if result and isinstance(result[0], dict) else ()
+            self.rows = [row if self.dictionary or not isinstance(row, dict) else tuple(row.values())
+                         for row in result]
+            self.rowcount = len(self.rows)
+        self.lastrowid = self.connection.next_insert_id(query)
+
+    def executemany(self, query, seq_params):
+        rowcount = 0
+        for params in seq_params:
+            self.execute(query, params)
+            rowcount += max(self.rowcount, 0)
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        self.connection.fetch_sizes.append(size)
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def __iter__(self):
+        while self.rows:
+            yield self.rows.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, rules=None):
+        self.rules = list(rules or [])
+        self.executed = []
+        self.fetch_sizes = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.autocommit = True
+        self.insert_id = 1000
+
+    def on(self, pattern, result):
+        """Answer queries matching pattern (case-insensitive) with result"""
+        self.rules.append((re.compile(pattern, re.IGNORECASE | re.DOTALL), result))
+        return self
+
+    def respond(self, query, params):
+        for pattern, result in self.rules:
+            if pattern.search(query):
+                if callable(result):
+                    return result(query, params)
+                return result if isinstance(result, int) else list(result)
+        return []
+
+    def next_insert_id(self, query):
+        if query.upper().startswith('INSERT'):
+            self.insert_id += 1
+            return self.insert_id
+        return None
+
+    def queries(self, pattern=''):
+        """Executed statements matching pattern"""
+        regex = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        return [query for query, _ in self.executed if regex.search(query)]
+
+    def params(self, pattern):
+        """Parameters of the executed statements matching pattern"""
+        regex = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        return [params for query, params in self.executed if regex.search(query)]
+
+    def cursor(self, dictionary=False, buffered=False, **kwargs):
+        return FakeCursor(self, dictionary)
+
+    def start_transaction(self, **kwargs):
+        self.executed.append(('START TRANSACTION', None))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def is_connected(self):
+        return not self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSchema:
+    """SchemaCache answering from dicts keyed by table name"""
+
+    def __init__(self, columns=None, indexes=None, foreign_keys=None, referencing=None):
+        self.columns = columns or {}
+        self.indexes = indexes or {}
+        self.foreign_keys = foreign_keys or {}
+        self.referencing = referencing or {}
+        self._row_types = {}
+
+    def get_columns(self, table):
+        return list(self.columns.get(table, []))
+
+    def get_indexes(self, table):
+        return [dict(index) for index in self.indexes.get(table, [])]
+
+    def get_foreign_keys(self, table):
+        return [dict(fk) for fk in self.foreign_keys.get(table, [])]
+
+    def get_referencing_tables(self, table):
+        return list(self.referencing.get(table, []))
+
+    def table_exists(self, table):
+        return table in self.columns
+
+    def get_row_type(self, table, columns=None):
+        columns = tuple(columns or self.get_columns(table))
+        if (table, columns) not in self._row_types:
+            self._row_types[(table, columns)] = make_row_type(f"{table}_row", columns)
+        return self._row_types[(table, columns)]
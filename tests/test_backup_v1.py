@@ -0,0 +1,130 @@
+import io
+import json
+import os
+import pytest
+import backup_v1
+from fakes import FakeConnection
+
+
+class FakeProcess:
+    """A mysqldump/mysql child process: prints canned output or records what is piped into it"""
+
+    def __init__(self, cmd, events, output=''):
+        self.cmd = cmd
+        self.events = events
+        self.stdout = io.StringIO(output)
+        self.stdin = self
+        self.received = []
+        self.returncode = 0
+
+    def write(self, line):
+        self.received.append(line)
+
+    def close(self):
+        self.events.append(('mysql', ''.join(self.received)))
+
+    def wait(self):
+        return self.returncode
+
+
+@pytest.fixture
+def processes(monkeypatch):
+    events = []
+
+    def popen(cmd, stdout=None, stdin=None, text=None):
+        output = '-- triggers\n' if '--triggers' in cmd else '-- schema\n'
+        events.append(('popen', cmd))
+        return FakeProcess(cmd, events, output)
+
+    monkeypatch.setattr(backup_v1.subprocess, 'Popen', popen)
+    return events
+
+
+def test_plan_chunks_lists_stored_columns_only():
+    conn = (FakeConnection()
+            .on(r'FROM information_schema.COLUMNS', [('users', 'id'), ('users', 'email'), ('logs', 'line')])
+            .on(r'FROM information_schema.TABLES', [('logs', None, None, 0), ('users', 'id', 'int', 1)])
+            .on(r'SELECT MIN', [(1, 250)]))
+
+    chunks = backup_v1.plan_chunks(conn, 'magiya_v1', 100)
+
+    [columns_query] = conn.queries(r'information_schema.COLUMNS WHERE')
+    assert "EXTRA NOT LIKE '%%VIRTUAL GENERATED%%'" in columns_query
+    assert "EXTRA NOT LIKE '%%STORED GENERATED%%'" in columns_query
+    assert chunks[0] == {'table': 'logs', 'columns': ['line'], 'key': None, 'range': None}
+    assert [chunk['range'] for chunk in chunks[1:]] == [[1, 100], [101, 200], [201, None]]
+    assert all(chunk['columns'] == ['id', 'email'] for chunk in chunks[1:])
+
+
+def test_dump_chunk_selects_the_planned_columns(tmp_path):
+    conn = FakeConnection().on(r'SELECT', [(1, "o'neil@example.com"), (2, None), (3, 'c@example.com')])
+    chunk = {'table': 'users', 'columns': ['id', 'email'], 'key': 'id', 'range': [1, None]}
+    path = tmp_path / 'users.00000.sql'
+
+    rows = backup_v1.dump_chunk(conn, chunk, str(path), 'none', 2)
+
+    assert rows == 3
+    assert conn.executed == [("SELECT `id`, `email` FROM `users` WHERE `id` >= %s", (1,))]
+    assert path.read_text().splitlines() == [
+        "INSERT INTO `users` (`id`, `email`) VALUES (1,'o\\'neil@example.com'),(2,NULL);",
+        "INSERT INTO `users` (`id`, `email`) VALUES (3,'c@example.com');"
+    ]
+
+
+def test_schema_is_dumped_without_triggers(config, processes, tmp_path):
+    backup_v1.dump_schema(config, str(tmp_path / 'schema.sql'), 'none')
+    backup_v1.dump_triggers(config, str(tmp_path / 'triggers.sql'), 'none')
+
+    (_, schema_cmd), (_, triggers_cmd) = processes
+    assert '--skip-triggers' in schema_cmd and '--triggers' not in schema_cmd
+    assert {'--triggers', '--no-data', '--no-create-info'} <= set(triggers_cmd)
+    assert (tmp_path / 'triggers.sql').read_text() == '-- triggers\n'
+
+
+def write_backup(backup_dir, chunks, triggers=True):
+    os.makedirs(backup_dir)
+    for name, text in [('schema.sql', 'CREATE TABLE users (id INT);\n'), ('triggers.sql', 'CREATE TRIGGER t;\n')]:
+        with open(os.path.join(backup_dir, name), 'w') as f:
+            f.write(text)
+    for chunk in chunks:
+        with open(os.path.join(backup_dir, chunk['file']), 'w') as f:
+            f.write(f"INSERT INTO `users` (`id`) VALUES ({chunk['range'][0]});\n")
+    manifest = {'database': 'magiya_v1', 'compression': 'none', 'schema_file': 'schema.sql', 'chunks': chunks}
+    if triggers:
+        manifest['triggers_file'] = 'triggers.sql'
+    with open(os.path.join(backup_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+
+def restore(config, monkeypatch, processes, backup_dir, conn):
+    monkeypatch.setattr(backup_v1, 'Config', lambda: config)
+    monkeypatch.setattr(backup_v1.mysql.connector, 'connect', lambda **kwargs: conn)
+    conn.on(r'INSERT', lambda query, params: processes.append(('chunk', query)) or 1)
+    return backup_v1.restore_parallel_backup(backup_dir, workers=1)
+
+
+def test_restore_creates_triggers_after_every_chunk(config, monkeypatch, processes, tmp_path):
+    chunks = [{'table': 'users', 'file': f"users.0000{n}.sql", 'range': [n, n]} for n in (1, 2)]
+    write_backup(str(tmp_path / 'backup'), chunks)
+
+    assert restore(config, monkeypatch, processes, str(tmp_path / 'backup'), FakeConnection())
+
+    steps = [(kind, detail) for kind, detail in processes if kind != 'popen']
+    assert steps == [
+        ('mysql', 'CREATE TABLE users (id INT);\n'),
+        ('chunk', 'INSERT INTO `users` (`id`) VALUES (1);'),
+        ('chunk', 'INSERT INTO `users` (`id`) VALUES (2);'),
+        ('mysql', 'CREATE TRIGGER t;\n')
+    ]
+
+
+def test_restore_skips_triggers_when_a_chunk_fails(config, monkeypatch, processes, tmp_path, capsys):
+    chunks = [{'table': 'users', 'file': 'users.00001.sql', 'range': [1, 1]}]
+    write_backup(str(tmp_path / 'backup'), chunks)
+    conn = FakeConnection().on(r'INSERT', lambda query, params: (_ for _ in ()).throw(
+        backup_v1.mysql.connector.Error('duplicate key')))
+
+    assert not restore(config, monkeypatch, processes, str(tmp_path / 'backup'), conn)
+
+    assert ('mysql', 'CREATE TRIGGER t;\n') not in processes
+    assert 'triggers not created' in capsys.readouterr().out
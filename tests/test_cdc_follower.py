@@ -0,0 +1,123 @@
+import json
+import pytest
+
+pytest.importorskip('pymysqlreplication')
+
+import cdc_follower
+from cdc_follower import BinlogFollower
+from pymysqlreplication.event import XidEvent
+from pymysqlreplication.row_event import RowsEvent, WriteRowsEvent, UpdateRowsEvent, DeleteRowsEvent
+
+
+def make_event(event_type, rows=None, **attributes):
+    """Binlog event without a packet to parse, as the stream would yield it"""
+    event = event_type.__new__(event_type)
+    event.__dict__.update(attributes)
+    if issubclass(event_type, RowsEvent):
+        # Rows are decoded lazily into a private attribute; hand them over already decoded
+        event._RowsEvent__rows = rows
+    return event
+
+
+class FakeStream:
+    """Replays events, moving log_pos past each one like BinLogStreamReader"""
+
+    def __init__(self, events):
+        self.events = events
+        self.log_file = 'binlog.000001'
+        self.log_pos = 100
+        self.closed = False
+
+    def __iter__(self):
+        for position, event in self.events:
+            self.log_pos = position
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def follower(config):
+    config.CDC_BATCH_SIZE = 2
+    config.CDC_FLUSH_INTERVAL = 3600
+    follower = BinlogFollower(config)
+    follower.position = {'log_file': 'binlog.000001', 'log_pos': 100}
+    follower.applied = []
+    follower.migrate_batch = lambda records, table_type: follower.applied.append(('upsert', table_type, records))
+    follower.apply_deletes = lambda table_type, ids: follower.applied.append(('delete', table_type, ids))
+    yield follower
+    follower.close_connections()
+
+
+def test_queue_keeps_latest_image_per_row(follower):
+    follower.queue_row_event(make_event(WriteRowsEvent, rows=[{'values': {'id': 1, 'status': 1}},
+                                                             {'values': {'id': 2, 'status': 1}}]), 'users')
+    follower.queue_row_event(make_event(UpdateRowsEvent, rows=[
+        {'before_values': {'id': 1, 'status': 1}, 'after_values': {'id': 1, 'status': 1, 'email': 'new@example.com'}},
+        {'before_values': {'id': 2, 'status': 1}, 'after_values': {'id': 2, 'status': 0}}
+    ]), 'users')
+
+    assert follower.pending_upserts['users'] == {1: {'id': 1, 'status': 1, 'email': 'new@example.com'}}
+    # Deactivated users are never migrated, so they are deleted from V2
+    assert follower.pending_deletes['users'] == {2}
+
+    follower.queue_row_event(make_event(WriteRowsEvent, rows=[{'values': {'id': 2, 'status': 1}}]), 'users')
+    assert follower.pending_deletes['users'] == set()
+    assert follower.pending_count() == 2
+
+
+def test_follow_saves_position_only_at_transaction_boundaries(follower, monkeypatch):
+    stream = FakeStream([
+        (150, make_event(WriteRowsEvent, table='users', rows=[{'values': {'id': 1, 'status': 1}}])),
+        (180, make_event(WriteRowsEvent, table='addresses', rows=[{'values': {'id': 10, 'user_id': 1}}])),
+        (200, make_event(XidEvent, timestamp=0)),
+        (250, make_event(DeleteRowsEvent, table='users', rows=[{'values': {'id': 3, 'status': 1}}]))
+    ])
+    monkeypatch.setattr(follower, 'build_stream', lambda table_types: stream)
+    monkeypatch.setattr(cdc_follower.time, 'time', lambda: 5)
+
+    follower.follow(['users', 'addresses'])
+
+    assert stream.closed
+    assert follower.applied == [
+        ('upsert', 'users', [{'id': 1, 'status': 1}]),
+        ('upsert', 'addresses', [{'id': 10, 'user_id': 1}]),
+        ('delete', 'users', [3])
+    ]
+    # The delete after the last commit is applied, but replayed after a restart
+    with open(follower.position_file) as f:
+        assert json.load(f) == {'log_file': 'binlog.000001', 'log_pos': 200}
+    assert follower.stats['cdc']['events_received'] == 3
+    assert follower.stats['cdc']['rows_upserted'] == 2
+    assert follower.stats['cdc']['rows_deleted'] == 1
+    assert follower.stats['cdc']['replication_lag_seconds'] == 5
+
+
+def test_deletes_without_a_v1_key_are_counted(follower):
+    follower.preserve_ids = False
+    follower.queue_row_event(make_event(DeleteRowsEvent, rows=[{'values': {'id': 10}}, {'values': {'id': 11}}]), 'addresses')
+    follower.queue_row_event(make_event(DeleteRowsEvent, rows=[{'values': {'id': 3, 'status': 1}}]), 'users')
+
+    follower.flush(['users', 'addresses'])
+
+    # users keep their V1 id in v1_id; addresses have no V1 key in V2
+    assert follower.applied == [('delete', 'users', [3])]
+    assert follower.stats['cdc']['rows_deleted'] == 1
+    assert follower.stats['cdc']['deletes_skipped'] == 2
+    assert follower.pending_count() == 0
+
+
+def test_run_refuses_auto_increment_ids(follower, capsys):
+    follower.connect_databases = lambda: True
+    follower.select_tables_to_migrate = lambda: True
+
+    def auto_increment():
+        follower.preserve_ids = False
+        return True
+    follower.select_id_strategy = auto_increment
+    follower.follow = lambda table_types: pytest.fail("followed the binlog without preserved IDs")
+
+    follower.run()
+
+    assert 'Binlog follower needs preserved IDs' in capsys.readouterr().out
@@ -0,0 +1,91 @@
+import logging
+import pytest
+from deferred_indexes import DeferredIndexBuild
+from migration import MagiyaMigration
+from fakes import FakeConnection, FakeSchema
+
+USER_INDEXES = [
+    {'name': 'users_email_unique', 'unique': True, 'type': 'BTREE', 'columns': ['email'], 'parts': ['`email`']},
+    {'name': 'users_city_id_foreign', 'unique': False, 'type': 'BTREE', 'columns': ['city_id'], 'parts': ['`city_id`']},
+    {'name': 'users_v1_id_index', 'unique': False, 'type': 'BTREE', 'columns': ['v1_id'], 'parts': ['`v1_id`']},
+    {'name': 'users_name_lower', 'unique': False, 'type': 'BTREE', 'columns': [], 'parts': ['(lower(`name`))']},
+    {'name': 'users_mobile_unique', 'unique': True, 'type': 'BTREE', 'columns': ['mobile'], 'parts': ['`mobile`']}
+]
+USER_FOREIGN_KEYS = [{'name': 'users_city_id_foreign', 'columns': ['city_id'], 'referenced_table': 'cities',
+                      'referenced_columns': ['id'], 'on_delete': 'SET NULL', 'on_update': 'RESTRICT'}]
+
+
+def make_build(conn=None, keep_columns=('v1_id',)):
+    schema = FakeSchema(indexes={'users': USER_INDEXES}, foreign_keys={'users': USER_FOREIGN_KEYS})
+    return DeferredIndexBuild(conn or FakeConnection(), schema, 'users', logging.getLogger('test_deferred_indexes'),
+                              keep_columns=keep_columns)
+
+
+def test_foreign_key_and_id_map_indexes_are_kept():
+    build = make_build()
+    assert [index['name'] for index in build.droppable_indexes()] == [
+        'users_email_unique', 'users_name_lower', 'users_mobile_unique']
+    assert 'users_v1_id_index' in [index['name'] for index in make_build(keep_columns=()).droppable_indexes()]
+
+
+def test_drop_and_rebuild_use_one_alter_each():
+    build = make_build()
+    build.drop()
+    build.rebuild()
+    assert build.conn.queries() == [
+        'ALTER TABLE users DROP INDEX `users_email_unique`, DROP INDEX `users_name_lower`, DROP INDEX `users_mobile_unique`',
+        'ALTER TABLE users ADD UNIQUE INDEX `users_email_unique` (`email`), ADD INDEX `users_name_lower` ((lower(`name`))), '
+        'ADD UNIQUE INDEX `users_mobile_unique` (`mobile`)'
+    ]
+
+
+def test_nothing_to_drop():
+    build = DeferredIndexBuild(FakeConnection(), FakeSchema(), 'users', logging.getLogger('test_deferred_indexes'))
+    assert build.drop() == []
+    build.rebuild()
+    assert build.conn.executed == []
+
+
+def test_duplicates_exclude_the_first_row_of_each_group():
+    conn = FakeConnection().on(r'HAVING COUNT\(\*\) > 1', [{'id': 7, 'email': 'a@example.com', 'v1_id': 70}])
+    build = make_build(conn)
+
+    assert build.find_duplicates(USER_INDEXES[0]) == [{'id': 7, 'email': 'a@example.com', 'v1_id': 70}]
+    [query] = conn.queries()
+    assert 'MIN(id) as keep_id' in query and 't.id != d.keep_id' in query and '`email` IS NOT NULL' in query
+    # Functional indexes cannot be grouped on
+    assert build.find_duplicates(USER_INDEXES[3]) == []
+
+
+@pytest.fixture
+def migration(config):
+    migration = MagiyaMigration(config)
+    migration.preserve_ids = False
+    migration.migrate_users = migration.migrate_addresses = True
+    migration.has_role_user_table = True
+    migration.v1_conn, migration.v2_conn = FakeConnection(), FakeConnection()
+    migration.v1_schema = FakeSchema({'addresses': ['id', 'user_id', 'address']})
+    yield migration
+    migration.close_connections()
+
+
+def test_post_load_duplicates_fail_with_their_children(migration):
+    build = make_build(migration.v2_conn)
+    build.indexes = [USER_INDEXES[0]]
+    migration.v2_conn.on(r'HAVING COUNT\(\*\) > 1', [{'id': 7, 'email': 'a@example.com', 'v1_id': 70}])
+    migration.v2_conn.on(r'^DELETE FROM addresses', 2).on(r'^DELETE FROM role_user', 1).on(r'^DELETE FROM users', 1)
+    migration.v1_conn.on(r'FROM users WHERE `id` IN', [{'id': 70, 'email': 'A@example.com'}])
+    migration.v1_conn.on(r'FROM addresses WHERE `user_id` IN', [{'id': 5, 'user_id': 70}, {'id': 6, 'user_id': 70}])
+    migration.stats['users']['migrated_records'] = 10
+    migration.stats['addresses']['migrated_records'] = 20
+
+    migration.resolve_post_load_duplicates('users', build)
+
+    assert migration.v2_conn.queries(r'^DELETE') == [
+        'DELETE FROM addresses WHERE `user_id` IN (%s)', 'DELETE FROM role_user WHERE user_id IN (%s)',
+        'DELETE FROM users WHERE id IN (%s)']
+    assert migration.failed_records['users'][0]['record'] == {'id': 70, 'email': 'A@example.com'}
+    assert [failure['record']['id'] for failure in migration.failed_records['addresses']] == [5, 6]
+    assert migration.stats['users']['duplicate_email_errors'] == 1
+    assert (migration.stats['users']['migrated_records'], migration.stats['users']['failed_records']) == (9, 1)
+    assert (migration.stats['addresses']['migrated_records'], migration.stats['addresses']['orphaned_records']) == (18, 2)
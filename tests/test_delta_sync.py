@@ -0,0 +1,111 @@
+import json
+from datetime import datetime
+import pytest
+from delta_sync import DeltaSync
+from fakes import FakeConnection, FakeSchema
+
+USER_COLUMNS = ['id', 'firstname', 'lastname', 'email', 'ev', 'password', 'mobile', 'gender', 'city_id',
+                'address', 'balance', 'remember_token', 'rfid_key', 'ver_code', 'ver_code_send_at',
+                'public', 'status', 'created_at', 'updated_at', 'legacy_notes']
+
+
+@pytest.fixture
+def sync(config):
+    config.BATCH_SIZE = 2
+    sync = DeltaSync(config)
+    sync.v1_conn, sync.v2_conn = FakeConnection(), FakeConnection()
+    sync.v1_schema = FakeSchema({'users': USER_COLUMNS, 'addresses': ['id', 'user_id', 'address']})
+    sync.has_role_user_table = True
+    yield sync
+    sync.close_connections()
+
+
+def serve_changes(rows):
+    """V1 change scan: NULL updated_at rows by id, then (updated_at, id) keyset pages of BATCH_SIZE"""
+    def answer(query, params):
+        if 'updated_at IS NULL' in query:
+            matches = sorted((row for row in rows if row['updated_at'] is None and row['id'] > params[0]),
+                             key=lambda row: row['id'])
+        else:
+            last_updated, _, last_id = params
+            matches = sorted((row for row in rows if row['updated_at'] is not None and
+                              (row['updated_at'], row['id']) > (last_updated, last_id)),
+                             key=lambda row: (row['updated_at'], row['id']))
+        return matches[:2]
+    return answer
+
+
+def test_change_scan_reads_projected_filtered_rows(sync):
+    rows = [{'id': 1, 'updated_at': None}, {'id': 2, 'updated_at': datetime(2024, 1, 2)},
+            {'id': 3, 'updated_at': datetime(2024, 1, 1)}, {'id': 4, 'updated_at': datetime(2024, 1, 2)}]
+    sync.v1_conn.on(r'FROM users', serve_changes(rows))
+
+    batches = list(sync.fetch_changed_batches('users'))
+
+    assert [[row['id'] for row in batch] for batch in batches] == [[1], [3, 2], [4]]
+    [query] = set(sync.v1_conn.queries(r'updated_at > %s'))
+    assert query.startswith('SELECT `id`, `firstname`')
+    assert '`legacy_notes`' not in query and '*' not in query
+    # The same row filter as the migration and the delete scan
+    assert 'AND (status IS NULL OR status != 0)' in query
+    assert all('(status IS NULL OR status != 0)' in query for query in sync.v1_conn.queries(r'updated_at IS NULL'))
+
+
+def test_sync_advances_the_watermark_after_each_batch(sync, config):
+    sync.watermarks = {'users': {'updated_at': '2024-01-01 00:00:00', 'id': 3}}
+    rows = [{'id': 5, 'updated_at': datetime(2024, 1, 1, 0, 0, 30)}, {'id': 6, 'updated_at': datetime(2024, 1, 3)}]
+    sync.v1_conn.on(r'FROM users', serve_changes(rows))
+    migrated = []
+    sync.migrate_batch = lambda records, table_type: migrated.append([record['id'] for record in records])
+
+    sync.sync_table('users')
+
+    # The overlap window re-reads rows committed late with an older updated_at
+    assert sync.v1_conn.params(r'updated_at > %s')[0] == (datetime(2023, 12, 31, 23, 59), datetime(2023, 12, 31, 23, 59), 0)
+    assert migrated == [[5, 6]]
+    assert sync.stats['users']['total_records'] == 2
+    with open(config.DELTA_STATE_FILE) as f:
+        assert json.load(f) == {'users': {'updated_at': '2024-01-03 00:00:00', 'id': 6}}
+
+
+def test_detect_deletes_compares_only_changed_ranges(sync, config):
+    config.DELTA_DELETE_CHUNK_SIZE = 10
+    sync.v1_conn.on(r'GROUP BY chunk', [(0, 3, 1 ^ 2 ^ 3), (1, 1, 11)])
+    sync.v1_conn.on(r'SELECT id FROM users', [(11,)])
+    sync.v2_conn.on(r'GROUP BY chunk', [(0, 3, 1 ^ 2 ^ 3), (1, 2, 11 ^ 12), (2, 1, 20)])
+    sync.v2_conn.on(r'SELECT id FROM users WHERE id >= %s', lambda query, params: {10: [(11,), (12,)], 20: [(20,)]}[params[0]])
+
+    assert sync.detect_deletes('users') == [12, 20]
+    assert sync.v2_conn.params(r'SELECT id FROM users WHERE id >= %s') == [(10, 20), (20, 30)]
+    [v1_signatures] = sync.v1_conn.queries(r'GROUP BY chunk')
+    assert 'AND (status IS NULL OR status != 0) AND NOT (status <=> 0)' in v1_signatures
+
+
+def test_detect_deletes_needs_a_v1_key_column(sync):
+    sync.preserve_ids = False
+    assert sync.detect_deletes('addresses') == []
+    assert sync.v1_conn.executed == []
+
+
+def test_apply_deletes_removes_role_assignments_first(sync):
+    sync.v2_conn.on(r'^DELETE FROM users', lambda query, params: len(params))
+
+    assert sync.apply_deletes('users', [4, 9]) == 2
+    assert [query.split(' WHERE')[0] for query in sync.v2_conn.queries(r'^DELETE')] == [
+        'DELETE ru FROM role_user ru JOIN users u ON u.id = ru.user_id', 'DELETE FROM users']
+    assert sync.v2_conn.commits == 1
+
+
+def test_run_refuses_auto_increment_ids(sync, capsys):
+    sync.connect_databases = lambda: True
+    sync.select_tables_to_migrate = lambda: True
+
+    def auto_increment():
+        sync.preserve_ids = False
+        return True
+    sync.select_id_strategy = auto_increment
+    sync.sync_table = lambda table_type: pytest.fail("synced without preserved IDs")
+
+    sync.run()
+
+    assert 'Delta sync needs preserved IDs' in capsys.readouterr().out
@@ -0,0 +1,99 @@
+import pytest
+from dry_run import DryRun, format_duration
+from metrics import observe
+from fakes import FakeConnection, FakeSchema
+
+USERS = [(1, 'ann@example.com', '0771234567'), (2, 'ANN@example.com', None),
+         (3, 'bob@example.com', '0771234567'), (4, 'cat@example.com', None)]
+
+
+@pytest.fixture
+def dry_run(config):
+    config.DRY_RUN_FRACTION = 0.5
+    dry_run = DryRun(config)
+    dry_run.preserve_ids = False
+    dry_run.migrate_users = dry_run.migrate_addresses = True
+    dry_run.v1_conn, dry_run.v2_conn = FakeConnection(), FakeConnection()
+    dry_run.v1_schema = FakeSchema({'users': ['id', 'firstname', 'lastname', 'email', 'mobile', 'status'],
+                                    'addresses': ['id', 'user_id', 'address']})
+    dry_run.latency = {'v1': 0.001, 'v2': 0.002}
+    yield dry_run
+    dry_run.close_connections()
+
+
+def scanned_users(query, params):
+    return [row for row in USERS if row[0] > params[0]]
+
+
+def members(position):
+    return lambda query, params: [(row[0], row[position]) for row in USERS if row[0] in params]
+
+
+def test_duplicate_failures_are_counted_exactly_from_v1(dry_run):
+    dry_run.v1_conn.on(r'WHERE id > %s', scanned_users).on(r'SELECT id, email', members(1)).on(r'SELECT id, mobile', members(2))
+
+    # Inserted in id order: 2 loses on the email, 3 on the mobile
+    assert dry_run.count_duplicate_failures() == 2
+
+    dry_run.v1_conn.executed.clear()
+    dry_run.duplicate_preflight = object()
+    assert dry_run.count_duplicate_failures() == 0
+    assert not dry_run.v1_conn.executed
+
+
+def sampled(dry_run, table_type, total, sampled_rows):
+    dry_run.stats[table_type]['total_records'] = total
+    dry_run.stats[table_type]['rows_transformed'] = sampled_rows
+    dry_run.samples[table_type].update(sampled=sampled_rows, write_candidates=sampled_rows)
+    observe(dry_run.stats[table_type]['phase_seconds']['fetch'], 0.5)
+    observe(dry_run.stats[table_type]['phase_seconds']['transform'], 1.0)
+
+
+def test_estimate_labels_where_the_duplicate_figure_comes_from(dry_run, capsys):
+    sampled(dry_run, 'users', 1000, 500)
+    sampled(dry_run, 'addresses', 2000, 1000)
+    dry_run.exact_duplicate_failures['users'] = 7
+    probe = {'rows': 500, 'integrity_errors': 5, 'seconds_per_row': 0.001, 'commit_seconds': 0.01}
+    dry_run.write_probe = {'users': probe, 'addresses': probe}
+
+    users, addresses = dry_run.estimate('users'), dry_run.estimate('addresses')
+
+    assert (users['predicted_duplicate_key_failures'], users['duplicate_key_failures_basis']) == (7, 'exact')
+    assert addresses['rows_to_write'] == 2000
+    assert addresses['predicted_duplicate_key_failures'] == 20
+    assert addresses['duplicate_key_failures_basis'] == 'estimate from 500 sample rows'
+    # 20 batches of 100: one fetch per batch, transform scaled by 2, writes per row plus a commit per batch
+    assert addresses['estimated_seconds'] == {'fetch': 10.0, 'transform': 2.0, 'write': 2.2, 'total': 14.2}
+
+    dry_run.print_estimate({'users': users, 'addresses': addresses})
+    out = capsys.readouterr().out
+    assert 'Predicted duplicate-key failures (exact): ' in out
+    assert 'Predicted duplicate-key failures (estimate from 500 sample rows): ' in out
+
+
+def test_estimate_without_probe_falls_back_to_latency(dry_run):
+    sampled(dry_run, 'addresses', 200, 100)
+
+    estimate = dry_run.estimate('addresses')
+
+    assert estimate['predicted_duplicate_key_failures'] is None
+    assert estimate['duplicate_key_failures_basis'] is None
+    # Two batches: one V2 round trip per row and one per commit
+    assert estimate['estimated_seconds']['write'] == round(200 * 0.002 + 2 * 0.002, 1)
+
+
+def test_dry_run_table_skips_id_ranges_for_a_fraction(dry_run):
+    dry_run.config.BATCH_SIZE = 2
+    dry_run.v1_conn.on(r'COUNT\(\*\)', [(8, 8)]).on(r'FROM addresses WHERE', lambda query, params: [
+        {'id': row_id, 'user_id': 1, 'address': 'Main St'} for row_id in range(1, 9) if row_id > params[0]][:2])
+
+    dry_run.dry_run_table('addresses')
+
+    # Each batch of ids 2 wide is followed by a skipped range of the same width
+    assert [params[0] for params in dry_run.v1_conn.params(r'FROM addresses WHERE .* ORDER BY')] == [0, 4, 8]
+    assert dry_run.samples['addresses']['sampled'] == 4
+    assert not dry_run.v2_conn.executed
+
+
+def test_format_duration():
+    assert [format_duration(s) for s in (42, 125, 3725)] == ['42s', '2m 5s', '1h 2m 5s']
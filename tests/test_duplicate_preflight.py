@@ -0,0 +1,79 @@
+import logging
+import pytest
+from duplicate_preflight import DuplicatePreflight
+from fakes import FakeConnection
+
+USERS = [
+    (1, 'Ann@example.com', '0771234567'),
+    (2, 'ann@example.com ', None),
+    (3, 'bob@example.com', '+94771234567'),
+    (4, 'carl@example.com', '771234567'),
+    (5, 'dora@example.com', 'not a number'),
+    (6, 'eve@example.com', 'not a number')
+]
+
+
+def serve_users(query, params):
+    """Keyset pages of (id, email, mobile), and candidate re-reads by id"""
+    if 'WHERE id IN' in query:
+        column = 1 if 'SELECT id, email' in query else 2
+        return [(row[0], row[column]) for row in USERS if row[0] in params]
+    return [row for row in USERS if row[0] > params[0]][:4]
+
+
+def make_preflight(config, policy):
+    config.DUPLICATE_SCAN_CHUNK_SIZE = 4
+    conn = FakeConnection().on(r'FROM users', serve_users)
+    return DuplicatePreflight(conn, config, logging.getLogger('test_duplicate_preflight'), policy)
+
+
+def test_scan_groups_exact_keys_of_the_migrated_rows(config):
+    preflight = make_preflight(config, 'keep_first')
+    groups = preflight.scan()
+
+    assert groups == {'email': {'ann@example.com': [1, 2]}, 'mobile': {'+94771234567': [1, 3, 4]}}
+    assert preflight.scanned == 6
+    # Only the rows the users mapping reads are scanned
+    assert all('AND (status IS NULL OR status != 0) AND NOT (status <=> 0)' in query
+               for query in preflight.conn.queries(r'WHERE id > %s'))
+
+
+def test_scan_follows_the_configured_filter(config):
+    config.V1_USER_FILTER = 'deleted_at IS NULL'
+    preflight = make_preflight(config, 'keep_first')
+    preflight.scan()
+    assert 'WHERE id > %s AND (deleted_at IS NULL) AND NOT (status <=> 0)' in preflight.conn.queries(r'WHERE id > %s')[0]
+
+    config.V1_USER_FILTER = ''
+    preflight = make_preflight(config, 'keep_first')
+    preflight.scan()
+    assert 'WHERE id > %s AND NOT (status <=> 0) ORDER BY id' in preflight.conn.queries(r'WHERE id > %s')[0]
+
+
+@pytest.mark.parametrize('policy, skipped', [
+    ('keep_first', {2, 3, 4}),
+    # 4 keeps the mobile, so 1 is skipped and 2 keeps the email
+    ('keep_last', {1, 3}),
+    ('skip', {1, 2, 3, 4}),
+    ('suffix', set())
+])
+def test_policies(config, policy, skipped):
+    preflight = make_preflight(config, policy)
+    preflight.scan()
+    preflight.resolve()
+    assert preflight.skip_ids == skipped
+
+
+def test_suffix_rewrites_later_members(config):
+    preflight = make_preflight(config, 'suffix')
+    preflight.scan()
+    preflight.resolve()
+
+    assert dict(preflight.overrides) == {2: {'email': 'ann@example.com_DUP_2'}, 3: {'mobile': None}, 4: {'mobile': None}}
+    assert preflight.apply(2, {'email': 'ann@example.com ', 'name': 'Ann'}) == {'email': 'ann@example.com_DUP_2', 'name': 'Ann'}
+    assert preflight.apply(1, {'email': 'Ann@example.com'}) == {'email': 'Ann@example.com'}
+
+
+def test_unknown_policy_is_rejected(config):
+    with pytest.raises(ValueError, match='Unknown duplicate policy'):
+        DuplicatePreflight(FakeConnection(), config, logging.getLogger('test_duplicate_preflight'), 'newest')
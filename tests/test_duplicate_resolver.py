@@ -0,0 +1,211 @@
+import csv
+import glob
+import json
+import re
+import pytest
+import duplicate_resolver
+from duplicate_resolver import DuplicateResolver
+from fakes import FakeConnection, FakeSchema
+
+MEMBERS = [
+    {'id': 1, 'email': 'ann@example.com', 'name': 'Ann'},
+    {'id': 4, 'email': 'ANN@example.com', 'name': 'Ann L'},
+    {'id': 2, 'email': 'bob@example.com', 'name': 'Bob'},
+    {'id': 3, 'email': 'bob@example.com', 'name': 'Bobby'},
+    {'id': 5, 'email': 'eve@example.com', 'name': 'Eve'},
+    {'id': 6, 'email': 'eve@example.com', 'name': 'Eve 2'}
+]
+
+
+@pytest.fixture
+def resolver(config):
+    config.BATCH_SIZE = 2
+    return DuplicateResolver(config)
+
+
+def export(resolver, monkeypatch, file_format):
+    groups_conn = FakeConnection().on(r'GROUP BY email', [('ann@example.com', 2), ('bob@example.com', 2), ('eve@example.com', 2)])
+    rows_conn = FakeConnection().on(r'SELECT \* FROM users', lambda query, params: [
+        row for row in MEMBERS if row['email'].lower() in [value.lower() for value in params]])
+    monkeypatch.setattr(duplicate_resolver.mysql.connector, 'connect', lambda **kwargs: rows_conn)
+    path = f"logs/duplicates.{file_format}"
+    return resolver.export_duplicate_groups(groups_conn, 'email', path, file_format), groups_conn, rows_conn, path
+
+
+def test_export_streams_pages_of_groups_and_rows(resolver, monkeypatch):
+    (groups, rows), groups_conn, rows_conn, path = export(resolver, monkeypatch, 'csv')
+
+    assert (groups, rows) == (3, 6)
+    [group_query] = groups_conn.queries()
+    # Empty strings are not a duplicate group
+    assert "WHERE email IS NOT NULL AND email != '' GROUP BY email" in group_query
+    assert groups_conn.fetch_sizes == [2, 2, 2]
+    assert rows_conn.params(r'IN') == [['ann@example.com', 'bob@example.com'], ['eve@example.com']]
+    # Member rows are fetched a page at a time, never all at once
+    assert set(rows_conn.fetch_sizes) == {2}
+    assert rows_conn.closed
+    with open(path, newline='') as f:
+        lines = list(csv.reader(f))
+    assert lines[0] == ['duplicate_field', 'duplicate_value', 'group_size', 'id', 'email', 'name']
+    assert lines[2] == ['email', 'ANN@example.com', '2', '4', 'ANN@example.com', 'Ann L']
+
+
+def test_export_jsonl(resolver, monkeypatch):
+    _, _, _, path = export(resolver, monkeypatch, 'jsonl')
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 6
+    assert records[-1] == {'duplicate_field': 'email', 'duplicate_value': 'eve@example.com', 'group_size': 2,
+                           'record': {'id': 6, 'email': 'eve@example.com', 'name': 'Eve 2'}}
+
+
+class FakeUsers:
+    """The V1 users table behind a FakeConnection, answering the dedup executor's queries"""
+
+    def __init__(self, rows):
+        self.rows = {row['id']: dict(row) for row in rows}
+        self.conn = (FakeConnection()
+                     .on(r'GROUP BY', self.groups)
+                     .on(r'WHERE id > %s', self.chunk)
+                     .on(r'WHERE (email|mobile) IN', self.members)
+                     .on(r'WHERE id IN .* FOR UPDATE', self.keepers)
+                     .on(r'^UPDATE', self.update))
+
+    def field(self, query):
+        return re.search(r'\b(email|mobile)\b', query).group(1)
+
+    def groups(self, query, params):
+        field, keep = self.field(query), min if 'MIN(id)' in query else max
+        members = {}
+        for row in self.rows.values():
+            if row[field]:
+                members.setdefault(row[field].lower(), []).append(row['id'])
+        return [(key, keep(ids)) for key, ids in members.items() if len(ids) > 1]
+
+    def chunk(self, query, params):
+        size = int(re.search(r'LIMIT (\d+)', query).group(1))
+        return [(row['id'], row['email'], row['mobile'])
+                for row_id, row in sorted(self.rows.items()) if row_id > params[0]][:size]
+
+    def members(self, query, params):
+        field = self.field(query)
+        return [(row['id'], row[field]) for row in self.rows.values()
+                if row[field] and row[field].lower() in [value.lower() for value in params]]
+
+    def keepers(self, query, params):
+        field = self.field(query)
+        return [(row_id, self.rows[row_id][field]) for row_id in params if row_id in self.rows]
+
+    def update(self, query, params):
+        field = self.field(query)
+        for row_id in params:
+            self.rows[row_id][field] = f"{self.rows[row_id][field]}_DUP_{row_id}"
+        return len(params)
+
+
+USERS = [
+    {'id': 1, 'email': 'ann@example.com', 'mobile': '111'},
+    {'id': 2, 'email': 'bob@example.com', 'mobile': '222'},
+    {'id': 3, 'email': 'ANN@example.com', 'mobile': '111'},
+    {'id': 4, 'email': 'cat@example.com', 'mobile': None},
+    {'id': 5, 'email': 'ann@example.com', 'mobile': '333'}
+]
+
+
+@pytest.fixture
+def dedup(config, monkeypatch):
+    config.DEDUP_CHUNK_SIZE = 2
+    users = FakeUsers(USERS)
+    monkeypatch.setattr(duplicate_resolver.mysql.connector, 'connect', lambda **kwargs: users.conn)
+    monkeypatch.setattr('builtins.input', lambda prompt='': 'yes')
+    indexes = [{'name': 'idx_email', 'columns': ['email']}, {'name': 'idx_mobile', 'columns': ['mobile']}]
+    monkeypatch.setattr(duplicate_resolver, 'SchemaCache', lambda conn, database: FakeSchema(indexes={'users': indexes}))
+    return DuplicateResolver(config), users, indexes
+
+
+def change_log():
+    [path] = glob.glob('logs/dedup_*.jsonl')
+    with open(path) as f:
+        return path, [json.loads(line) for line in f]
+
+
+def test_execute_dedup_locks_each_chunk_and_its_groups(dedup):
+    resolver, users, _ = dedup
+    resolver.execute_dedup(keep_first=True)
+
+    assert users.rows[1]['email'] == 'ann@example.com'
+    assert users.rows[3]['email'] == 'ANN@example.com_DUP_3'
+    assert users.rows[5]['email'] == 'ann@example.com_DUP_5'
+    assert users.rows[3]['mobile'] == '111_DUP_3'
+    assert users.rows[2]['email'] == 'bob@example.com'
+    # Indexed columns: no GROUP BY scan, every read of a chunk and its groups takes row locks
+    assert not users.conn.queries(r'GROUP BY')
+    assert all(query.endswith('FOR UPDATE') for query in users.conn.queries(r'^SELECT'))
+    statements = [query for query, _ in users.conn.executed]
+    assert statements.count('START TRANSACTION') == 4
+    # The chunk read, the group lookup and the UPDATE run inside one transaction
+    first_update = next(i for i, query in enumerate(statements) if query.startswith('UPDATE'))
+    assert statements[first_update - 3] == 'START TRANSACTION'
+    assert 'WHERE id > %s' in statements[first_update - 2]
+    assert 'WHERE email IN' in statements[first_update - 1]
+    _, entries = change_log()
+    changes = [(entry['id'], entry['field']) for entry in entries if entry['type'] == 'change']
+    assert changes == [(3, 'email'), (3, 'mobile'), (5, 'email')]
+    assert entries[-1]['changed'] == {'email': 2, 'mobile': 1}
+
+
+def test_execute_dedup_scans_unindexed_columns_once(dedup):
+    resolver, users, indexes = dedup
+    indexes[:] = [{'name': 'idx_email', 'columns': ['email']}]
+    # The mobile keeper changes after the up-front scan: its group is left alone
+    original_groups = users.groups
+
+    def groups_then_change(query, params):
+        result = original_groups(query, params)
+        users.rows[1]['mobile'] = '999'
+        return result
+
+    users.conn.rules[0] = (users.conn.rules[0][0], groups_then_change)
+    resolver.execute_dedup(keep_first=True)
+
+    [scan] = users.conn.queries(r'GROUP BY')
+    assert 'GROUP BY mobile' in scan and "mobile != ''" in scan
+    assert users.conn.params(r'WHERE id IN .* FOR UPDATE') == [[1]]
+    assert users.rows[3]['mobile'] == '111'
+    assert users.rows[3]['email'] == 'ANN@example.com_DUP_3'
+
+
+def test_execute_dedup_stops_on_a_stopped_replica(dedup, config, monkeypatch, capsys):
+    resolver, users, _ = dedup
+    config.DEDUP_REPLICA_HOSTS = ['replica-1:3307']
+    replica = FakeConnection().on(r'SHOW REPLICA STATUS', [{'Seconds_Behind_Source': None}])
+    connections = iter([users.conn, replica])
+    monkeypatch.setattr(duplicate_resolver.mysql.connector, 'connect', lambda **kwargs: next(connections))
+
+    resolver.execute_dedup()
+
+    assert 'Replica replica-1:3307 is not replicating' in capsys.readouterr().out
+    assert not users.conn.queries(r'^UPDATE')
+    assert users.conn.rollbacks == 1
+
+
+def test_wait_for_replicas_gives_up_after_the_timeout(config, monkeypatch):
+    config.DEDUP_REPLICA_HOSTS = ['replica-1']
+    config.DEDUP_REPLICA_WAIT_SECONDS = 0
+    resolver = DuplicateResolver(config)
+    monkeypatch.setattr(resolver, 'replica_lag', lambda: 30)
+    with pytest.raises(RuntimeError, match='still 30s after waiting 0s'):
+        resolver.wait_for_replicas()
+
+
+def test_undo_dedup_restores_logged_values(dedup):
+    resolver, users, _ = dedup
+    resolver.execute_dedup()
+    path, _ = change_log()
+    users.conn.on(r'SET (email|mobile) = %s', lambda query, params: users.rows[params[1]].update(
+        {users.field(query): params[0]}) or 1)
+    users.conn.rules.insert(0, users.conn.rules.pop())
+
+    resolver.undo_dedup(path)
+
+    assert [users.rows[row['id']] for row in USERS] == USERS
@@ -0,0 +1,75 @@
+import logging
+import pytest
+import logging_setup
+from logging_setup import RepeatedMessageFilter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(logging_setup.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def make_record(message, category=None):
+    record = logging.LogRecord('test', logging.WARNING, __file__, 1, message, (), None)
+    if category is not None:
+        record.category = category
+    return record
+
+
+def test_records_without_category_are_not_limited(clock):
+    rate_filter = RepeatedMessageFilter(samples=1, interval=60)
+    assert all(rate_filter.filter(make_record(f"message {i}")) for i in range(10))
+    assert rate_filter.counts == {}
+
+
+def test_samples_then_one_summary_per_interval(clock):
+    rate_filter = RepeatedMessageFilter(samples=2, interval=60)
+    passed = [rate_filter.filter(make_record(f"bad mobile {i}", 'invalid_mobile')) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert rate_filter.suppressed['invalid_mobile'] == 3
+
+    clock.now += 60
+    record = make_record('bad mobile 5', 'invalid_mobile')
+    assert rate_filter.filter(record)
+    assert record.getMessage() == "invalid_mobile: 4 similar messages suppressed (6 so far), last: bad mobile 5"
+    assert rate_filter.suppressed['invalid_mobile'] == 0
+
+    assert not rate_filter.filter(make_record('bad mobile 6', 'invalid_mobile'))
+
+
+def test_categories_are_counted_separately(clock):
+    rate_filter = RepeatedMessageFilter(samples=1, interval=60)
+    assert rate_filter.filter(make_record('a', 'orphaned_reference'))
+    assert rate_filter.filter(make_record('b', 'invalid_mobile'))
+    assert not rate_filter.filter(make_record('c', 'orphaned_reference'))
+    assert rate_filter.counts == {'orphaned_reference': 2, 'invalid_mobile': 1}
+
+
+def test_no_samples_summarises_one_interval_after_first_record(clock):
+    rate_filter = RepeatedMessageFilter(samples=0, interval=30)
+    assert not rate_filter.filter(make_record('first', 'duplicate_email'))
+    clock.now += 29
+    assert not rate_filter.filter(make_record('second', 'duplicate_email'))
+    clock.now += 1
+    record = make_record('third', 'duplicate_email')
+    assert rate_filter.filter(record)
+    assert record.getMessage().startswith("duplicate_email: 3 similar messages suppressed")
+
+
+def test_reset_starts_counting_afresh(clock):
+    rate_filter = RepeatedMessageFilter(samples=1, interval=60)
+    rate_filter.filter(make_record('a', 'invalid_mobile'))
+    assert not rate_filter.filter(make_record('b', 'invalid_mobile'))
+    rate_filter.reset()
+    assert rate_filter.filter(make_record('c', 'invalid_mobile'))
+    assert rate_filter.counts == {'invalid_mobile': 1}
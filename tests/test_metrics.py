@@ -0,0 +1,90 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+import pytest
+from metrics import MetricsServer, new_histogram, new_phase_histograms, observe, render_metrics
+from migration import MagiyaMigration
+from table_scheduler import TableScheduler
+from fakes import FakeConnection, FakeSchema
+
+
+def test_observe_fills_the_bucket_of_each_value():
+    histogram = new_histogram([0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 3.0):
+        observe(histogram, value)
+
+    assert histogram['counts'] == [2, 1, 1]
+    assert (histogram['count'], histogram['sum']) == (4, 3.65)
+
+
+def test_render_metrics():
+    users = {'total_records': 10, 'rows_read': 8, 'migrated_records': 5, 'updated_records': 1, 'skipped_records': 0,
+             'failed_records': 2, 'duplicate_email_errors': 1, 'last_v1_id': 42, 'batch_seconds': new_histogram([1.0]),
+             'phase_seconds': new_phase_histograms(), 'role_assignments_success': 5}
+    observe(users['batch_seconds'], 0.5)
+    stats = {'users': users, 'start_time': None,
+             'cdc': {'replication_lag_seconds': 3, 'events_received': 9, 'rows_upserted': 7, 'rows_deleted': 1,
+                     'deletes_skipped': 2, 'batches_applied': 4}}
+
+    text = render_metrics(stats, {'addresses_awaiting_parents': 100})
+
+    lines = text.splitlines()
+    assert 'magiya_source_rows{table="users"} 10' in lines
+    assert 'magiya_rows_written_total{table="users",result="updated"} 1' in lines
+    assert 'magiya_duplicate_errors_total{table="users",key="email"} 1' in lines
+    assert 'magiya_batch_duration_seconds_bucket{table="users",le="1.0"} 1' in lines
+    assert 'magiya_batch_duration_seconds_bucket{table="users",le="+Inf"} 1' in lines
+    assert 'magiya_phase_duration_seconds_count{table="users",phase="commit"} 0' in lines
+    assert 'magiya_role_assignments_total{result="success"} 5' in lines
+    assert 'magiya_queue_depth{queue="addresses_awaiting_parents"} 100' in lines
+    assert 'magiya_cdc_deletes_skipped_total 2' in lines
+    # Families without samples are left out entirely
+    assert 'magiya_rows_orphaned_total' not in text
+    assert lines.count('# TYPE magiya_queue_depth gauge') == 1
+
+
+def test_metrics_server_serves_only_metrics():
+    server = MetricsServer(lambda: 'magiya_up 1\n', 0, '127.0.0.1').start()
+    try:
+        url = f"http://127.0.0.1:{server.server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.read() == b'magiya_up 1\n'
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{url}/other")
+        assert error.value.code == 404
+    finally:
+        server.stop()
+
+
+@pytest.fixture
+def migration(config):
+    migration = MagiyaMigration(config)
+    migration.preserve_ids = False
+    migration.v1_conn, migration.v2_conn = FakeConnection(), FakeConnection()
+    migration.v1_schema = FakeSchema({'users': ['id', 'firstname', 'lastname', 'email', 'mobile', 'status'],
+                                      'addresses': ['id', 'user_id', 'address']})
+    migration.v2_schema = FakeSchema()
+    yield migration
+    migration.close_connections()
+
+
+def test_queue_depths_report_child_rows_held_by_the_scheduler(migration):
+    assert migration.queue_depths() == {}
+
+    scheduler = TableScheduler(migration, ['users', 'addresses'], {})
+    migration.scheduler = scheduler
+    records = [{'user_id': 5}, {'user_id': 9}]
+    waiter = threading.Thread(target=scheduler.wait_for_parents, args=('addresses', records))
+    waiter.start()
+    deadline = time.monotonic() + 5
+    while not scheduler.held_rows['addresses'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert migration.queue_depths() == {'users_awaiting_parents': 0, 'addresses_awaiting_parents': 2}
+
+    scheduler.batch_committed('users', 9)
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert migration.queue_depths()['addresses_awaiting_parents'] == 0
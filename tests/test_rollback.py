@@ -0,0 +1,120 @@
+import pytest
+from rollback import MigrationRollback
+from run_manifest import RunManifest
+from fakes import FakeConnection, FakeSchema
+
+EXTRA_MAPPINGS = '''
+from table_mappings import Copy, Ref
+
+def get_mappings(config):
+    return [
+        {'name': 'orders', 'source': 'orders', 'target': 'shop_orders', 'key': 'id',
+         'columns': {'user_id': Ref('users', 'user_id'), 'total': Copy('total'), 'v1_id': Copy('id')}},
+        {'name': 'order_items', 'source': 'order_items', 'target': 'shop_order_items', 'key': 'id',
+         'columns': {'order_id': Ref('orders', 'order_id'), 'sku': Copy('sku')}}
+    ]
+'''
+
+
+@pytest.fixture
+def rollback(config, tmp_path, monkeypatch):
+    (tmp_path / 'extra_mappings.py').write_text(EXTRA_MAPPINGS)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    config.TABLE_MAPPINGS_MODULE = 'extra_mappings'
+    config.ROLLBACK_CHUNK_SIZE = 100
+    return MigrationRollback(config)
+
+
+def fk(name, column, referenced_table):
+    return {'name': name, 'columns': [column], 'referenced_table': referenced_table, 'referenced_columns': ['id'],
+            'on_delete': 'CASCADE', 'on_update': 'RESTRICT'}
+
+
+def test_existing_tables_cover_every_mapping_children_first(rollback):
+    v2 = FakeConnection().on(r'information_schema.tables', [('users',), ('addresses',), ('role_user',),
+                                                           ('shop_orders',), ('shop_order_items',)])
+
+    tables = rollback.get_existing_tables(v2)
+
+    assert tables.index('shop_order_items') < tables.index('shop_orders') < tables.index('users')
+    assert tables.index('addresses') < tables.index('users')
+    assert tables.index('role_user') == tables.index('users') - 1
+    assert sorted(tables) == ['addresses', 'role_user', 'shop_order_items', 'shop_orders', 'users']
+
+
+def test_swap_refuses_foreign_keys_from_other_tables(rollback):
+    v2 = FakeConnection()
+    schema = FakeSchema(referencing={'users': ['addresses', 'audit_log']})
+
+    with pytest.raises(RuntimeError, match='audit_log -> users'):
+        rollback.swap_out_tables(v2, schema, ['addresses', 'users'])
+    assert v2.executed == []
+
+
+def test_swap_recreates_foreign_keys_on_the_empty_tables(rollback):
+    v2 = FakeConnection()
+    schema = FakeSchema(
+        foreign_keys={'addresses': [fk('addresses_user_id_foreign', 'user_id', 'users'),
+                                    fk('addresses_city_id_foreign__shadow', 'city_id', 'cities')]},
+        referencing={'users': ['addresses'], 'cities': ['addresses']}
+    )
+
+    old_tables = rollback.swap_out_tables(v2, schema, ['addresses', 'users'])
+
+    assert v2.queries(r'^CREATE TABLE') == ['CREATE TABLE addresses__empty LIKE addresses',
+                                            'CREATE TABLE users__empty LIKE users']
+    assert v2.queries(r'^ALTER TABLE') == [
+        'ALTER TABLE addresses__empty ADD CONSTRAINT `addresses_user_id_foreign__shadow` FOREIGN KEY (`user_id`) '
+        'REFERENCES users__empty (`id`) ON DELETE CASCADE ON UPDATE RESTRICT',
+        'ALTER TABLE addresses__empty ADD CONSTRAINT `addresses_city_id_foreign` FOREIGN KEY (`city_id`) '
+        'REFERENCES cities (`id`) ON DELETE CASCADE ON UPDATE RESTRICT'
+    ]
+    [rename] = v2.queries(r'^RENAME TABLE')
+    assert rename == (f"RENAME TABLE addresses TO {old_tables[0]}, addresses__empty TO addresses, "
+                      f"users TO {old_tables[1]}, users__empty TO users")
+
+
+def test_failed_swap_drops_the_empty_copies(rollback):
+    def refuse(query, params):
+        raise RuntimeError("Cannot add foreign key constraint")
+    v2 = FakeConnection().on(r'^ALTER TABLE', refuse)
+    schema = FakeSchema(foreign_keys={'addresses': [fk('addresses_user_id_foreign', 'user_id', 'users')]})
+
+    with pytest.raises(RuntimeError):
+        rollback.swap_out_tables(v2, schema, ['addresses', 'users'])
+    assert v2.queries(r'^DROP TABLE') == ['DROP TABLE IF EXISTS addresses__empty', 'DROP TABLE IF EXISTS users__empty']
+    assert v2.queries(r'^RENAME') == []
+
+
+def test_run_rollback_deletes_every_table_of_the_manifest(rollback, config):
+    manifest = RunManifest.create(config, '20260101_000000_000001', {'mode': 'insert', 'tables': ['users', 'orders', 'order_items']})
+    manifest.record_batch('users', 1, 3, [10, 11, 12], [])
+    manifest.record_batch('orders', 1, 2, [500, 501], [])
+    manifest.record_batch('order_items', 1, 250, list(range(900, 1150)), [])
+    v2 = FakeConnection().on(r'^DELETE', lambda query, params: params[1] - params[0] + 1)
+
+    deleted = rollback.delete_run_rows(v2, manifest, ['shop_order_items', 'shop_orders', 'addresses', 'role_user', 'users'])
+
+    assert [(query.split(' WHERE')[0], params) for query, params in v2.executed] == [
+        ('DELETE FROM shop_order_items', (900, 999)),
+        ('DELETE FROM shop_order_items', (1000, 1099)),
+        ('DELETE FROM shop_order_items', (1100, 1149)),
+        ('DELETE FROM shop_orders', (500, 501)),
+        ('DELETE FROM role_user', (10, 12)),
+        ('DELETE FROM users', (10, 12))
+    ]
+    assert 'user_id BETWEEN' in v2.queries(r'FROM role_user')[0]
+    assert deleted == {'shop_order_items': 250, 'shop_orders': 2, 'role_user': 3, 'users': 3}
+
+
+def test_migrated_rows_are_deleted_through_their_users_reference(rollback, capsys):
+    pages = iter([[(10,), (11,)], []])
+    v2 = FakeConnection().on(r'^SELECT id FROM users', lambda query, params: next(pages)).on(r'^DELETE', 1)
+
+    deleted = rollback.delete_migrated_rows(v2, ['shop_order_items', 'shop_orders', 'addresses', 'role_user', 'users'])
+
+    assert [query.split(' IN')[0] for query in v2.queries(r'^DELETE')] == [
+        'DELETE FROM shop_orders WHERE user_id', 'DELETE FROM addresses WHERE user_id',
+        'DELETE FROM role_user WHERE user_id', 'DELETE FROM users WHERE id']
+    assert 'shop_order_items does not reference users' in capsys.readouterr().out
+    assert set(deleted) == {'shop_orders', 'addresses', 'role_user', 'users'}
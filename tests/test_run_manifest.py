@@ -0,0 +1,85 @@
+import json
+from migration import MagiyaMigration
+from run_manifest import RunManifest, to_ranges
+from fakes import FakeConnection, FakeSchema
+
+
+def test_to_ranges():
+    assert to_ranges([]) == []
+    assert to_ranges([5, 1, 2, 3, 7, 8, 10]) == [[1, 3], [5, 5], [7, 8], [10, 10]]
+
+
+def test_create_writes_run_line(config):
+    manifest = RunManifest.create(config, '20260101_120000_000001', {'preserve_ids': True})
+    with open(manifest.path) as f:
+        entries = [json.loads(line) for line in f]
+    assert len(entries) == 1
+    assert entries[0]['type'] == 'run'
+    assert entries[0]['preserve_ids'] is True
+    assert entries[0]['config']['batch_size'] == 100
+    assert manifest.run_id == '20260101_120000_000001'
+
+
+def test_reload_resumes_after_last_batch(config):
+    manifest = RunManifest.create(config, '20260101_120000_000001', {'preserve_ids': False})
+    manifest.record_batch('users', 1, 100, [501, 502, 503], [7])
+    manifest.record_batch('users', 101, 200, [504, 505], [])
+    manifest.record_batch('addresses', 1, 50, [900, 902], [])
+
+    reloaded = RunManifest(manifest.path)
+    assert reloaded.run_id == '20260101_120000_000001'
+    assert not reloaded.finished
+    assert reloaded.last_v1_id('users') == 200
+    assert reloaded.last_v1_id('addresses') == 50
+    assert reloaded.last_v1_id('orders') == 0
+    assert reloaded.v1_ranges('users') == [[1, 100], [101, 200]]
+    assert reloaded.inserted_ranges('users') == [[501, 505]]
+    assert reloaded.inserted_ranges('addresses') == [[900, 900], [902, 902]]
+    assert reloaded.inserted_count('users') == 5
+
+
+def test_find_incomplete_returns_newest_unfinished_run(config):
+    assert RunManifest.find_incomplete(config) is None
+
+    older = RunManifest.create(config, '20260101_120000_000001', {})
+    newer = RunManifest.create(config, '20260101_130000_000001', {})
+    assert RunManifest.find_incomplete(config).path == newer.path
+
+    newer.finish({'users': {'migrated_records': 3}, 'start_time': None})
+    assert RunManifest.find_incomplete(config).path == older.path
+
+    older.abandon()
+    assert RunManifest.find_incomplete(config) is None
+
+
+def test_finish_records_migrated_counts(config):
+    manifest = RunManifest.create(config, '20260101_120000_000001', {})
+    manifest.finish({'users': {'migrated_records': 3}, 'addresses': {'migrated_records': 2}, 'start_time': None})
+
+    reloaded = RunManifest(manifest.path)
+    assert reloaded.finished
+    with open(manifest.path) as f:
+        end = json.loads(f.readlines()[-1])
+    assert end['migrated'] == {'users': 3, 'addresses': 2}
+
+
+def test_migration_resumes_after_the_last_committed_batch(config):
+    manifest = RunManifest.create(config, '20260101_120000_000001',
+                                  {'mode': 'insert', 'preserve_ids': False, 'tables': ['users', 'addresses']})
+    manifest.record_batch('users', 1, 100, [501, 502], [])
+    migration = MagiyaMigration(config)
+    migration.v1_conn = FakeConnection().on(r'SELECT COUNT\(\*\), SUM', [(40, 38)])
+    migration.v2_conn = FakeConnection().on(r"table_name = 'role_user'", [(0,)]).on(r'SELECT v1_id, id FROM users', [(1, 501), (2, 502)])
+    migration.v1_schema = FakeSchema({'addresses': ['id', 'user_id', 'address']})
+    # users.v1_id has no index, so the ids of the interrupted run are reloaded into memory
+    migration.v2_schema = FakeSchema(indexes={'users': []})
+
+    migration.resume_from_manifest(RunManifest(manifest.path))
+
+    assert migration.run_id == '20260101_120000_000001'
+    assert (migration.migration_mode, migration.preserve_ids) == ('insert', False)
+    assert migration.migrate_users and migration.migrate_addresses
+    assert migration.id_mapping['users'] == {1: 501, 2: 502}
+    assert migration.v1_conn.params(r'SELECT COUNT\(\*\), SUM') == [(100,), (0,)]
+    assert migration.stats['users']['total_records'] == 38
+    migration.close_connections()
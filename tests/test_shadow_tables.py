@@ -0,0 +1,106 @@
+import logging
+import pytest
+from shadow_tables import ShadowTableLoader
+from fakes import FakeConnection, FakeSchema
+
+INDEXES = {
+    'users': [
+        {'name': 'users_email_unique', 'unique': True, 'type': 'BTREE', 'columns': ['email'], 'parts': ['`email`']},
+        {'name': 'users_v1_id_index', 'unique': False, 'type': 'BTREE', 'columns': ['v1_id'], 'parts': ['`v1_id`']}
+    ],
+    'addresses': [
+        {'name': 'addresses_user_id_index', 'unique': False, 'type': 'BTREE', 'columns': ['user_id'], 'parts': ['`user_id`']}
+    ]
+}
+FOREIGN_KEYS = {
+    'addresses': [
+        {'name': 'addresses_user_id_foreign', 'columns': ['user_id'], 'referenced_table': 'users',
+         'referenced_columns': ['id'], 'on_delete': 'CASCADE', 'on_update': 'RESTRICT'},
+        {'name': 'addresses_city_id_foreign__shadow', 'columns': ['city_id'], 'referenced_table': 'cities',
+         'referenced_columns': ['id'], 'on_delete': 'SET NULL', 'on_update': 'RESTRICT'}
+    ]
+}
+
+
+def make_loader(tables=('users', 'addresses'), existing=(), referencing=None):
+    schema = FakeSchema(columns={table: ['id'] for table in existing}, indexes=INDEXES, foreign_keys=FOREIGN_KEYS,
+                        referencing=referencing or {})
+    return ShadowTableLoader(FakeConnection(), schema, list(tables), logging.getLogger('test_shadow_tables'))
+
+
+def test_create_defers_only_non_unique_indexes():
+    loader = make_loader()
+    loader.create()
+
+    assert loader.conn.queries() == [
+        'DROP TABLE IF EXISTS users__shadow',
+        'CREATE TABLE users__shadow LIKE users',
+        'ALTER TABLE users__shadow DROP INDEX `users_v1_id_index`',
+        'DROP TABLE IF EXISTS addresses__shadow',
+        'CREATE TABLE addresses__shadow LIKE addresses',
+        'ALTER TABLE addresses__shadow DROP INDEX `addresses_user_id_index`'
+    ]
+
+
+def test_finish_load_builds_indexes_then_foreign_keys():
+    loader = make_loader()
+    loader.create()
+    loader.conn.executed.clear()
+
+    loader.finish_load()
+
+    assert loader.conn.queries() == [
+        'ALTER TABLE users__shadow ADD INDEX `users_v1_id_index` (`v1_id`)',
+        'ALTER TABLE addresses__shadow ADD INDEX `addresses_user_id_index` (`user_id`)',
+        # References inside the load point at the other shadow table; names alternate between cutovers
+        'ALTER TABLE addresses__shadow ADD CONSTRAINT `addresses_user_id_foreign__shadow` FOREIGN KEY (`user_id`) '
+        'REFERENCES users__shadow (`id`) ON DELETE CASCADE ON UPDATE RESTRICT',
+        'ALTER TABLE addresses__shadow ADD CONSTRAINT `addresses_city_id_foreign` FOREIGN KEY (`city_id`) '
+        'REFERENCES cities (`id`) ON DELETE SET NULL ON UPDATE RESTRICT'
+    ]
+
+
+def test_attach_defers_only_indexes_not_built_yet():
+    loader = make_loader()
+    loader.schema.indexes['users__shadow'] = [INDEXES['users'][0]]
+    loader.schema.indexes['addresses__shadow'] = INDEXES['addresses']
+
+    loader.attach()
+
+    assert [index['name'] for index in loader.deferred_indexes['users']] == ['users_v1_id_index']
+    assert loader.deferred_indexes['addresses'] == []
+
+
+def test_blocking_references_come_from_outside_the_load():
+    loader = make_loader(referencing={'users': ['addresses', 'orders'], 'addresses': []})
+    assert loader.find_blocking_references() == [('orders', 'users')]
+
+
+def test_cutover_is_one_rename():
+    loader = make_loader()
+    loader.cutover()
+    assert loader.conn.queries() == [
+        'RENAME TABLE users TO users__old, users__shadow TO users, addresses TO addresses__old, addresses__shadow TO addresses']
+
+
+def test_cutover_refuses_to_overwrite_a_previous_cutover():
+    loader = make_loader(existing=['users__old'])
+    with pytest.raises(RuntimeError, match='users__old'):
+        loader.cutover()
+    assert loader.conn.executed == []
+
+
+def test_swap_back_restores_the_old_tables():
+    loader = make_loader(existing=['users__old', 'addresses__old'])
+    loader.swap_back()
+    assert loader.conn.queries()[-1] == (
+        'RENAME TABLE users TO users__shadow, users__old TO users, addresses TO addresses__shadow, addresses__old TO addresses')
+
+    with pytest.raises(RuntimeError, match='missing: addresses__old'):
+        make_loader(existing=['users__old']).swap_back()
+
+
+def test_constraint_names_alternate():
+    name = ShadowTableLoader.shadow_constraint_name('fk_user')
+    assert name == 'fk_user__shadow'
+    assert ShadowTableLoader.shadow_constraint_name(name) == 'fk_user'
@@ -0,0 +1,168 @@
+from types import SimpleNamespace
+import pytest
+from table_mappings import (Copy, Const, Call, Ref, OrphanedReference, TransformPlan,
+                            builtin_mappings, dependency_order, mapping_parents)
+
+CONFIG = SimpleNamespace(
+    V1_TABLE='users', V2_TABLE='users', V1_USER_FILTER='status != 0',
+    V1_ADDRESS_TABLE='user_addresses', V2_ADDRESS_TABLE='addresses', V1_ADDRESS_FILTER=None
+)
+
+
+class FakeSchema:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def get_columns(self, table):
+        return self.columns[table]
+
+
+class FakeMigration:
+    """The parts of MagiyaMigration a TransformPlan binds to"""
+
+    def __init__(self, preserve_ids, id_mapping=None):
+        self.preserve_ids = preserve_ids
+        self.id_mapping = id_mapping or {}
+        self.v1_schema = FakeSchema({'user_addresses': ['id', 'user_id', 'address', 'city_id']})
+
+    def remap_reference(self, parent, v1_id):
+        if v1_id not in self.id_mapping.get(parent, {}):
+            raise OrphanedReference(parent, v1_id)
+        return self.id_mapping[parent][v1_id]
+
+    def full_name(self, firstname, lastname, v1_id):
+        return f"{firstname or ''} {lastname or ''}".strip() or f"User_{v1_id}"
+
+    def email_verified_timestamp(self, ev):
+        return 'verified' if ev == 1 else None
+
+    def convert_mobile_number(self, mobile):
+        return mobile
+
+    def convert_gender(self, gender):
+        return {'M': 'Male', 'F': 'Female'}.get(gender)
+
+    def address_string(self, address, v1_id):
+        return address
+
+    def insert_user_role(self, *args):
+        pass
+
+
+def mappings():
+    return {mapping['name']: mapping for mapping in builtin_mappings(CONFIG)}
+
+
+def user_row(**values):
+    return {'id': 7, 'firstname': 'Ann', 'lastname': 'Lee', 'email': 'ann@example.com', 'ev': 1,
+            'password': 'x', 'mobile': '+94771234567', 'gender': 'F', 'balance': '12.345', **values}
+
+
+def test_users_plan_without_preserved_ids():
+    migration = FakeMigration(preserve_ids=False)
+    plan = TransformPlan(mappings()['users'], migration)
+
+    assert plan.columns[0] == 'operator_id'
+    assert 'id' not in plan.columns
+    assert plan.id_map_column == 'v1_id'
+    assert plan.references == []
+    assert plan.read_columns[0] == 'id'
+    assert plan.after_insert == migration.insert_user_role
+
+    row = dict(zip(plan.columns, plan.transform(user_row())))
+    assert row['name'] == 'Ann Lee'
+    assert row['email_verified_at'] == 'verified'
+    assert row['gender'] == 'Female'
+    assert row['balance'] == 12.35
+    assert row['v1_id'] == 7
+    assert row['public'] == 0
+    assert row['status'] == 1
+    assert row['otp_verified'] == 0
+
+
+def test_users_plan_with_preserved_ids():
+    plan = TransformPlan(mappings()['users'], FakeMigration(preserve_ids=True))
+
+    assert plan.columns[0] == 'id'
+    record = user_row(firstname=None, lastname=' ')
+    del record['balance']
+    values = plan.transform(record)
+    assert values[0] == 7
+    row = dict(zip(plan.columns, values))
+    assert row['name'] == 'User_7'
+    assert row['balance'] == 0.0
+
+
+def test_transform_reads_only_the_columns_it_needs():
+    mapping = {'name': 'orders', 'source': 'orders', 'target': 'orders', 'key': 'id',
+               'columns': {'total': Call(lambda amount: amount * 2, 'amount'),
+                           'state': Copy('state', 'pending'),
+                           'channel': Const('web'),
+                           'v1_id': Copy('id')},
+               'read_columns': ['note']}
+    plan = TransformPlan(mapping, FakeMigration(preserve_ids=False))
+
+    assert plan.source_columns == ['amount', 'state', 'id']
+    assert plan.read_columns == ['id', 'amount', 'state', 'note']
+    assert plan.transform({'id': 3, 'amount': 5}) == (10, 'pending', 'web', 3)
+
+
+def test_star_columns_copy_the_v1_schema():
+    migration = FakeMigration(preserve_ids=False, id_mapping={'users': {4: 104}})
+    plan = TransformPlan(mappings()['addresses'], migration)
+
+    assert plan.columns == ['user_id', 'address', 'city_id']
+    assert plan.references == [('user_id', 'users')]
+    assert plan.depends_on == ['users']
+    assert plan.id_map_column is None
+    assert plan.transform({'id': 1, 'user_id': 4, 'address': 'Main St', 'city_id': 2}) == (104, 'Main St', 2)
+    with pytest.raises(OrphanedReference):
+        plan.transform({'id': 2, 'user_id': 5, 'address': None, 'city_id': None})
+
+
+def test_refs_are_copied_with_preserved_ids():
+    plan = TransformPlan(mappings()['addresses'], FakeMigration(preserve_ids=True))
+
+    assert plan.columns == ['id', 'user_id', 'address', 'city_id']
+    assert plan.depends_on == []
+    assert plan.transform({'id': 1, 'user_id': 5, 'address': 'Main St', 'city_id': 2}) == (1, 5, 'Main St', 2)
+
+
+def test_unsupported_spec_is_rejected():
+    mapping = {'name': 'orders', 'source': 'orders', 'target': 'orders', 'key': 'id',
+               'columns': {'total': 'amount'}}
+    with pytest.raises(ValueError, match='unsupported spec for column total'):
+        TransformPlan(mapping, FakeMigration(preserve_ids=False))
+
+
+def order_mappings():
+    return {
+        'users': {'columns': {}},
+        'addresses': {'columns': {}, 'overrides': {'user_id': Ref('users', 'user_id')}},
+        'orders': {'columns': {'address_id': Ref('addresses', 'address_id')}},
+        'invoices': {'columns': {}, 'depends_on': ['orders']}
+    }
+
+
+def test_mapping_parents():
+    mappings = order_mappings()
+    assert mapping_parents(mappings['addresses'], preserve_ids=False) == ['users']
+    assert mapping_parents(mappings['addresses'], preserve_ids=True) == []
+    assert mapping_parents(mappings['invoices'], preserve_ids=True) == ['orders']
+
+
+def test_dependency_order():
+    mappings = order_mappings()
+    names = ['invoices', 'orders', 'addresses', 'users']
+    assert dependency_order(mappings, names, preserve_ids=False) == ['users', 'addresses', 'orders', 'invoices']
+    # Refs are plain copies with preserved IDs; only depends_on still orders tables
+    assert dependency_order(mappings, names, preserve_ids=True) == ['orders', 'addresses', 'users', 'invoices']
+    # Parents that are not selected do not hold their children back
+    assert dependency_order(mappings, ['orders', 'invoices'], preserve_ids=False) == ['orders', 'invoices']
+
+
+def test_dependency_order_rejects_cycles():
+    mappings = {'a': {'columns': {}, 'depends_on': ['b']}, 'b': {'columns': {}, 'depends_on': ['a']},
+                'c': {'columns': {}}}
+    with pytest.raises(ValueError, match='Circular table dependencies between: a, b'):
+        dependency_order(mappings, ['a', 'b', 'c'], preserve_ids=False)
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+from table_mappings import Copy, Ref
+from table_scheduler import TableScheduler
+
+
+class FakeSchema:
+    def __init__(self, foreign_keys):
+        self.foreign_keys = foreign_keys
+
+    def get_foreign_keys(self, table):
+        return self.foreign_keys.get(table, [])
+
+
+class FakeMigration:
+    """Mappings, plan specs and V2 foreign keys as the scheduler reads them"""
+
+    def __init__(self, preserve_ids, foreign_keys, hold_child_batches=True):
+        self.preserve_ids = preserve_ids
+        self.config = SimpleNamespace(HOLD_CHILD_BATCHES=hold_child_batches)
+        self.v2_schema = FakeSchema(foreign_keys)
+        self.mappings = {
+            'users': {'target': 'v2_users', 'columns': {'v1_id': Copy('id')}},
+            'addresses': {'target': 'v2_addresses', 'columns': {'user_id': Ref('users', 'user_id'), 'city': Copy('city')}},
+            'orders': {'target': 'v2_orders', 'columns': {'user_id': Copy('user_id'), 'total': Copy('total')}},
+            'invoices': {'target': 'v2_invoices', 'columns': {'order_id': Copy('order_id')}, 'depends_on': ['orders']}
+        }
+
+    def get_plan(self, table):
+        specs = dict(self.mappings[table]['columns'])
+        if self.preserve_ids:
+            specs = {'id': Copy('id'), **specs}
+        return SimpleNamespace(specs=specs)
+
+
+FOREIGN_KEYS = {
+    'v2_addresses': [{'columns': ['user_id'], 'referenced_table': 'v2_users'}],
+    'v2_orders': [{'columns': ['user_id'], 'referenced_table': 'v2_users'}],
+    'v2_invoices': [{'columns': ['order_id'], 'referenced_table': 'v2_orders'},
+                    {'columns': ['order_id', 'line'], 'referenced_table': 'v2_orders'}]
+}
+TABLES = ['users', 'addresses', 'orders', 'invoices']
+
+
+def test_graph_without_preserved_ids():
+    scheduler = TableScheduler(FakeMigration(False, FOREIGN_KEYS), TABLES, {})
+
+    assert scheduler.table_parents == {'users': [], 'addresses': [], 'orders': [], 'invoices': ['orders']}
+    # Refs are range dependencies; copied ids are not V2 ids, so their foreign keys are not
+    assert scheduler.range_parents == {'users': [], 'addresses': [('user_id', 'users', True)],
+                                       'orders': [], 'invoices': []}
+    assert scheduler.order() == ['users', 'orders', 'addresses', 'invoices']
+
+
+def test_graph_with_preserved_ids():
+    scheduler = TableScheduler(FakeMigration(True, FOREIGN_KEYS), TABLES, {})
+
+    # Copied ids under a single-column V2 foreign key wait for the parent rows;
+    # invoices already waits for the whole orders table through depends_on
+    assert scheduler.range_parents == {'users': [], 'addresses': [('user_id', 'users', True)],
+                                       'orders': [('user_id', 'users', True)], 'invoices': []}
+    assert scheduler.order() == ['users', 'addresses', 'orders', 'invoices']
+
+
+def test_unenforced_refs():
+    scheduler = TableScheduler(FakeMigration(False, {}, hold_child_batches=False), TABLES, {})
+
+    assert scheduler.range_parents['addresses'] == [('user_id', 'users', False)]
+    assert scheduler.describe()[1] == 'addresses: users (started, via user_id)'
+
+    scheduler.migration.config.HOLD_CHILD_BATCHES = True
+    assert scheduler.describe()[1] == 'addresses: users (committed keys, via user_id)'
+
+
+def test_unselected_parents_are_ignored():
+    scheduler = TableScheduler(FakeMigration(True, FOREIGN_KEYS), ['addresses', 'invoices'], {})
+
+    assert scheduler.table_parents == {'addresses': [], 'invoices': []}
+    assert scheduler.range_parents == {'addresses': [], 'invoices': []}
+    assert scheduler.describe() == ['addresses: independent', 'invoices: independent']
+
+
+def test_wait_for_parents_returns_once_keys_are_committed():
+    scheduler = TableScheduler(FakeMigration(False, FOREIGN_KEYS), TABLES, {'users': 50})
+
+    # Keys at or below the resume point are already committed
+    scheduler.wait_for_parents('addresses', [{'user_id': 10}, {'user_id': None}, {'user_id': 50}])
+    scheduler.batch_committed('users', 80)
+    scheduler.wait_for_parents('addresses', [{'user_id': 80}])
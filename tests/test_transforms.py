@@ -0,0 +1,28 @@
+import pytest
+from transforms import normalize_mobile, email_key
+
+
+@pytest.mark.parametrize('mobile, expected', [
+    (None, (None, 'empty')),
+    ('   ', (None, 'empty')),
+    ('+94771234567', ('+94771234567', 'unchanged')),
+    ('0771234567', ('+94771234567', 'converted')),
+    ('771234567', ('+94771234567', 'converted')),
+    ('94771234567', ('+94771234567', 'converted')),
+    ('0094771234567', ('+94771234567', 'converted')),
+    ('077-123 4567', ('+94771234567', 'converted')),
+    ('(077) 123-4567', ('+94771234567', 'converted')),
+    (771234567, ('+94771234567', 'converted')),
+    ('07712345', ('7712345', 'invalid_length')),
+    ('077123456789', ('77123456789', 'invalid_length')),
+    ('077abc4567', ('77abc4567', 'invalid_format')),
+    ('+94', ('', 'invalid_format')),
+])
+def test_normalize_mobile(mobile, expected):
+    assert normalize_mobile(mobile) == expected
+
+
+def test_email_key_matches_case_insensitive_index():
+    assert email_key('John.Doe@Example.com  ') == 'john.doe@example.com'
+    assert email_key('  a@b.c') == '  a@b.c'
+    assert email_key(None) is None
@@ -0,0 +1,113 @@
+import json
+import logging
+import os
+import pytest
+from migration import MagiyaMigration
+from v2_snapshot import V2Snapshot
+from fakes import FakeConnection, FakeSchema
+
+
+def copied_rows(query, params):
+    return params[1] - params[0] + 1
+
+
+@pytest.fixture
+def snapshot(config):
+    config.SNAPSHOT_CHUNK_SIZE = 100
+    conn = (FakeConnection()
+            .on(r'SELECT MIN\(`id`\), MAX\(`id`\) FROM users', [(1, 150)])
+            .on(r'^INSERT', copied_rows))
+    scopes = [('addresses', 'id', [1, 250]), ('users', 'id', None)]
+    return V2Snapshot.create(conn, config, scopes, logging.getLogger('test'), snapshot_id='20260101_120000'), conn
+
+
+def test_create_copies_each_scope_in_key_chunks(snapshot):
+    snapshot, conn = snapshot
+
+    assert conn.queries(r'^CREATE TABLE') == ['CREATE TABLE addresses__snap_20260101_120000 LIKE addresses',
+                                             'CREATE TABLE users__snap_20260101_120000 LIKE users']
+    assert conn.params(r'INSERT INTO addresses__snap') == [(1, 100), (101, 200), (201, 250)]
+    assert conn.params(r'INSERT INTO users__snap') == [(1, 100), (101, 150)]
+    assert conn.commits == 5
+    with open(snapshot.path) as f:
+        meta = json.load(f)
+    assert [(t['table'], t['range'], t['rows']) for t in meta['tables']] == [('addresses', [1, 250], 250),
+                                                                             ('users', None, 150)]
+    assert meta['restored_at'] is None
+
+
+def test_restore_clears_children_first_and_refills_parents_first(snapshot, config):
+    snapshot, _ = snapshot
+    conn = (FakeConnection()
+            .on(r'SELECT MIN\(`id`\), MAX\(`id`\) FROM users__snap', [(1, 150)])
+            .on(r'^INSERT', copied_rows))
+
+    V2Snapshot(snapshot.path).restore(conn, config)
+
+    statements = [query.split(' SELECT')[0] for query in conn.queries(r'^(DELETE|TRUNCATE|INSERT|SET)')]
+    assert statements == [
+        'SET FOREIGN_KEY_CHECKS = 0',
+        'DELETE FROM addresses WHERE `id` BETWEEN %s AND %s',
+        'DELETE FROM addresses WHERE `id` BETWEEN %s AND %s',
+        'DELETE FROM addresses WHERE `id` BETWEEN %s AND %s',
+        'TRUNCATE TABLE users',
+        'INSERT INTO users', 'INSERT INTO users',
+        'INSERT INTO addresses', 'INSERT INTO addresses', 'INSERT INTO addresses',
+        'SET FOREIGN_KEY_CHECKS = 1'
+    ]
+    assert V2Snapshot(snapshot.path).meta['restored_at'] is not None
+
+
+def test_restore_turns_foreign_key_checks_back_on_after_a_failure(snapshot, config):
+    snapshot, _ = snapshot
+    conn = FakeConnection().on(r'^DELETE', lambda query, params: (_ for _ in ()).throw(RuntimeError('lock wait')))
+
+    with pytest.raises(RuntimeError):
+        snapshot.restore(conn, config)
+
+    assert conn.queries()[-1] == 'SET FOREIGN_KEY_CHECKS = 1'
+    assert conn.rollbacks == 1
+    assert V2Snapshot(snapshot.path).meta['restored_at'] is None
+
+
+def test_list_and_drop(snapshot, config):
+    snapshot, _ = snapshot
+    older = V2Snapshot.create(FakeConnection(), config, [], logging.getLogger('test'), snapshot_id='20250101_120000')
+
+    assert [s.snapshot_id for s in V2Snapshot.list_snapshots(config)] == ['20260101_120000', '20250101_120000']
+
+    conn = FakeConnection()
+    snapshot.drop(conn)
+    assert conn.queries() == ['DROP TABLE IF EXISTS addresses__snap_20260101_120000',
+                              'DROP TABLE IF EXISTS users__snap_20260101_120000']
+    assert not os.path.exists(snapshot.path)
+    assert [s.snapshot_id for s in V2Snapshot.list_snapshots(config)] == [older.snapshot_id]
+
+
+@pytest.fixture
+def migration(config):
+    migration = MagiyaMigration(config)
+    migration.preserve_ids = True
+    migration.migrate_users = migration.migrate_addresses = True
+    migration.has_role_user_table = True
+    migration.v1_conn = (FakeConnection()
+                         .on(r'FROM users', [(10, 900)])
+                         .on(r'FROM addresses', [(5, 1200)]))
+    migration.v2_conn = FakeConnection()
+    migration.v2_schema = FakeSchema(indexes={'users': [{'name': 'users_email_unique', 'unique': True, 'columns': ['email']}]})
+    yield migration
+    migration.close_connections()
+
+
+def test_scoped_snapshot_covers_the_v1_id_range(migration):
+    migration.v2_schema.indexes = {}
+
+    assert migration.get_snapshot_scopes(scoped=True) == [
+        ('addresses', 'id', [5, 1200]), ('role_user', 'user_id', [10, 900]), ('users', 'id', [10, 900])]
+
+
+def test_tables_with_other_unique_keys_are_copied_whole(migration):
+    assert migration.get_snapshot_scopes(scoped=True) == [
+        ('addresses', 'id', [5, 1200]), ('role_user', 'user_id', None), ('users', 'id', None)]
+    assert migration.get_snapshot_scopes(scoped=False) == [
+        ('addresses', 'id', None), ('role_user', 'user_id', None), ('users', 'id', None)]
@@ -0,0 +1,103 @@
+import json
+import glob
+import pytest
+import validator
+from validator import MigrationValidator
+from migration import MagiyaMigration
+from fakes import FakeConnection
+
+
+def v1_user(user_id, **values):
+    return {'id': user_id, 'firstname': f"User{user_id}", 'lastname': 'Test', 'email': f"u{user_id}@example.com",
+            'ev': 1, 'password': 'x', 'mobile': '0771234567', 'gender': 'M', 'address': None, 'balance': 10,
+            'status': 1, 'created_at': None, 'updated_at': None, **values}
+
+
+@pytest.fixture
+def checker(config):
+    checker = MigrationValidator(config)
+    transformer = MagiyaMigration(config)
+    yield checker, transformer
+    transformer.close_connections()
+
+
+def v2_hash(checker, transformer, record):
+    return checker._row_hash(checker._v1_row_fingerprint(transformer.transform_user_record(record)))
+
+
+def serve_v1(rows):
+    """Keyset pages of V1 users: WHERE id > %s ... LIMIT BATCH_SIZE"""
+    def answer(query, params):
+        if 'id >= %s AND id < %s' in query:
+            return [row for row in rows if params[0] <= row['id'] < params[1]]
+        return [row for row in rows if row['id'] > params[0]][:2]
+    return answer
+
+
+def serve_v2(checker, transformer, rows, chunk_size):
+    """V2 chunk checksums and row hashes as the SQL would compute them"""
+    def chunks(query, params):
+        result = {}
+        for row in rows:
+            count, checksum = result.get(row['id'] // chunk_size, (0, 0))
+            result[row['id'] // chunk_size] = (count + 1, checksum ^ v2_hash(checker, transformer, row))
+        return [(chunk, count, checksum) for chunk, (count, checksum) in result.items()]
+
+    def hashes(query, params):
+        return [(row['id'], v2_hash(checker, transformer, row)) for row in rows if params[0] <= row['id'] < params[1]]
+    return chunks, hashes
+
+
+def run_reconcile(monkeypatch, checker, transformer, v1_rows, v2_rows, chunk_size=10):
+    chunks, hashes = serve_v2(checker, transformer, v2_rows, chunk_size)
+    v1 = FakeConnection().on(r'FROM users', serve_v1(v1_rows))
+    v2 = FakeConnection().on(r'GROUP BY chunk', chunks).on(r'SELECT v1_id', hashes)
+    connections = iter([v1, v2])
+    monkeypatch.setattr(validator.mysql.connector, 'connect', lambda **kwargs: next(connections))
+    monkeypatch.setattr(validator, 'MagiyaMigration', lambda config: transformer)
+    return checker.checksum_reconcile(chunk_size), v1, v2
+
+
+def test_matching_tables_need_no_drill_down(monkeypatch, checker):
+    rows = [v1_user(i) for i in (1, 2, 3, 11, 25)]
+    matched, v1, v2 = run_reconcile(monkeypatch, *checker, rows, rows)
+
+    assert matched
+    # Keyset pages of two rows, filtered by the users mapping
+    assert len(v1.queries(r'WHERE id > %s AND \(status IS NULL OR status != 0\)')) == 4
+    assert v1.queries(r'id >= %s AND id < %s') == []
+    assert v1.closed and v2.closed
+    assert glob.glob('logs/checksum_report_*.json') == []
+
+
+def test_differences_are_drilled_down_per_chunk(monkeypatch, checker):
+    v1_rows = [v1_user(i) for i in (1, 2, 3, 11, 25)]
+    v2_rows = [v1_user(1), v1_user(2, email='changed@example.com'), v1_user(11), v1_user(12), v1_user(25)]
+    matched, v1, v2 = run_reconcile(monkeypatch, *checker, v1_rows, v2_rows)
+
+    assert not matched
+    # Only the two mismatching chunks are compared row by row
+    assert v1.params(r'id >= %s AND id < %s') == [(0, 10), (10, 20)]
+    [report_file] = glob.glob('logs/checksum_report_*.json')
+    with open(report_file) as f:
+        report = json.load(f)
+    assert report['differences'] == {
+        '0-9': {'missing_in_v2': [3], 'extra_in_v2': [], 'different': [2]},
+        '10-19': {'missing_in_v2': [], 'extra_in_v2': [12], 'different': []}
+    }
+
+
+def test_connection_failure_is_reported(monkeypatch, checker):
+    def refuse(**kwargs):
+        raise validator.mysql.connector.Error("refused")
+    monkeypatch.setattr(validator.mysql.connector, 'connect', refuse)
+
+    assert checker[0].checksum_reconcile(10) is False
+
+
+def test_fingerprint_renders_nulls_and_balance_like_the_sql():
+    transformed = {'name': 'Ann Lee', 'email': None, 'mobile': '+94771234567', 'gender': 'Female',
+                   'address': None, 'balance': 12.345, 'status': 1, 'email_verified_at': None}
+    fingerprint = MigrationValidator._v1_row_fingerprint(None, transformed)
+    assert fingerprint == 'Ann Lee#\\N#+94771234567#Female#\\N#1234#1#0'
+    assert MigrationValidator._row_hash(fingerprint) < 2 ** 64
@@ -0,0 +1,41 @@
+import re
+
+def normalize_mobile(mobile):
+    """Normalize a mobile number to +94 format without side effects.
+
+    Returns (value, outcome) where outcome is 'empty', 'unchanged', 'converted',
+    'invalid_format' or 'invalid_length'. For invalid numbers value is the
+    cleaned input (for logging), not a usable number.
+    """
+    if mobile is None:
+        return None, 'empty'
+
+    mobile = str(mobile).strip()
+    if not mobile:
+        return None, 'empty'
+
+    mobile = re.sub(r'[\s\-\(\)]', '', mobile)
+
+    if mobile.startswith('+94') and len(mobile) == 12:
+        return mobile, 'unchanged'
+
+    mobile = re.sub(r'^\+94', '', mobile)
+    mobile = re.sub(r'^0094', '', mobile)
+    mobile = re.sub(r'^94', '', mobile)
+
+    if mobile.startswith('0'):
+        mobile = mobile[1:]
+
+    if not mobile or not mobile.isdigit():
+        return mobile, 'invalid_format'
+
+    if len(mobile) == 9:
+        return f"+94{mobile}", 'converted'
+    return mobile, 'invalid_length'
+
+
+def email_key(email):
+    """Comparison key for an email as V2's case-insensitive unique index sees it"""
+    if email is None:
+        return None
+    return str(email).rstrip().lower()
@@ -0,0 +1,138 @@
+import glob
+import json
+import os
+import time
+from datetime import datetime
+from colorama import init, Fore
+
+init(autoreset=True)
+
+class V2Snapshot:
+    """Copy of the V2 rows a run may destroy, kept in <table>__snap_<id> tables next to the originals.
+
+    Each table is copied with CREATE TABLE ... LIKE plus INSERT ... SELECT in key
+    range chunks, either whole or only the key range an upsert can touch. The
+    snapshot is described by a JSON file in SNAPSHOT_DIR so it can be restored
+    later: the scoped range is deleted and the copied rows are put back, again
+    in chunks.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = None
+        if os.path.exists(path):
+            with open(path) as f:
+                self.meta = json.load(f)
+
+    @classmethod
+    def create(cls, conn, config, scopes, logger, snapshot_id=None):
+        """Snapshot tables; scopes is a list of (table, key column, [low, high] or None for the whole table)"""
+        snapshot_id = snapshot_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        os.makedirs(config.SNAPSHOT_DIR, exist_ok=True)
+        snapshot = cls(os.path.join(config.SNAPSHOT_DIR, f"snapshot_{snapshot_id}.json"))
+        snapshot.meta = {
+            'snapshot_id': snapshot_id,
+            'database': config.V2_DATABASE,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'restored_at': None,
+            'tables': []
+        }
+
+        cursor = conn.cursor()
+        try:
+            for table, key, key_range in scopes:
+                snapshot_table = f"{table}__snap_{snapshot_id}"
+                cursor.execute(f"CREATE TABLE {snapshot_table} LIKE {table}")
+                rows = 0
+                for low, high in cls._chunks(cursor, table, key, key_range, config.SNAPSHOT_CHUNK_SIZE):
+                    cursor.execute(f"INSERT INTO {snapshot_table} SELECT * FROM {table} WHERE `{key}` BETWEEN %s AND %s",
+                                   (low, high))
+                    rows += cursor.rowcount
+                    conn.commit()
+                snapshot.meta['tables'].append({
+                    'table': table,
+                    'snapshot_table': snapshot_table,
+                    'key': key,
+                    'range': key_range,
+                    'rows': rows
+                })
+                scope = f"{key} {key_range[0]}-{key_range[1]}" if key_range else 'all rows'
+                print(f"{Fore.GREEN}✓ Snapshot of {table} ({scope}): {rows} rows in {snapshot_table}")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        snapshot._save()
+        logger.info(f"V2 snapshot {snapshot_id} created: {snapshot.path}")
+        return snapshot
+
+    @classmethod
+    def list_snapshots(cls, config):
+        """All snapshots, newest first"""
+        paths = sorted(glob.glob(os.path.join(config.SNAPSHOT_DIR, 'snapshot_*.json')), reverse=True)
+        return [cls(path) for path in paths]
+
+    @staticmethod
+    def _chunks(cursor, table, key, key_range, chunk_size):
+        """[low, high] key ranges covering the scope (the table's current key range when unscoped)"""
+        if key_range is None:
+            cursor.execute(f"SELECT MIN(`{key}`), MAX(`{key}`) FROM {table}")
+            key_range = cursor.fetchone()
+            if key_range[0] is None:
+                return []
+        low, high = key_range
+        return [(start, min(start + chunk_size - 1, high)) for start in range(low, high + 1, chunk_size)]
+
+    def _save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    @property
+    def snapshot_id(self):
+        return self.meta['snapshot_id'] if self.meta else None
+
+    def restore(self, conn, config):
+        """Put the snapshot rows back: clear each scope (children first), then copy the rows back (parents first)"""
+        cursor = conn.cursor()
+        chunk_size = config.SNAPSHOT_CHUNK_SIZE
+        try:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            for entry in self.meta['tables']:
+                if entry['range'] is None:
+                    cursor.execute(f"TRUNCATE TABLE {entry['table']}")
+                    continue
+                for low, high in self._chunks(cursor, entry['table'], entry['key'], entry['range'], chunk_size):
+                    cursor.execute(f"DELETE FROM {entry['table']} WHERE `{entry['key']}` BETWEEN %s AND %s", (low, high))
+                    conn.commit()
+                    time.sleep(config.ROLLBACK_THROTTLE_SECONDS)
+
+            for entry in reversed(self.meta['tables']):
+                restored = 0
+                for low, high in self._chunks(cursor, entry['snapshot_table'], entry['key'], entry['range'], chunk_size):
+                    cursor.execute(f"INSERT INTO {entry['table']} SELECT * FROM {entry['snapshot_table']} "
+                                   f"WHERE `{entry['key']}` BETWEEN %s AND %s", (low, high))
+                    restored += cursor.rowcount
+                    conn.commit()
+                print(f"{Fore.GREEN}✓ Restored {restored} rows into {entry['table']}")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+            cursor.close()
+
+        self.meta['restored_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._save()
+
+    def drop(self, conn):
+        """Drop the snapshot tables and forget the snapshot"""
+        cursor = conn.cursor()
+        try:
+            for entry in self.meta['tables']:
+                cursor.execute(f"DROP TABLE IF EXISTS {entry['snapshot_table']}")
+        finally:
+            cursor.close()
+        os.remove(self.path)
+        print(f"{Fore.GREEN}✓ Snapshot {self.snapshot_id} dropped")
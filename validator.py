@@ -1,9 +1,32 @@
 import mysql.connector
 from colorama import init, Fore
 import logging
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from migration import MagiyaMigration
 
 init(autoreset=True)
 
+# Per-row fingerprint of the migrated user columns. The V2 side is rendered in
+# SQL and the V1 side in Python (after transform_user_record); both must produce
+# the same string. NULLs become \N so that CONCAT_WS does not drop them.
+NULL_MARKER = '\\N'
+V2_ROW_FINGERPRINT_SQL = r"""
+    CONCAT_WS('#',
+        COALESCE(name, '\\N'),
+        COALESCE(email, '\\N'),
+        COALESCE(mobile, '\\N'),
+        COALESCE(gender, '\\N'),
+        COALESCE(address, '\\N'),
+        CAST(ROUND(COALESCE(balance, 0) * 100) AS SIGNED),
+        COALESCE(status, '\\N'),
+        IF(email_verified_at IS NULL, 0, 1)
+    )
+"""
+V2_ROW_HASH_SQL = f"CAST(CONV(LEFT(MD5({V2_ROW_FINGERPRINT_SQL}), 16), 16, 10) AS UNSIGNED)"
+
 class MigrationValidator:
     def __init__(self, config):
         self.config = config
@@ -17,15 +40,24 @@ class MigrationValidator:
             v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
             v2_conn = mysql.connector.connect(**self.config.V2_CONFIG)
             
-            v1_cursor = v1_conn.cursor(dictionary=True)
-            v2_cursor = v2_conn.cursor(dictionary=True)
-            
-            # 1. Record count validation
-            v1_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V1_TABLE}")
-            v1_count = v1_cursor.fetchone()['count']
+            # 1-2. Record counts and integrity aggregates: one scan per server, run concurrently
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                v1_future = executor.submit(self._fetch_aggregates, self.config.V1_CONFIG, f"""
+                    SELECT COUNT(*) as count,
+                           COALESCE(SUM(CASE WHEN ev = 1 THEN 1 ELSE 0 END), 0) as verified
+                    FROM {self.config.V1_TABLE}
+                """)
+                v2_future = executor.submit(self._fetch_aggregates, self.config.V2_CONFIG, f"""
+                    SELECT COUNT(*) as count,
+                           COALESCE(SUM(CASE WHEN email_verified_at IS NOT NULL THEN 1 ELSE 0 END), 0) as verified,
+                           COALESCE(SUM(CASE WHEN name IS NULL OR name = '' THEN 1 ELSE 0 END), 0) as empty_names,
+                           COALESCE(SUM(CASE WHEN LENGTH(mobile) = 13 THEN 1 ELSE 0 END), 0) as max_length_mobiles
+                    FROM {self.config.V2_TABLE}
+                """)
+                v1_stats = v1_future.result()
+                v2_stats = v2_future.result()
             
-            v2_cursor.execute(f"SELECT COUNT(*) as count FROM {self.config.V2_TABLE}")
-            v2_count = v2_cursor.fetchone()['count']
+            v1_count, v2_count = v1_stats['count'], v2_stats['count']
             
             print(f"\n{Fore.CYAN}Record Count Validation:")
             print(f"  V1 records: {v1_count}")
@@ -41,19 +73,7 @@ class MigrationValidator:
             print(f"\n{Fore.CYAN}Data Integrity Checks:")
             
             # Check email verified conversion
-            v1_cursor.execute(f"""
-                SELECT COUNT(*) as count 
-                FROM {self.config.V1_TABLE} 
-                WHERE ev = 1
-            """)
-            v1_verified = v1_cursor.fetchone()['count']
-            
-            v2_cursor.execute(f"""
-                SELECT COUNT(*) as count 
-                FROM {self.config.V2_TABLE} 
-                WHERE email_verified_at IS NOT NULL
-            """)
-            v2_verified = v2_cursor.fetchone()['count']
+            v1_verified, v2_verified = int(v1_stats['verified']), int(v2_stats['verified'])
             
             print(f"  Email verified - V1: {v1_verified}, V2: {v2_verified}")
             if v1_verified == v2_verified:
@@ -61,6 +81,9 @@ class MigrationValidator:
             else:
                 print(f"  {Fore.RED}✗ Email verification mismatch!")
             
+            v1_cursor = v1_conn.cursor(dictionary=True)
+            v2_cursor = v2_conn.cursor(dictionary=True)
+            
             # 3. Sample data comparison
             print(f"\n{Fore.CYAN}Sample Data Comparison:")
             
@@ -103,22 +126,10 @@ class MigrationValidator:
             print(f"\n{Fore.CYAN}Data Quality Checks:")
             
             # Empty names in V2
-            v2_cursor.execute(f"""
-                SELECT COUNT(*) as count 
-                FROM {self.config.V2_TABLE} 
-                WHERE name IS NULL OR name = ''
-            """)
-            empty_names = v2_cursor.fetchone()['count']
-            print(f"  Empty names in V2: {empty_names}")
+            print(f"  Empty names in V2: {int(v2_stats['empty_names'])}")
             
             # Truncated mobiles
-            v2_cursor.execute(f"""
-                SELECT COUNT(*) as count 
-                FROM {self.config.V2_TABLE} 
-                WHERE LENGTH(mobile) = 13
-            """)
-            max_length_mobiles = v2_cursor.fetchone()['count']
-            print(f"  Mobile numbers at max length (possibly truncated): {max_length_mobiles}")
+            print(f"  Mobile numbers at max length (possibly truncated): {int(v2_stats['max_length_mobiles'])}")
             
             v1_cursor.close()
             v2_cursor.close()
@@ -129,4 +140,224 @@ class MigrationValidator:
             
         except Exception as e:
             self.logger.error(f"Validation failed: {e}")
-            print(f"{Fore.RED}✗ Validation failed: {e}")
\ No newline at end of file
+            print(f"{Fore.RED}✗ Validation failed: {e}")
+    
+    def _fetch_aggregates(self, db_config, query):
+        """Run a single aggregate query on its own connection (safe to call from a worker thread)"""
+        conn = mysql.connector.connect(**db_config)
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query)
+            result = cursor.fetchone()
+            cursor.close()
+            return result
+        finally:
+            conn.close()
+    
+    def _v1_row_fingerprint(self, transformed):
+        """Python rendering of V2_ROW_FINGERPRINT_SQL for a transformed V1 record"""
+        def text(value):
+            return NULL_MARKER if value is None else str(value)
+        
+        parts = [
+            text(transformed['name']),
+            text(transformed['email']),
+            text(transformed['mobile']),
+            text(transformed['gender']),
+            text(transformed['address']),
+            str(int(round((transformed['balance'] or 0) * 100))),
+            text(transformed['status']),
+            '0' if transformed['email_verified_at'] is None else '1'
+        ]
+        return '#'.join(parts)
+    
+    @staticmethod
+    def _row_hash(fingerprint):
+        """64-bit row hash matching V2_ROW_HASH_SQL"""
+        return int(hashlib.md5(fingerprint.encode('utf-8')).hexdigest()[:16], 16)
+    
+    def _v1_chunk_checksums(self, v1_conn, transformer, chunk_size):
+        """Stream V1 users by keyset, transform them and fold row hashes per id chunk"""
+        chunks = {}
+        v1_cursor = v1_conn.cursor(dictionary=True)
+        last_id = 0
+        
+        try:
+            while True:
+                v1_cursor.execute(f"""
+                    SELECT * FROM {self.config.V1_TABLE}
+                    WHERE id > %s AND {transformer.source_filter('users')}
+                    ORDER BY id
+                    LIMIT {self.config.BATCH_SIZE}
+                """, (last_id,))
+                records = v1_cursor.fetchall()
+                if not records:
+                    break
+                
+                for record in records:
+                    if record.get('status') == 0:
+                        continue
+                    row_hash = self._row_hash(self._v1_row_fingerprint(transformer.transform_user_record(record)))
+                    count, checksum = chunks.get(record['id'] // chunk_size, (0, 0))
+                    chunks[record['id'] // chunk_size] = (count + 1, checksum ^ row_hash)
+                
+                last_id = records[-1]['id']
+        finally:
+            v1_cursor.close()
+        
+        return chunks
+    
+    def _v2_chunk_checksums(self, v2_conn, chunk_size):
+        """Compute per-chunk row counts and XOR-folded row hashes in a single V2 scan"""
+        v2_cursor = v2_conn.cursor()
+        try:
+            v2_cursor.execute(f"""
+                SELECT FLOOR(v1_id / %s) as chunk, COUNT(*) as count, BIT_XOR({V2_ROW_HASH_SQL}) as checksum
+                FROM {self.config.V2_TABLE}
+                WHERE v1_id IS NOT NULL
+                GROUP BY chunk
+            """, (chunk_size,))
+            return {int(chunk): (count, int(checksum)) for chunk, count, checksum in v2_cursor.fetchall()}
+        finally:
+            v2_cursor.close()
+    
+    def _compare_chunk_rows(self, v1_conn, v2_conn, transformer, lower_id, upper_id):
+        """Row-level comparison of one mismatching id chunk"""
+        v1_cursor = v1_conn.cursor(dictionary=True)
+        v2_cursor = v2_conn.cursor()
+        
+        try:
+            v1_cursor.execute(f"""
+                SELECT * FROM {self.config.V1_TABLE}
+                WHERE id >= %s AND id < %s AND {transformer.source_filter('users')}
+            """, (lower_id, upper_id))
+            v1_hashes = {
+                record['id']: self._row_hash(self._v1_row_fingerprint(transformer.transform_user_record(record)))
+                for record in v1_cursor.fetchall() if record.get('status') != 0
+            }
+            
+            v2_cursor.execute(f"""
+                SELECT v1_id, {V2_ROW_HASH_SQL}
+                FROM {self.config.V2_TABLE}
+                WHERE v1_id >= %s AND v1_id < %s
+            """, (lower_id, upper_id))
+            v2_hashes = {v1_id: int(row_hash) for v1_id, row_hash in v2_cursor.fetchall()}
+        finally:
+            v1_cursor.close()
+            v2_cursor.close()
+        
+        return {
+            'missing_in_v2': sorted(set(v1_hashes) - set(v2_hashes)),
+            'extra_in_v2': sorted(set(v2_hashes) - set(v1_hashes)),
+            'different': sorted(i for i in set(v1_hashes) & set(v2_hashes) if v1_hashes[i] != v2_hashes[i])
+        }
+    
+    def checksum_reconcile(self, chunk_size=None):
+        """Reconcile V1 and V2 users with per-chunk checksums, drilling down only into mismatching chunks"""
+        chunk_size = chunk_size or self.config.CHECKSUM_CHUNK_SIZE
+        print(f"\n{Fore.CYAN}Running checksum reconciliation (chunk size: {chunk_size})...")
+        
+        v1_conn = v2_conn = transformer = None
+        try:
+            v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+            v2_conn = mysql.connector.connect(**self.config.V2_CONFIG)
+            
+            transformer = MagiyaMigration(self.config)
+            transformer.preserve_ids = True
+            
+            v1_chunks = self._v1_chunk_checksums(v1_conn, transformer, chunk_size)
+            v2_chunks = self._v2_chunk_checksums(v2_conn, chunk_size)
+            
+            all_chunks = sorted(set(v1_chunks) | set(v2_chunks))
+            mismatched = [chunk for chunk in all_chunks if v1_chunks.get(chunk) != v2_chunks.get(chunk)]
+            
+            print(f"\n{Fore.CYAN}Checksum Summary:")
+            print(f"  Chunks compared: {len(all_chunks)}")
+            print(f"  V1 rows (status != 0): {sum(count for count, _ in v1_chunks.values())}")
+            print(f"  V2 rows with v1_id: {sum(count for count, _ in v2_chunks.values())}")
+            
+            if not mismatched:
+                print(f"  {Fore.GREEN}✓ All chunk checksums match!")
+            else:
+                print(f"  {Fore.RED}✗ {len(mismatched)} chunk(s) differ, drilling down...")
+            
+            differences = {}
+            for chunk in mismatched:
+                lower_id, upper_id = chunk * chunk_size, (chunk + 1) * chunk_size
+                result = self._compare_chunk_rows(v1_conn, v2_conn, transformer, lower_id, upper_id)
+                differences[f"{lower_id}-{upper_id - 1}"] = result
+                print(f"\n  IDs {lower_id}-{upper_id - 1}:")
+                print(f"    Missing in V2: {len(result['missing_in_v2'])}")
+                print(f"    Extra in V2: {len(result['extra_in_v2'])}")
+                print(f"    Different: {len(result['different'])}")
+            
+            if differences:
+                report_file = f"logs/checksum_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+                with open(report_file, 'w') as f:
+                    json.dump({'chunk_size': chunk_size, 'differences': differences}, f, indent=2)
+                print(f"\n{Fore.YELLOW}Checksum differences saved to: {report_file}")
+            
+            print(f"\n{Fore.GREEN}✓ Checksum reconciliation completed!")
+            return not differences
+            
+        except Exception as e:
+            self.logger.error(f"Checksum reconciliation failed: {e}")
+            print(f"{Fore.RED}✗ Checksum reconciliation failed: {e}")
+            return False
+        finally:
+            for conn in (v1_conn, v2_conn):
+                if conn and conn.is_connected():
+                    conn.close()
+            if transformer:
+                # Also closes the transformer's run log file
+                transformer.close_connections()
+    
+    def validate_run(self, manifest):
+        """Row-level check of only the V1 id ranges a run covered, using indexed range queries"""
+        print(f"\n{Fore.CYAN}Validating run {manifest.run_id}...")
+        
+        v1_conn = v2_conn = transformer = None
+        try:
+            v1_conn = mysql.connector.connect(**self.config.V1_CONFIG)
+            v2_conn = mysql.connector.connect(**self.config.V2_CONFIG)
+            
+            transformer = MagiyaMigration(self.config)
+            transformer.preserve_ids = True
+            
+            # Merge consecutive batch ranges into chunks of at most CHECKSUM_CHUNK_SIZE ids
+            ranges = []
+            for start, end in sorted(manifest.v1_ranges('users')):
+                if ranges and start - ranges[-1][0] < self.config.CHECKSUM_CHUNK_SIZE and end - ranges[-1][0] < self.config.CHECKSUM_CHUNK_SIZE:
+                    ranges[-1][1] = max(ranges[-1][1], end)
+                else:
+                    ranges.append([start, end])
+            
+            totals = {'missing_in_v2': 0, 'extra_in_v2': 0, 'different': 0}
+            for start, end in ranges:
+                result = self._compare_chunk_rows(v1_conn, v2_conn, transformer, start, end + 1)
+                for key in totals:
+                    totals[key] += len(result[key])
+            
+            print(f"  V1 id ranges checked: {len(ranges)}")
+            print(f"  Rows inserted by run: {manifest.inserted_count('users')}")
+            print(f"  Missing in V2: {totals['missing_in_v2']}")
+            print(f"  Extra in V2: {totals['extra_in_v2']}")
+            print(f"  Different: {totals['different']}")
+            
+            if not any(totals.values()):
+                print(f"  {Fore.GREEN}✓ All rows covered by the run match!")
+            else:
+                print(f"  {Fore.RED}✗ Run has mismatches (failed records are listed in the migration report)")
+            return not any(totals.values())
+            
+        except Exception as e:
+            self.logger.error(f"Run validation failed: {e}")
+            print(f"{Fore.RED}✗ Run validation failed: {e}")
+            return False
+        finally:
+            for conn in (v1_conn, v2_conn):
+                if conn and conn.is_connected():
+                    conn.close()
+            if transformer:
+                # Also closes the transformer's run log file
+                transformer.close_connections()